@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, Index, inspect, text
 from sqlalchemy.sql import func
 from app.database import Base, engine
 
@@ -12,6 +12,7 @@ class Product(Base):
     price = Column(Float, nullable=False)
     current_stock = Column(Integer, default=0)
     min_stock_threshold = Column(Integer, default=10)
+    lead_time_days = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class SalesData(Base):
@@ -55,8 +56,34 @@ class Forecast(Base):
     confidence_interval_lower = Column(Float, nullable=True)
     confidence_interval_upper = Column(Float, nullable=True)
     model_version = Column(String(50), default='prophet_v1')
+    confidence_score = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Latest materialized run per product is looked up by (product_id, created_at);
+    # forecasts for a day being scored against actuals by (product_id, forecast_date)
+    __table_args__ = (
+        Index('ix_forecasts_product_created', 'product_id', 'created_at'),
+        Index('ix_forecasts_product_date', 'product_id', 'forecast_date'),
+    )
 
 async def create_tables():
     """Create all database tables"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def _add_missing_columns():
+    """Add columns and indexes introduced after a table was first created"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        with engine.begin() as connection:
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Union
 from enum import Enum
 
 class AlertType(str, Enum):
@@ -49,6 +49,38 @@ class ImageUploadResponse(BaseModel):
 class ForecastRequest(BaseModel):
     product_id: int
     days_ahead: int = Field(default=7, ge=1, le=30)
+    engine: Optional[str] = Field(default=None, pattern="^(prophet|statistical|auto)$")
+    tiered: bool = False
+    deadline_ms: Optional[int] = Field(default=None, ge=0, le=600000)
+
+class BulkForecastRequest(BaseModel):
+    product_ids: Optional[List[int]] = Field(default=None, min_length=1)
+    category: Optional[str] = None
+    all_products: bool = False
+    days_ahead: int = Field(default=7, ge=1, le=30)
+    engine: Optional[str] = Field(default=None, pattern="^(prophet|statistical|auto)$")
+    format: Optional[str] = Field(default=None, pattern="^(points|columnar)$")
+
+class HierarchicalForecastRequest(BaseModel):
+    product_ids: Optional[List[int]] = Field(default=None, min_length=1)
+    category: Optional[str] = None
+    days_ahead: int = Field(default=7, ge=1, le=30)
+    engine: Optional[str] = Field(default=None, pattern="^(prophet|statistical|auto)$")
+
+class TuningRequest(BaseModel):
+    product_ids: Optional[List[int]] = Field(default=None, min_length=1)
+    category: Optional[str] = None
+    scope: str = Field(default="product", pattern="^(product|category)$")
+    grid: Optional[Dict[str, List[Union[float, str]]]] = None
+    run_id: Optional[str] = Field(default=None, pattern="^[A-Za-z0-9_-]{1,64}$")
+
+class ActualDemand(BaseModel):
+    product_id: int
+    date: datetime
+    quantity_sold: float = Field(ge=0)
+
+class ActualsRequest(BaseModel):
+    actuals: List[ActualDemand] = Field(min_length=1, max_length=10000)
 
 class ForecastPoint(BaseModel):
     date: datetime
@@ -63,6 +95,10 @@ class ForecastResponse(BaseModel):
     forecast_points: List[ForecastPoint]
     total_predicted_demand: float
     confidence_score: float
+    provisional: bool = False
+    job_id: Optional[str] = None
+    method: Optional[str] = None
+    fallback: Optional[str] = None
 
 # Alert schemas
 class AlertCreate(BaseModel):
@@ -87,6 +123,7 @@ class Alert(BaseModel):
 class AnomalyDetectionRequest(BaseModel):
     product_id: Optional[int] = None
     days_to_analyze: int = Field(default=30, ge=7, le=90)
+    refit: bool = False  # Fit new detectors instead of scoring with the stored ones
 
 class AnomalyPoint(BaseModel):
     date: datetime
@@ -101,6 +138,39 @@ class AnomalyDetectionResponse(BaseModel):
     anomaly_points: List[AnomalyPoint]
     analysis_period: str
 
+class AnomalyDetectionBatchResponse(BaseModel):
+    results: List[AnomalyDetectionResponse]
+    total_products_analyzed: int
+    total_anomalies: int
+
+class FleetScanRequest(BaseModel):
+    product_ids: Optional[List[int]] = Field(default=None, min_length=1)
+    category: Optional[str] = None
+    days_to_analyze: int = Field(default=30, ge=7, le=90)
+    level: str = Field(default="product", pattern="^(product|store)$")
+    contamination: float = Field(default=0.02, gt=0, le=0.5)
+    refit: bool = False  # Fit a new global detector instead of scoring with the stored one
+    include_normal: bool = False  # Also return non-anomalous points of flagged series
+
+class FleetSeriesAnomalies(BaseModel):
+    product_id: int
+    store_id: Optional[str] = None
+    anomalies_detected: int
+    max_anomaly_score: float
+    anomaly_points: List[AnomalyPoint]
+
+class FleetScanResponse(BaseModel):
+    level: str
+    series_scanned: int
+    series_skipped: int
+    rows_scored: int
+    anomalies_detected: int
+    results: List[FleetSeriesAnomalies]
+    detector: Optional[Dict[str, Any]] = None
+    analysis_period: Optional[str] = None
+    seconds: float
+    feature_seconds: Optional[float] = None
+
 # Inventory schemas
 class InventoryStatus(BaseModel):
     product_id: int
@@ -126,6 +196,15 @@ class SalesDataPoint(BaseModel):
     revenue: float
     store_id: str
 
+class SalesRecord(SalesDataPoint):
+    product_id: int
+    quantity_sold: int = Field(ge=0)
+    revenue: float = 0.0
+    store_id: str = "store_1"
+
+class SalesIngestRequest(BaseModel):
+    records: List[SalesRecord] = Field(min_length=1, max_length=10000)
+
 class HealthCheck(BaseModel):
     status: str
     message: str
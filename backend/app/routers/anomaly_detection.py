@@ -1,54 +1,93 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Optional, List, Union
 from datetime import datetime, timedelta
+import asyncio
+import json
 
 from app.models.schemas import (
     AnomalyDetectionRequest,
+    AnomalyDetectionBatchResponse,
     AnomalyDetectionResponse,
     AnomalyPoint,
+    FleetScanRequest,
+    FleetScanResponse,
     Alert,
     AlertCreate
 )
 from app.services.anomaly_detection import anomaly_service
+from app.services.catalog import list_products
+from app.services.fleet_anomaly import fleet_scanner
+from app.services.online_anomaly import online_anomaly_detector
+from app.services.sales_store import sales_store
+from app.services.worker_pool import PoolSaturatedError
+from app.utils.columnar import anomaly_columns, columnar_response, wants_columnar
 
 router = APIRouter()
 
-@router.post("/detect", response_model=AnomalyDetectionResponse)
-async def detect_anomalies(request: AnomalyDetectionRequest):
+SSE_KEEPALIVE_SECONDS = 15
+
+@router.post("/detect", response_model=Union[AnomalyDetectionResponse, AnomalyDetectionBatchResponse])
+async def detect_anomalies(
+    request: AnomalyDetectionRequest,
+    format: Optional[str] = Query(default=None, pattern="^(points|columnar)$", description="Response layout"),
+    accept: Optional[str] = Header(default=None)
+):
     """
     Detect anomalies in sales data for a specific product
     
     - Uses Isolation Forest for anomaly detection
     - Analyzes patterns in sales data to identify unusual behavior
     - Can detect theft, data errors, or unusual demand patterns
+    - Each product's stored detector scores the window; it is refitted only
+      when older than ANOMALY_REFIT_INTERVAL_SECONDS, when the new points
+      drift from its training data, or when `refit` is set
+    - Without `product_id` the five demo products are analysed, up to
+      ANOMALY_MAX_PARALLEL at a time; use `/fleet-scan` to scan the whole catalog
+    - `format=columnar` (or `Accept: application/vnd.walmartiq.columnar+json`)
+      returns parallel `columns` arrays instead of `anomaly_points`
     """
     try:
-        # Get product ID, default to analyzing all products if not specified
+        columnar = wants_columnar(format, accept)
+
+        # Get product ID, default to analyzing the demo products if not specified;
+        # catalog-wide scans go through /fleet-scan, which streams in batches
         if request.product_id:
             product_ids = [request.product_id]
         else:
-            # In a real app, fetch all product IDs from database
             product_ids = [1, 2, 3, 4, 5]  # Demo products
         
+        async def load_sales(product_id: int):
+            # Recorded daily sales, or mock sales data for demo
+            sales_data = await sales_store.get_series(product_id, days_back=request.days_to_analyze)
+            if sales_data is None:
+                sales_data = generate_mock_sales_data_with_anomalies(product_id, request.days_to_analyze)
+            return sales_data
+        
+        # Detect anomalies, several products at a time
+        anomaly_results = await anomaly_service.detect_many(
+            product_ids,
+            load_sales,
+            contamination=0.1,  # Expect 10% anomalies
+            refit=request.refit
+        )
+        
         results = []
         
-        for product_id in product_ids:
-            # Generate mock sales data for demo
-            sales_data = generate_mock_sales_data_with_anomalies(
-                product_id, 
-                request.days_to_analyze
-            )
-            
-            # Detect anomalies
-            anomaly_result = await anomaly_service.detect_anomalies(
-                product_id=product_id,
-                sales_data=sales_data,
-                contamination=0.1  # Expect 10% anomalies
-            )
-            
+        for product_id, anomaly_result in zip(product_ids, anomaly_results):
             if anomaly_result.get('error'):
                 continue  # Skip products with errors
             
+            if columnar:
+                results.append({
+                    'product_id': product_id,
+                    'product_name': f"Product {product_id}",
+                    'anomalies_detected': anomaly_result.get('anomalies_detected', 0),
+                    'columns': anomaly_columns(anomaly_result),
+                    'analysis_period': anomaly_result.get('analysis_period', '')
+                })
+                continue
+            
             # Convert to response format
             anomaly_points = [
                 AnomalyPoint(**point) for point in anomaly_result.get('anomaly_points', [])
@@ -64,6 +103,15 @@ async def detect_anomalies(request: AnomalyDetectionRequest):
             
             results.append(response)
         
+        if columnar:
+            if request.product_id and results:
+                return columnar_response(results[0])
+            return columnar_response({
+                "results": results,
+                "total_products_analyzed": len(results),
+                "total_anomalies": sum(r['anomalies_detected'] for r in results)
+            })
+        
         # Return single result if specific product requested
         if request.product_id and results:
             return results[0]
@@ -75,20 +123,62 @@ async def detect_anomalies(request: AnomalyDetectionRequest):
             "total_anomalies": sum(r.anomalies_detected for r in results)
         }
         
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/fleet-scan", response_model=FleetScanResponse)
+async def fleet_scan(request: FleetScanRequest):
+    """
+    Scan many products at once with one global Isolation Forest
+    
+    - Features are the `/detect` features, normalized by each series' own
+      sales level so every SKU shares one detector
+    - `level=store` scans each product x store series separately
+    - Scans `product_ids`, a `category`, or the whole catalog, using
+      recorded sales only; series with fewer than 7 days are skipped
+    - The stored global detector is reused until it is due for a refit
+      (or `refit` is set); only series with anomalies are returned
+    """
+    if request.product_ids and request.category:
+        raise HTTPException(status_code=400, detail="Pass either product_ids or category, not both")
+    
+    try:
+        if request.product_ids:
+            product_ids = list(dict.fromkeys(request.product_ids))
+        else:
+            product_ids = [product['id'] for product in await list_products(category=request.category)]
+        
+        return await fleet_scanner.scan(
+            product_ids,
+            days_to_analyze=request.days_to_analyze,
+            level=request.level,
+            contamination=request.contamination,
+            refit=request.refit,
+            include_normal=request.include_normal
+        )
+        
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/product/{product_id}")
 async def get_product_anomalies(
     product_id: int,
-    days_to_analyze: int = Query(default=30, ge=7, le=90)
+    days_to_analyze: int = Query(default=30, ge=7, le=90),
+    refit: bool = Query(default=False, description="Fit a new detector instead of scoring with the stored one"),
+    format: Optional[str] = Query(default=None, pattern="^(points|columnar)$", description="Response layout"),
+    accept: Optional[str] = Header(default=None)
 ):
     """Get anomaly detection results for a specific product"""
     request = AnomalyDetectionRequest(
         product_id=product_id,
-        days_to_analyze=days_to_analyze
+        days_to_analyze=days_to_analyze,
+        refit=refit
     )
-    return await detect_anomalies(request)
+    return await detect_anomalies(request, format, accept)
 
 @router.get("/alerts")
 async def get_anomaly_alerts(
@@ -215,6 +305,68 @@ async def get_anomaly_patterns(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/events")
+async def stream_anomaly_events(
+    product_id: Optional[int] = Query(default=None, description="Only events for this product"),
+    last_event_id: Optional[int] = Header(default=None)
+):
+    """
+    Server-sent events from the online anomaly detector
+    
+    Sales ingested through the sales store are scored as they arrive, so a
+    `demand_spike` event is sent as soon as a day's running total is far
+    above its baseline and a `sudden_drop` once a day closes far below it.
+    Events retained since `Last-Event-ID` are replayed on reconnect;
+    `: keep-alive` comments are sent while there is nothing new.
+    """
+    return StreamingResponse(
+        _stream_anomaly_events(product_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _stream_anomaly_events(product_id: Optional[int], last_event_id: Optional[int]) -> AsyncIterator[str]:
+    # Subscribe before replaying so nothing emitted in between is missed
+    queue = online_anomaly_detector.subscribe()
+    try:
+        sent = last_event_id or 0
+        if last_event_id is not None:
+            for event in online_anomaly_detector.recent_events(last_event_id, product_id):
+                sent = event['id']
+                yield _sse(event)
+        
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event['id'] > sent and (product_id is None or event['product_id'] == product_id):
+                sent = event['id']
+                yield _sse(event)
+    finally:
+        online_anomaly_detector.unsubscribe(queue)
+
+def _sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@router.get("/online/{product_id}")
+async def get_online_baseline(product_id: int):
+    """Current online baseline of a product and its retained anomaly events"""
+    baseline = online_anomaly_detector.get_baseline(product_id)
+    if baseline is None:
+        raise HTTPException(status_code=404, detail="No sales ingested for this product yet")
+    return {**baseline, 'recent_events': online_anomaly_detector.recent_events(product_id=product_id)}
+
+@router.get("/stats")
+async def get_anomaly_stats():
+    """Get runtime statistics for the anomaly detection service"""
+    return {
+        **anomaly_service.get_stats(),
+        'online': online_anomaly_detector.get_stats(),
+        'fleet': fleet_scanner.get_stats()
+    }
+
 def generate_mock_sales_data_with_anomalies(product_id: int, days_back: int) -> List[dict]:
     """Generate mock sales data with intentional anomalies for demo"""
     import random
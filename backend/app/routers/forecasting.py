@@ -1,39 +1,95 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Union
+from datetime import date, datetime
+import asyncio
+import json
+import time
+
+import numpy as np
 
 from app.models.schemas import (
+    ActualsRequest,
+    BulkForecastRequest,
     ForecastRequest, 
+    HierarchicalForecastRequest,
     ForecastResponse, 
+    TuningRequest,
     ForecastPoint
 )
-from app.services.forecasting import forecasting_service
+from app.services.catalog import (
+    aiter_products,
+    count_products,
+    get_product_category,
+    list_products,
+    load_sales_series
+)
+from app.services.accuracy import accuracy_tracker
+from app.services.bulk_forecasting import iter_bulk_forecasts, product_engine
+from app.services.forecast_jobs import forecast_jobs
+from app.services.forecast_materializer import forecast_materializer
+from app.services.forecasting import forecasting_service, forecast_pool, resolve_deadline
+from app.services.hierarchical_forecasting import hierarchical_forecaster
+from app.services.model_selection import model_selector
+from app.services.model_store import model_store
+from app.services.restock import URGENCY_LEVELS, restock_engine
+from app.services.sales_store import sales_store
+from app.services.tuning import expand_grid, forecast_tuner, new_run_id
+from app.services.worker_pool import PoolSaturatedError
+from app.utils.columnar import (
+    columnar_response,
+    forecast_columns,
+    forecast_payload,
+    forecast_points as result_forecast_points,
+    wants_columnar
+)
 
 router = APIRouter()
 
+SSE_KEEPALIVE_SECONDS = 15
+
 @router.post("/generate", response_model=ForecastResponse)
-async def generate_forecast(request: ForecastRequest):
+async def generate_forecast(
+    request: ForecastRequest,
+    format: Optional[str] = Query(default=None, pattern="^(points|columnar)$", description="Response layout"),
+    accept: Optional[str] = Header(default=None)
+):
     """
     Generate demand forecast for a specific product
     
     - Uses Facebook Prophet for time series forecasting
     - Requires at least 14 days of historical data for best results
     - Falls back to simple moving average for limited data
+    - `engine="statistical"` selects the vectorized Holt-Winters/Croston engine,
+      `engine="auto"` the cheapest adequate model for the series within
+      FORECAST_AUTO_CPU_BUDGET_MS; when omitted the category or server default applies
+    - `format=columnar` (or `Accept: application/vnd.walmartiq.columnar+json`)
+      returns parallel `columns` arrays instead of `forecast_points`
+    - `tiered=true` answers at once: the Prophet forecast if it is ready within
+      FORECAST_TIERED_WAIT_MS, otherwise a moving-average forecast marked
+      `provisional` with a `job_id`; poll `/jobs/{job_id}` or stream
+      `/jobs/{job_id}/events` for the Prophet result (the job fails instead if
+      Prophet can only fall back to the moving average)
+    - `deadline_ms` bounds the Prophet path (default FORECAST_DEADLINE_MS, 0 = none);
+      past it the moving-average forecast is returned with `fallback="deadline"`.
+      `method` says which model produced the forecast
     """
     try:
-        # In a real app, fetch sales data from database
-        # For demo, generate mock historical data
-        sales_data = generate_mock_sales_data(
-            request.product_id, 
-            days_back=30
-        )
+        # Fetch sales history (demo data when the database has none)
+        sales_data = await load_sales_series(request.product_id)
         
         # Generate forecast
-        forecast_result = await forecasting_service.generate_forecast(
-            product_id=request.product_id,
-            sales_data=sales_data,
-            days_ahead=request.days_ahead
-        )
+        engine = await product_engine(request.product_id, request.engine)
+        if request.tiered and engine == 'prophet':
+            forecast_result = await forecast_jobs.forecast(request.product_id, sales_data, request.days_ahead)
+        else:
+            forecast_result = await forecasting_service.generate_forecast(
+                product_id=request.product_id,
+                sales_data=sales_data,
+                days_ahead=request.days_ahead,
+                engine=engine,
+                deadline=resolve_deadline(request.deadline_ms)
+            )
         
         if forecast_result.get('error'):
             raise HTTPException(
@@ -41,9 +97,23 @@ async def generate_forecast(request: ForecastRequest):
                 detail=f"Forecasting failed: {forecast_result['error']}"
             )
         
+        if wants_columnar(format, accept):
+            return columnar_response({
+                'product_id': request.product_id,
+                'product_name': f"Product {request.product_id}",
+                'model_version': forecast_result['model_version'],
+                'columns': forecast_columns(forecast_result),
+                'total_predicted_demand': forecast_result['total_predicted_demand'],
+                'confidence_score': forecast_result['confidence_score'],
+                'provisional': forecast_result.get('provisional', False),
+                'job_id': forecast_result.get('job_id'),
+                'method': forecast_result.get('method'),
+                'fallback': forecast_result.get('fallback')
+            })
+        
         # Convert to response format
         forecast_points = [
-            ForecastPoint(**point) for point in forecast_result['forecast_points']
+            ForecastPoint(**point) for point in result_forecast_points(forecast_result)
         ]
         
         return ForecastResponse(
@@ -52,27 +122,147 @@ async def generate_forecast(request: ForecastRequest):
             model_version=forecast_result['model_version'],
             forecast_points=forecast_points,
             total_predicted_demand=forecast_result['total_predicted_demand'],
-            confidence_score=forecast_result['confidence_score']
+            confidence_score=forecast_result['confidence_score'],
+            provisional=forecast_result.get('provisional', False),
+            job_id=forecast_result.get('job_id'),
+            method=forecast_result.get('method'),
+            fallback=forecast_result.get('fallback')
         )
         
     except HTTPException:
         raise
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs/{job_id}")
+async def get_forecast_job(
+    job_id: str,
+    format: Optional[str] = Query(default=None, pattern="^(points|columnar)$", description="Response layout"),
+    accept: Optional[str] = Header(default=None)
+):
+    """Status of a tiered forecast job, with the Prophet forecast once completed"""
+    job = forecast_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Forecast job not found or expired")
+    return _job_payload(job, wants_columnar(format, accept))
+
+@router.get("/jobs/{job_id}/events")
+async def stream_forecast_job(
+    job_id: str,
+    format: Optional[str] = Query(default=None, pattern="^(points|columnar)$", description="Response layout"),
+    accept: Optional[str] = Header(default=None)
+):
+    """
+    Server-sent events for a tiered forecast job
+    
+    Sends a `status` event right away, `: keep-alive` comments while the fit
+    runs, then one final `forecast` (or `failed`) event and closes.
+    """
+    if forecast_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Forecast job not found or expired")
+    
+    return StreamingResponse(
+        _stream_job_events(job_id, wants_columnar(format, accept)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _stream_job_events(job_id: str, columnar: bool) -> AsyncIterator[str]:
+    job = forecast_jobs.get(job_id)
+    yield _sse('status', {'job_id': job_id, 'status': job['status']})
+    
+    while job is not None and job['completed_at'] is None:
+        job = await forecast_jobs.wait(job_id, timeout=SSE_KEEPALIVE_SECONDS)
+        if job is not None and job['completed_at'] is None:
+            yield ": keep-alive\n\n"
+    
+    if job is None:
+        yield _sse('failed', {'job_id': job_id, 'status': 'expired'})
+    else:
+        yield _sse('forecast' if job['status'] == 'completed' else 'failed', _job_payload(job, columnar))
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+def _job_payload(job: dict, columnar: bool) -> dict:
+    """Public view of a forecast job"""
+    payload = {key: value for key, value in job.items() if key != 'result'}
+    if job['result'] is not None:
+        payload['forecast'] = {**forecast_payload(job['result'], columnar), 'provisional': False}
+    return payload
+
 @router.get("/product/{product_id}", response_model=ForecastResponse)
 async def get_product_forecast(
     product_id: int,
-    days_ahead: int = Query(default=7, ge=1, le=30, description="Days to forecast ahead")
+    days_ahead: int = Query(default=7, ge=1, le=30, description="Days to forecast ahead"),
+    engine: Optional[str] = Query(default=None, pattern="^(prophet|statistical|auto)$", description="Forecasting engine"),
+    format: Optional[str] = Query(default=None, pattern="^(points|columnar)$", description="Response layout"),
+    deadline_ms: Optional[int] = Query(default=None, ge=0, le=600000, description="Compute deadline for a refit"),
+    accept: Optional[str] = Header(default=None)
 ):
-    """Get forecast for a specific product"""
-    request = ForecastRequest(product_id=product_id, days_ahead=days_ahead)
-    return await generate_forecast(request)
+    """
+    Get forecast for a specific product
+    
+    Served from the latest materialized forecast run, starting today; a missing
+    or stale run (older than FORECAST_STALENESS_SECONDS, or no longer covering
+    `days_ahead` days from today) is refit on demand and stored.
+    A refit that misses `deadline_ms` (default FORECAST_DEADLINE_MS) returns the
+    moving average with `fallback="deadline"` and is not stored.
+    `format=columnar` (or the columnar Accept type) returns parallel arrays.
+    """
+    try:
+        forecast_result = await forecast_materializer.get_forecast(
+            product_id, engine, deadline=resolve_deadline(deadline_ms), days_ahead=days_ahead
+        )
+        method = forecast_result.get('method', 'materialized')
+        
+        if forecast_result.get('error'):
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Forecasting failed: {forecast_result['error']}"
+            )
+        
+        if wants_columnar(format, accept):
+            columns = forecast_columns(forecast_result, days_ahead)
+            return columnar_response({
+                'product_id': product_id,
+                'product_name': f"Product {product_id}",
+                'model_version': forecast_result['model_version'],
+                'columns': columns,
+                'total_predicted_demand': round(sum(columns['predicted_demand']), 2),
+                'confidence_score': forecast_result['confidence_score'],
+                'method': method,
+                'fallback': forecast_result.get('fallback')
+            })
+        
+        points = result_forecast_points(forecast_result, days_ahead)
+        forecast_points = [ForecastPoint(**point) for point in points]
+        
+        return ForecastResponse(
+            product_id=product_id,
+            product_name=f"Product {product_id}",  # In real app, fetch from DB
+            model_version=forecast_result['model_version'],
+            forecast_points=forecast_points,
+            total_predicted_demand=round(sum(point['predicted_demand'] for point in points), 2),
+            confidence_score=forecast_result['confidence_score'],
+            method=method,
+            fallback=forecast_result.get('fallback')
+        )
+        
+    except HTTPException:
+        raise
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/multiple-products")
 async def get_multiple_forecasts(
     product_ids: str = Query(..., description="Comma-separated list of product IDs"),
-    days_ahead: int = Query(default=7, ge=1, le=30)
+    days_ahead: int = Query(default=7, ge=1, le=30),
+    deadline_ms: Optional[int] = Query(default=None, ge=0, le=600000, description="Compute deadline per product")
 ):
     """Get forecasts for multiple products"""
     try:
@@ -88,7 +278,9 @@ async def get_multiple_forecasts(
         forecasts = []
         for product_id in product_id_list:
             try:
-                forecast = await get_product_forecast(product_id, days_ahead)
+                forecast = await get_product_forecast(
+                    product_id, days_ahead, engine=None, format=None, deadline_ms=deadline_ms, accept=None
+                )
                 forecasts.append(forecast)
             except Exception as e:
                 # Continue with other products if one fails
@@ -109,6 +301,206 @@ async def get_multiple_forecasts(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/bulk")
+async def bulk_forecast(request: BulkForecastRequest, accept: Optional[str] = Header(default=None)):
+    """
+    Stream forecasts for a product list, a category or the whole catalog
+    
+    - Select products with exactly one of `product_ids`, `category` or `all_products`
+    - Prophet fits are spread across the forecasting worker pool; products on the
+      statistical engine are forecast in vectorized batches
+    - Results are streamed as NDJSON, one line per product as soon as it finishes,
+      followed by a final summary line
+    - Per-product failures are reported inline and do not stop the run
+    - `format="columnar"` (or the columnar Accept type) sends each forecast as
+      parallel `columns` arrays instead of `forecast_points`
+    """
+    selectors = [bool(request.product_ids), bool(request.category), request.all_products]
+    if sum(selectors) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="Specify exactly one of product_ids, category or all_products"
+        )
+    
+    if request.product_ids:
+        products: Union[Iterable[dict], AsyncIterable[dict]] = ({'id': product_id, 'category': None} for product_id in request.product_ids)
+        total = len(request.product_ids)
+    else:
+        products = aiter_products(category=request.category)
+        total = await asyncio.to_thread(count_products, category=request.category)
+    
+    return StreamingResponse(
+        _stream_bulk_forecasts(
+            products, total, request.days_ahead, request.engine, wants_columnar(request.format, accept)
+        ),
+        media_type="application/x-ndjson"
+    )
+
+async def _stream_bulk_forecasts(products: Union[Iterable[dict], AsyncIterable[dict]],
+                                 total: int,
+                                 days_ahead: int,
+                                 engine: Optional[str] = None,
+                                 columnar: bool = False) -> AsyncIterator[str]:
+    """Yield one NDJSON line per product as its forecast finishes, then a summary line"""
+    started = time.perf_counter()
+    completed = 0
+    failed = 0
+    
+    async for line in iter_bulk_forecasts(products, days_ahead, engine):
+        completed += 1
+        if line['status'] != 'ok':
+            failed += 1
+        if 'forecast' in line:
+            line['forecast'] = forecast_payload(line['forecast'], columnar)
+        line['progress'] = {"completed": completed, "total": max(total, completed)}
+        yield json.dumps(line, default=_json_default) + "\n"
+    
+    yield json.dumps({
+        "summary": {
+            "total_products": completed,
+            "successful_forecasts": completed - failed,
+            "failed_forecasts": failed,
+            "elapsed_seconds": round(time.perf_counter() - started, 3)
+        }
+    }) + "\n"
+
+def _json_default(value):
+    """Serialize dates and NumPy scalars in streamed forecast lines"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+@router.post("/hierarchical")
+async def hierarchical_forecast(request: HierarchicalForecastRequest):
+    """
+    Forecast products through the category > store-category > SKU hierarchy
+    
+    - Select products with `product_ids` or a `category` (default: whole catalog)
+    - Models are fitted per category and store-category, not per SKU
+    - SKU forecasts are disaggregated with historical proportions and reconciled
+      so SKUs sum to their store-category and store-categories to their category
+    - Confidence interval bounds are rescaled along with the forecast, so
+      they are approximate; only the point forecasts add up exactly
+    """
+    if request.product_ids and request.category:
+        raise HTTPException(status_code=400, detail="Specify at most one of product_ids or category")
+    
+    try:
+        if request.product_ids:
+            products = [
+                {'id': product_id, 'category': await asyncio.to_thread(get_product_category, product_id)}
+                for product_id in request.product_ids
+            ]
+        else:
+            products = await list_products(category=request.category)
+        
+        if not products:
+            raise HTTPException(status_code=404, detail="No products found")
+        
+        return await hierarchical_forecaster.forecast(products, request.days_ahead, request.engine)
+    
+    except HTTPException:
+        raise
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/materialize")
+async def materialize_forecasts(
+    category: Optional[str] = Query(None, description="Only materialize this category"),
+    engine: Optional[str] = Query(None, pattern="^(prophet|statistical|auto)$", description="Forecasting engine")
+):
+    """
+    Start a forecast materialization run in the background
+    
+    - Forecasts every catalog product (or one category) 30 days ahead
+    - Writes the results to the forecasts table, where GET endpoints read them
+    - Runs automatically every FORECAST_MATERIALIZE_INTERVAL_SECONDS
+    """
+    if forecast_materializer.start_run(category=category, engine=engine) is None:
+        raise HTTPException(status_code=409, detail="A materialization run is already in progress")
+    
+    return {
+        "status": "started",
+        "category": category,
+        "started_at": datetime.now().isoformat()
+    }
+
+@router.get("/materialize/status")
+async def get_materialization_status():
+    """Get the schedule and the summary of the latest materialization run"""
+    return forecast_materializer.get_stats()
+
+@router.post("/tuning")
+async def tune_forecasts(request: TuningRequest):
+    """
+    Start an offline Prophet hyperparameter search in the background
+    
+    - Cross-validates every `grid` combination (rolling origin) for each product,
+      or with `scope="category"` for each category's summed demand
+    - Products default to the whole catalog or one `category`
+    - Runs on the tuning worker pool, checkpointing every evaluation; pass the
+      `run_id` of an interrupted run to resume it
+    - Winning parameters are stored and used by later online Prophet fits
+    """
+    if request.product_ids and request.scope == 'category':
+        raise HTTPException(status_code=400, detail="product_ids cannot be combined with scope=category")
+    try:
+        grid_size = len(expand_grid(request.grid))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    run_id = request.run_id or new_run_id()
+    task = forecast_tuner.start(
+        product_ids=request.product_ids,
+        category=request.category,
+        scope=request.scope,
+        grid=request.grid,
+        run_id=run_id
+    )
+    if task is None:
+        raise HTTPException(status_code=409, detail="A tuning run is already in progress")
+    return {
+        "status": "started",
+        "run_id": run_id,
+        "resumed": forecast_tuner.checkpoint_path(run_id).exists(),
+        "grid_size": grid_size,
+        "started_at": datetime.now().isoformat()
+    }
+
+@router.get("/tuning/status")
+async def get_tuning_status():
+    """Get cross-validation settings and the progress of the latest tuning run"""
+    return forecast_tuner.get_stats()
+
+@router.get("/restock-recommendations")
+async def get_catalog_restock_recommendations(
+    category: Optional[str] = Query(None, description="Filter by category"),
+    safety_stock_days: int = Query(default=3, ge=1, le=14, description="Safety stock in days"),
+    min_urgency: str = Query(default="low", pattern=f"^({'|'.join(URGENCY_LEVELS)})$",
+                             description="Least urgent level to include"),
+    limit: int = Query(default=100, ge=1, le=100000, description="Maximum recommendations returned")
+):
+    """
+    Get ranked restock recommendations for the whole catalog
+    
+    Uses each product's latest materialized forecast, current stock and lead
+    time; most urgent products come first. Products without a materialized
+    forecast are counted in `missing_forecasts`.
+    """
+    try:
+        return await restock_engine.recommend(
+            category=category,
+            safety_stock_days=safety_stock_days,
+            limit=limit,
+            min_urgency=min_urgency
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/restock-recommendations/{product_id}")
 async def get_restock_recommendations(
     product_id: int,
@@ -118,7 +510,9 @@ async def get_restock_recommendations(
     """Get restock recommendations based on forecast"""
     try:
         # Get forecast first
-        forecast = await get_product_forecast(product_id, days_ahead=7)
+        forecast = await get_product_forecast(
+            product_id, days_ahead=7, engine=None, format=None, deadline_ms=None, accept=None
+        )
         
         # Generate restock recommendations
         recommendations = await forecasting_service.get_restock_recommendations(
@@ -140,59 +534,48 @@ async def get_restock_recommendations(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/actuals")
+async def record_actual_demand(request: ActualsRequest):
+    """
+    Record actual daily demand and score the materialized forecasts for those days
+    
+    Send one total per product and day; sending the same product and day again
+    replaces the earlier value.
+    """
+    try:
+        return await accuracy_tracker.record_actuals([actual.dict() for actual in request.actuals])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/accuracy-metrics/{product_id}")
 async def get_forecast_accuracy(product_id: int):
     """Get historical forecast accuracy metrics"""
     try:
-        # In a real app, calculate actual vs predicted from database
-        # For demo, return mock metrics
-        metrics = {
-            "product_id": product_id,
-            "last_30_days": {
-                "mean_absolute_error": 2.3,
-                "mean_absolute_percentage_error": 15.8,
-                "accuracy_score": 84.2
-            },
-            "last_7_days": {
-                "mean_absolute_error": 1.8,
-                "mean_absolute_percentage_error": 12.4,
-                "accuracy_score": 87.6
-            },
-            "model_performance": "good",
-            "recommendations": [
-                "Model performing well for short-term forecasts",
-                "Consider retraining with more recent data for better accuracy"
-            ]
-        }
-        
-        return metrics
+        return accuracy_tracker.get_metrics(product_id)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def generate_mock_sales_data(product_id: int, days_back: int = 30) -> List[dict]:
-    """Generate mock sales data for demo purposes"""
-    import random
-    
-    sales_data = []
-    base_demand = 20 + (product_id % 10)  # Different base demand per product
-    
-    for i in range(days_back):
-        date = datetime.now() - timedelta(days=days_back - i)
-        
-        # Add some patterns
-        weekday_factor = 1.2 if date.weekday() < 5 else 0.8  # Higher on weekdays
-        trend_factor = 1 + (i / days_back) * 0.1  # Slight upward trend
-        random_factor = random.uniform(0.7, 1.3)  # Random variation
-        
-        quantity = max(0, int(base_demand * weekday_factor * trend_factor * random_factor))
-        revenue = quantity * (15.99 + (product_id % 5))  # Different prices
-        
-        sales_data.append({
-            "date": date.isoformat(),
-            "quantity_sold": quantity,
-            "revenue": round(revenue, 2),
-            "store_id": f"store_{(i % 5) + 1}"
-        })
-    
-    return sales_data
+@router.get("/stats")
+async def get_forecasting_stats():
+    """Get runtime statistics for the forecasting worker pool and caches"""
+    return {
+        "worker_pool": forecast_pool.get_stats(),
+        "model_cache": forecasting_service.models.get_stats(),
+        "fits": forecasting_service.get_fit_stats(),
+        "materialized_reads": forecast_materializer.get_stats(),
+        "confidence_cache": forecasting_service.confidence.get_stats(),
+        "model_store": model_store.get_stats(),
+        "hierarchical": hierarchical_forecaster.get_stats(),
+        "restock": restock_engine.get_stats(),
+        "accuracy": accuracy_tracker.get_stats(),
+        "sales_store": sales_store.get_stats(),
+        "jobs": forecast_jobs.get_stats(),
+        "model_selection": model_selector.get_stats(),
+        "deadlines": forecasting_service.get_deadline_stats(),
+        "tuning": forecast_tuner.get_stats(),
+        "single_flight": {
+            "forecasts": forecasting_service.single_flight.get_stats(),
+            "refits": forecast_materializer.single_flight.get_stats()
+        }
+    }
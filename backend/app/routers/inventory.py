@@ -6,8 +6,10 @@ from app.models.schemas import (
     InventoryStatus,
     InventoryOverview,
     Product,
-    ProductCreate
+    ProductCreate,
+    SalesIngestRequest
 )
+from app.services.sales_store import sales_store
 
 router = APIRouter()
 
@@ -115,6 +117,20 @@ async def update_stock_level(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/sales")
+async def ingest_sales(request: SalesIngestRequest):
+    """
+    Record sales transactions
+    
+    - Rows are stored in the sales_data table and added to the in-process daily
+      sales series used by forecasting and anomaly detection
+    - Daily totals for the affected days are passed on to forecast accuracy tracking
+    """
+    try:
+        return await sales_store.ingest([record.dict() for record in request.records])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/low-stock-alerts")
 async def get_low_stock_alerts(
     threshold_days: int = Query(default=7, ge=1, le=30, description="Days of stock remaining threshold")
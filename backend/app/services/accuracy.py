@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.forecast_store import load_predictions
+from app.services.model_store import model_store
+
+logger = logging.getLogger(__name__)
+
+# Forecast horizons scored separately: (label, first day ahead, last day ahead)
+HORIZON_BUCKETS = (('1d', 1, 1), ('2-7d', 2, 7), ('8-30d', 8, 30))
+WINDOW_DAYS = 30
+LOOKUP_BATCH_SIZE = 500
+
+# Seconds between saves of the running aggregates (0 = only on shutdown)
+ACCURACY_SAVE_INTERVAL = float(os.getenv("ACCURACY_SAVE_INTERVAL_SECONDS", "300"))
+
+# Columns of the running aggregates
+ABS_ERROR, ABS_PCT_ERROR, ERROR, COUNT = range(4)
+
+def _bucket(days_ahead: int) -> Optional[int]:
+    for index, (_, first, last) in enumerate(HORIZON_BUCKETS):
+        if first <= days_ahead <= last:
+            return index
+    return None
+
+def _summarize(sums: np.ndarray) -> Dict:
+    """Turn one row of running sums into MAE / MAPE / bias metrics"""
+    count = int(sums[COUNT])
+    if count == 0:
+        return {
+            'mean_absolute_error': None,
+            'mean_absolute_percentage_error': None,
+            'accuracy_score': None,
+            'bias': None,
+            'observations': 0
+        }
+
+    mape = float(sums[ABS_PCT_ERROR]) / count * 100
+    return {
+        'mean_absolute_error': round(float(sums[ABS_ERROR]) / count, 2),
+        'mean_absolute_percentage_error': round(mape, 1),
+        'accuracy_score': round(max(0.0, 100 - mape), 1),
+        'bias': round(float(sums[ERROR]) / count, 2),
+        'observations': count
+    }
+
+class _ProductAccuracy:
+    """Running error sums for one product: a 30-day ring of daily slots plus lifetime totals"""
+
+    __slots__ = ('days', 'window', 'lifetime', 'latest_day')
+
+    def __init__(self):
+        self.days = np.full(WINDOW_DAYS, -1, dtype=np.int64)
+        self.window = np.zeros((len(HORIZON_BUCKETS), WINDOW_DAYS, 4), dtype=np.float64)
+        self.lifetime = np.zeros((len(HORIZON_BUCKETS), 4), dtype=np.float64)
+        self.latest_day = -1
+
+class AccuracyTracker:
+    """
+    Scores materialized forecasts against actual demand as it arrives
+
+    Each actual is joined with the forecasts that predicted its day (one
+    indexed lookup per batch) and added to per-product, per-horizon running
+    sums in O(1). The last 30 days are kept as a ring of daily slots, so
+    7- and 30-day metrics are read from at most 30 slots and never rescan
+    history. Recording the same product and day again replaces the earlier
+    actual, so cumulative daily totals can be re-sent as sales come in.
+    A day whose ring slot already holds a later day can no longer be
+    replaced and is ignored rather than counted twice in the lifetime sums.
+    The aggregates are saved every ACCURACY_SAVE_INTERVAL seconds while
+    they change, and once more on shutdown.
+    """
+
+    def __init__(self, save_interval_seconds: float = ACCURACY_SAVE_INTERVAL):
+        self.save_interval_seconds = save_interval_seconds
+        self._products: Dict[int, _ProductAccuracy] = {}
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'actuals_recorded': 0, 'actuals_matched': 0, 'actuals_unmatched': 0, 'actuals_out_of_window': 0}
+
+    async def record_actuals(self, actuals: List[Dict]) -> Dict:
+        """
+        Record actual daily demand and score the forecasts that predicted it
+
+        Args:
+            actuals: ``{'product_id', 'date', 'quantity_sold'}`` dicts, one per product and day
+
+        Returns:
+            Counts of recorded actuals and of those with a forecast to compare against
+        """
+        latest: Dict[tuple, float] = {}
+        for actual in actuals:
+            day = actual['date'].date() if isinstance(actual['date'], datetime) else actual['date']
+            latest[(actual['product_id'], day.toordinal())] = float(actual['quantity_sold'])
+        if not latest:
+            return {'recorded': 0, 'matched': 0, 'unmatched': 0}
+
+        predictions = await self._lookup_predictions(latest)
+
+        matched = 0
+        out_of_window = 0
+        for (product_id, ordinal), quantity in latest.items():
+            by_bucket = predictions.get((product_id, ordinal), {})
+            if not self._update(product_id, ordinal, quantity, {bucket: value for bucket, (_, value) in by_bucket.items()}):
+                out_of_window += 1
+            elif by_bucket:
+                matched += 1
+
+        recorded = len(latest) - out_of_window
+        self._dirty = self._dirty or recorded > 0
+        self.stats['actuals_recorded'] += recorded
+        self.stats['actuals_matched'] += matched
+        self.stats['actuals_unmatched'] += recorded - matched
+        self.stats['actuals_out_of_window'] += out_of_window
+        return {'recorded': recorded, 'matched': matched, 'unmatched': recorded - matched, 'out_of_window': out_of_window}
+
+    async def _lookup_predictions(self, actuals: Dict[tuple, float]) -> Dict[tuple, Dict[int, tuple]]:
+        """Latest materialized prediction per (product, day) and horizon bucket"""
+        ordinals = [ordinal for _, ordinal in actuals]
+        start = datetime.combine(date.fromordinal(min(ordinals)), datetime.min.time())
+        end = datetime.combine(date.fromordinal(max(ordinals)), datetime.min.time()) + timedelta(days=1)
+        product_ids = sorted({product_id for product_id, _ in actuals})
+
+        predictions: Dict[tuple, Dict[int, tuple]] = {}
+        for offset in range(0, len(product_ids), LOOKUP_BATCH_SIZE):
+            rows = await asyncio.to_thread(
+                load_predictions, product_ids[offset:offset + LOOKUP_BATCH_SIZE], start, end
+            )
+            for product_id, forecast_date, created_at, predicted in rows:
+                ordinal = forecast_date.date().toordinal()
+                if (product_id, ordinal) not in actuals:
+                    continue
+                bucket = _bucket(max(1, ordinal - created_at.date().toordinal()))
+                if bucket is None:
+                    continue
+                by_bucket = predictions.setdefault((product_id, ordinal), {})
+                created = created_at.replace(tzinfo=None)
+                if bucket not in by_bucket or by_bucket[bucket][0] < created:
+                    by_bucket[bucket] = (created, predicted)
+
+        return predictions
+
+    def _update(self, product_id: int, ordinal: int, actual: float, predictions: Dict[int, float]) -> bool:
+        """
+        Add one day's forecast errors to the running sums in O(1)
+
+        Returns False if the day has already left the ring: its slot holds a
+        later day, so an earlier actual for it may be in the lifetime sums
+        and could not be subtracted.
+        """
+        entry = self._products.get(product_id)
+        if entry is None:
+            entry = self._products[product_id] = _ProductAccuracy()
+
+        slot = ordinal % WINDOW_DAYS
+        if entry.days[slot] > ordinal:
+            return False
+        if entry.days[slot] == ordinal:
+            # Replacing an earlier actual for the same day
+            entry.lifetime -= entry.window[:, slot]
+        entry.window[:, slot] = 0
+        entry.days[slot] = ordinal
+
+        for bucket, predicted in predictions.items():
+            error = predicted - actual
+            row = (abs(error), abs(error) / max(abs(actual), 1.0), error, 1)
+            entry.lifetime[bucket] += row
+            entry.window[bucket, slot] += row
+
+        entry.latest_day = max(entry.latest_day, ordinal)
+        return True
+
+    def get_metrics(self, product_id: int) -> Dict:
+        """
+        7-day, 30-day and lifetime accuracy for a product, overall and per horizon
+
+        Windows end at the product's most recent recorded actual.
+        """
+        entry = self._products.get(product_id)
+        if entry is None:
+            empty = self._window_metrics(np.zeros((len(HORIZON_BUCKETS), 4)))
+            return {
+                'product_id': product_id,
+                'as_of': None,
+                'last_30_days': empty,
+                'last_7_days': empty,
+                'lifetime': empty,
+                'model_performance': 'unknown',
+                'recommendations': ["No actual sales recorded against materialized forecasts yet"]
+            }
+
+        windows = {}
+        for label, length in (('last_30_days', 30), ('last_7_days', 7)):
+            mask = (entry.days >= 0) & (entry.days > entry.latest_day - length)
+            windows[label] = self._window_metrics(entry.window[:, mask].sum(axis=1, dtype=np.float64))
+
+        return {
+            'product_id': product_id,
+            'as_of': date.fromordinal(int(entry.latest_day)),
+            **windows,
+            'lifetime': self._window_metrics(entry.lifetime),
+            'model_performance': self._performance(windows['last_30_days']),
+            'recommendations': self._recommendations(windows)
+        }
+
+    def _window_metrics(self, sums: np.ndarray) -> Dict:
+        return {
+            **_summarize(sums.sum(axis=0)),
+            'by_horizon': {label: _summarize(sums[index]) for index, (label, _, _) in enumerate(HORIZON_BUCKETS)}
+        }
+
+    def _performance(self, metrics: Dict) -> str:
+        mape = metrics['mean_absolute_percentage_error']
+        if mape is None:
+            return 'unknown'
+        if mape < 20:
+            return 'good'
+        if mape < 35:
+            return 'fair'
+        return 'poor'
+
+    def _recommendations(self, windows: Dict) -> List[str]:
+        recent, month = windows['last_7_days'], windows['last_30_days']
+        if month['observations'] == 0:
+            return ["No actual sales recorded against materialized forecasts in the last 30 days"]
+
+        recommendations = []
+        if (recent['mean_absolute_percentage_error'] is not None
+                and recent['mean_absolute_percentage_error'] > month['mean_absolute_percentage_error'] * 1.25):
+            recommendations.append("Accuracy dropped over the last 7 days, consider retraining with recent data")
+
+        if month['mean_absolute_error'] and abs(month['bias']) > 0.5 * month['mean_absolute_error']:
+            direction = 'above' if month['bias'] > 0 else 'below'
+            recommendations.append(f"Forecasts are consistently {direction} actual demand")
+
+        horizons = [month['by_horizon'][label]['mean_absolute_percentage_error'] for label, _, _ in HORIZON_BUCKETS]
+        horizons = [mape for mape in horizons if mape is not None]
+        if len(horizons) > 1 and horizons[-1] > 2 * max(horizons[0], 1):
+            recommendations.append("Long-horizon forecasts are much less accurate, prefer frequent short-term refreshes")
+
+        if not recommendations:
+            recommendations.append("Model performing well for short-term forecasts")
+        return recommendations
+
+    def start(self) -> None:
+        """Start saving the aggregates periodically"""
+        if self.save_interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._save_periodically())
+
+    async def stop(self) -> None:
+        """Stop the periodic saves and save the aggregates one last time"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save_async()
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.save_interval_seconds)
+            if not self._dirty:
+                continue
+            try:
+                await self.save_async()
+            except Exception as e:
+                logger.error(f"Failed to save accuracy aggregates: {e}")
+
+    async def save_async(self) -> None:
+        """Snapshot the aggregates on the event loop and write them from a thread"""
+        state = self._snapshot()
+        self._dirty = False
+        await asyncio.to_thread(self._write, state)
+
+    def save(self) -> None:
+        """Persist the running aggregates so they survive restarts"""
+        state = self._snapshot()
+        self._dirty = False
+        self._write(state)
+
+    def _snapshot(self) -> Dict[int, tuple]:
+        # Copies, so ingests landing while the snapshot is written cannot tear it
+        return {
+            product_id: (entry.days.copy(), entry.window.copy(), entry.lifetime.copy(), entry.latest_day)
+            for product_id, entry in self._products.items()
+        }
+
+    def _write(self, state: Dict[int, tuple]) -> None:
+        model_store.save('accuracy', 'tracker', state, 'joblib', {'products': len(state)})
+
+    def load(self) -> None:
+        """Restore running aggregates saved by a previous process, if any"""
+        stored = model_store.load('accuracy', 'tracker')
+        if stored is None:
+            return
+
+        for product_id, (days, window, lifetime, latest_day) in stored[0].items():
+            entry = _ProductAccuracy()
+            entry.days, entry.lifetime, entry.latest_day = days, lifetime, latest_day
+            # Earlier versions kept the ring as float32
+            entry.window = window.astype(np.float64, copy=False)
+            self._products[product_id] = entry
+
+    def get_stats(self) -> Dict:
+        """Return ingestion counters and the memory held by the aggregates"""
+        per_product = _ProductAccuracy()
+        entry_bytes = per_product.days.nbytes + per_product.window.nbytes + per_product.lifetime.nbytes
+        return {
+            **self.stats,
+            'products_tracked': len(self._products),
+            'aggregate_bytes': len(self._products) * entry_bytes
+        }
+
+# Singleton instance
+accuracy_tracker = AccuracyTracker()
@@ -3,28 +3,114 @@ import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple, Union
+import asyncio
+import hashlib
 import logging
+import os
+import pickle
+
+from app.services.model_cache import ModelCache
+from app.services.model_store import model_store
+from app.services.sales_store import DailySeries
+from app.services.single_flight import SingleFlight
+from app.services.worker_pool import WorkerPool, PoolSaturatedError
 
 logger = logging.getLogger(__name__)
 
+# Detector fits run in their own worker processes; multi-product requests
+# analyse at most ANOMALY_MAX_PARALLEL products at a time
+ANOMALY_POOL_SIZE = int(os.getenv("ANOMALY_POOL_SIZE", str(os.cpu_count() or 1)))
+ANOMALY_POOL_MAX_QUEUE = int(os.getenv("ANOMALY_POOL_MAX_QUEUE", str(max(1, ANOMALY_POOL_SIZE) * 8)))
+ANOMALY_JOB_TIMEOUT = float(os.getenv("ANOMALY_JOB_TIMEOUT_SECONDS", "30"))
+ANOMALY_MAX_PARALLEL = int(os.getenv("ANOMALY_MAX_PARALLEL", str(max(1, ANOMALY_POOL_SIZE) * 2)))
+
+# A stored detector scores new data until it is older than the refit
+# interval or the points it has not seen drift away from its training data
+# (shift of mean daily quantity or revenue, in training standard deviations)
+ANOMALY_REFIT_INTERVAL = float(os.getenv("ANOMALY_REFIT_INTERVAL_SECONDS", "86400"))
+ANOMALY_DRIFT_THRESHOLD = float(os.getenv("ANOMALY_DRIFT_THRESHOLD", "1.0"))
+ANOMALY_DRIFT_MIN_POINTS = int(os.getenv("ANOMALY_DRIFT_MIN_POINTS", "7"))
+
+# Fitted detector cache configuration
+ANOMALY_MODEL_CACHE_MAX_ENTRIES = int(os.getenv("ANOMALY_MODEL_CACHE_MAX_ENTRIES", "5000"))
+ANOMALY_MODEL_CACHE_MAX_MB = float(os.getenv("ANOMALY_MODEL_CACHE_MAX_MB", "256"))
+ANOMALY_MODEL_CACHE_TTL = float(os.getenv("ANOMALY_MODEL_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Raw demand features compared for drift; rolling and trend features are
+# autocorrelated, so their window means wander even on stationary demand
+DRIFT_FEATURES = ('quantity', 'revenue')
+
+def _fit_detector_job(features: pd.DataFrame, contamination: float) -> Dict:
+    """Fit the scaler and Isolation Forest on engineered features (runs inside a worker process)"""
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+    
+    model = IsolationForest(
+        contamination=contamination,
+        random_state=42,
+        n_estimators=100
+    )
+    model.fit(features_scaled)
+    return {'model': model, 'scaler': scaler}
+
+def _score_features(model: IsolationForest, scaler: StandardScaler, features: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels (-1 = anomaly) and decision scores of a fitted detector"""
+    features_scaled = scaler.transform(features)
+    return model.predict(features_scaled), model.decision_function(features_scaled)
+
+# Shared pool for detector fits
+anomaly_pool = WorkerPool(
+    name='anomaly',
+    size=ANOMALY_POOL_SIZE,
+    max_queue=ANOMALY_POOL_MAX_QUEUE,
+    timeout=ANOMALY_JOB_TIMEOUT
+)
+
+def _detector_size(entry: Dict) -> int:
+    """Cache footprint of a detector entry: its pickled forest and scaler"""
+    return len(pickle.dumps((entry['model'], entry['scaler']), protocol=pickle.HIGHEST_PROTOCOL))
+
+def _features_fingerprint(features: pd.DataFrame, contamination: float) -> str:
+    """Fingerprint of an engineered feature matrix and detector settings"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(features.to_numpy(dtype=np.float64)).tobytes())
+    digest.update(','.join(features.columns).encode('utf-8'))
+    digest.update(str(contamination).encode('utf-8'))
+    return digest.hexdigest()
+
 class AnomalyDetectionService:
     def __init__(self):
         """Initialize the anomaly detection service"""
-        self.models = {}  # Store trained models per product
-        self.scalers = {}  # Store scalers for normalization
+        self.models = ModelCache(
+            max_entries=ANOMALY_MODEL_CACHE_MAX_ENTRIES,
+            max_bytes=int(ANOMALY_MODEL_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=ANOMALY_MODEL_CACHE_TTL
+        )  # Trained detectors per product
+        self.single_flight = SingleFlight('anomaly_detection')
+        self.max_parallel = max(1, ANOMALY_MAX_PARALLEL)
+        self.detector_stats = {
+            'scored': 0,
+            'refits': {'missing': 0, 'incompatible': 0, 'schedule': 0, 'drift': 0, 'forced': 0}
+        }
         
     async def detect_anomalies(self, 
                              product_id: int, 
-                             sales_data: List[Dict], 
-                             contamination: float = 0.1) -> Dict:
+                             sales_data: Union[List[Dict], DailySeries], 
+                             contamination: float = 0.1,
+                             refit: bool = False) -> Dict:
         """
         Detect anomalies in sales data using Isolation Forest
         
+        The product's stored detector scores the window with one
+        ``decision_function`` call; it is refitted only on schedule, on
+        drift, or when ``refit`` is set.
+        
         Args:
             product_id: ID of the product
-            sales_data: Historical sales data
+            sales_data: Historical sales records or a DailySeries from the sales store
             contamination: Expected proportion of anomalies (0.1 = 10%)
+            refit: Fit a new detector even if the stored one is current
             
         Returns:
             Dictionary with anomaly detection results
@@ -43,63 +129,217 @@ class AnomalyDetectionService:
             if features.empty or len(features.columns) == 0:
                 return await self._simple_anomaly_detection(product_id, sales_data)
             
-            # Scale features
-            scaler = StandardScaler()
-            features_scaled = scaler.fit_transform(features)
-            
-            # Train Isolation Forest
-            model = IsolationForest(
-                contamination=contamination,
-                random_state=42,
-                n_estimators=100
+            # Score with the product's stored detector unless a refit is due;
+            # concurrent requests for the same data share one refit
+            data_version = _features_fingerprint(features, contamination)
+            fitted, detector_info = await self.single_flight.run(
+                (product_id, data_version, refit),
+                lambda: self._get_detector(product_id, features, df['date'], data_version, contamination, refit)
             )
             
-            anomaly_labels = model.fit_predict(features_scaled)
-            anomaly_scores = model.decision_function(features_scaled)
+            # Scoring a window is cheap but still CPU work, so keep it off the event loop
+            anomaly_labels, anomaly_scores = await asyncio.to_thread(
+                _score_features, fitted['model'], fitted['scaler'], features
+            )
             
-            # Store model and scaler
-            self.models[product_id] = {
-                'model': model,
-                'scaler': scaler,
-                'trained_at': datetime.now(),
-                'data_points': len(df)
+            # Process results column-wise
+            columns = {
+                'date': df['date'].values,
+                'value': df['quantity_sold'].to_numpy(dtype=float),
+                'is_anomaly': anomaly_labels == -1,
+                'anomaly_score': self._normalize_anomaly_scores(anomaly_scores)
             }
-            
-            # Process results
-            anomaly_points = []
-            anomalies_count = 0
-            
-            for i, (idx, row) in enumerate(df.iterrows()):
-                is_anomaly = anomaly_labels[i] == -1
-                if is_anomaly:
-                    anomalies_count += 1
-                
-                # Normalize anomaly score to 0-1 range
-                normalized_score = self._normalize_anomaly_score(anomaly_scores[i])
-                
-                anomaly_points.append({
-                    'date': row['date'],
-                    'value': row['quantity_sold'],
-                    'is_anomaly': is_anomaly,
-                    'anomaly_score': normalized_score
-                })
+            anomalies_count = int(columns['is_anomaly'].sum())
+            
+            anomaly_points = [
+                {'date': pd.Timestamp(day), 'value': value, 'is_anomaly': is_anomaly, 'anomaly_score': score}
+                for day, value, is_anomaly, score in zip(
+                    columns['date'],
+                    columns['value'].tolist(),
+                    columns['is_anomaly'].tolist(),
+                    columns['anomaly_score'].tolist()
+                )
+            ]
             
             return {
                 'product_id': product_id,
                 'anomalies_detected': anomalies_count,
                 'anomaly_points': anomaly_points,
+                'columns': columns,
                 'contamination_rate': round(anomalies_count / len(df) * 100, 2),
                 'analysis_period': f"{df['date'].min()} to {df['date'].max()}",
                 'method': 'isolation_forest',
+                'detector': detector_info,
                 'data_points_analyzed': len(df)
             }
             
+        except PoolSaturatedError:
+            raise
         except Exception as e:
             logger.error(f"Anomaly detection failed for product {product_id}: {e}")
             return await self._simple_anomaly_detection(product_id, sales_data)
     
-    def _prepare_data(self, sales_data: List[Dict]) -> pd.DataFrame:
-        """Prepare sales data for anomaly detection"""
+    async def detect_many(self,
+                          product_ids: List[int],
+                          load_sales: Callable[[int], Awaitable[Union[List[Dict], DailySeries]]],
+                          contamination: float = 0.1,
+                          refit: bool = False) -> List[Dict]:
+        """
+        Detect anomalies for many products concurrently
+        
+        At most ``max_parallel`` products are loaded and analysed at a time,
+        enough to keep every anomaly worker busy without queueing the whole
+        catalog.
+        
+        Args:
+            product_ids: Products to analyse
+            load_sales: Coroutine function returning a product's sales data
+            contamination: Expected proportion of anomalies
+            refit: Fit new detectors even where the stored ones are current
+            
+        Returns:
+            One result per product, in input order
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        
+        async def detect_one(product_id: int) -> Dict:
+            async with semaphore:
+                sales_data = await load_sales(product_id)
+                return await self.detect_anomalies(product_id, sales_data, contamination, refit)
+        
+        return await asyncio.gather(*(detect_one(product_id) for product_id in product_ids))
+    
+    async def _get_detector(self,
+                            product_id: int,
+                            features: pd.DataFrame,
+                            dates: pd.Series,
+                            data_version: str,
+                            contamination: float,
+                            refit: bool = False) -> Tuple[Dict, Dict]:
+        """
+        Return the product's stored detector, refitting it only when due
+        
+        A detector from memory or disk keeps scoring new windows as long as
+        it was fitted on the same feature columns and contamination, is
+        younger than the refit interval and the points after its training
+        window show no drift.
+        
+        Returns:
+            The detector entry and a dict describing how it was obtained
+        """
+        fitted = self.models.get(product_id)
+        if fitted is None:
+            fitted = await self._load_stored_detector(product_id)
+        
+        drift = None
+        if refit:
+            reason = 'forced'
+        elif fitted is None:
+            reason = 'missing'
+        elif fitted['data_version'] == data_version:
+            reason = None
+        elif (fitted.get('columns') != list(features.columns)
+              or fitted.get('contamination') != contamination):
+            reason = 'incompatible'
+        elif (datetime.now() - fitted['trained_at']).total_seconds() > ANOMALY_REFIT_INTERVAL:
+            reason = 'schedule'
+        else:
+            drift = self._feature_drift(fitted, features, dates)
+            reason = 'drift' if drift is not None and drift > ANOMALY_DRIFT_THRESHOLD else None
+        
+        if reason is None:
+            self.detector_stats['scored'] += 1
+            return fitted, {'mode': 'scored', 'trained_at': fitted['trained_at'].isoformat(), 'drift': drift}
+        
+        # Fit in a worker process so the event loop stays free
+        detector = await anomaly_pool.run(_fit_detector_job, features, contamination)
+        self.detector_stats['refits'][reason] += 1
+        
+        # Store model and scaler, in memory and on disk
+        fitted = {
+            'model': detector['model'],
+            'scaler': detector['scaler'],
+            'data_version': data_version,
+            'columns': list(features.columns),
+            'contamination': contamination,
+            'trained_at': datetime.now(),
+            'trained_through': pd.Timestamp(dates.max()),
+            'data_points': len(features)
+        }
+        self.models.put(product_id, fitted, size_bytes=_detector_size(fitted))
+        await self._save_detector(product_id, fitted)
+        return fitted, {
+            'mode': 'fitted',
+            'refit_reason': reason,
+            'trained_at': fitted['trained_at'].isoformat(),
+            'drift': drift
+        }
+    
+    def _feature_drift(self, fitted: Dict, features: pd.DataFrame, dates: pd.Series) -> Optional[float]:
+        """Largest demand mean shift of the points after the training window, in training standard deviations"""
+        new_points = (dates > fitted['trained_through']).to_numpy()
+        if new_points.sum() < ANOMALY_DRIFT_MIN_POINTS:
+            return None
+        
+        scaled = pd.DataFrame(
+            fitted['scaler'].transform(features[new_points]),
+            columns=features.columns
+        )[list(DRIFT_FEATURES)]
+        return round(float(scaled.mean().abs().max()), 3)
+    
+    async def _load_stored_detector(self, product_id: int) -> Optional[Dict]:
+        """Lazily load a product's latest detector from the on-disk store"""
+        stored = await asyncio.to_thread(model_store.load, 'isolation_forest', product_id)
+        if stored is None:
+            return None
+        
+        detector, metadata = stored
+        entry = {
+            'model': detector['model'],
+            'scaler': detector['scaler'],
+            'data_version': metadata.get('data_version'),
+            'columns': metadata.get('columns'),
+            'contamination': metadata.get('contamination'),
+            'trained_at': datetime.fromisoformat(metadata['trained_at']),
+            'trained_through': pd.Timestamp(metadata['trained_through']) if metadata.get('trained_through') else pd.Timestamp.min,
+            'data_points': metadata['data_points']
+        }
+        self.models.put(product_id, entry, size_bytes=_detector_size(entry))
+        return entry
+    
+    async def _save_detector(self, product_id: int, entry: Dict) -> None:
+        """Persist a fitted detector and scaler so other workers and restarts can reuse them"""
+        metadata = {
+            'data_version': entry['data_version'],
+            'columns': entry['columns'],
+            'contamination': entry['contamination'],
+            'trained_at': entry['trained_at'].isoformat(),
+            'trained_through': entry['trained_through'].isoformat(),
+            'data_points': entry['data_points']
+        }
+        try:
+            await asyncio.to_thread(
+                model_store.save,
+                'isolation_forest',
+                product_id,
+                {'model': entry['model'], 'scaler': entry['scaler']},
+                'joblib',
+                metadata
+            )
+        except Exception as e:
+            logger.error(f"Failed to persist anomaly detector for product {product_id}: {e}")
+    
+    def _prepare_data(self, sales_data: Union[List[Dict], DailySeries]) -> pd.DataFrame:
+        """
+        Prepare sales data for anomaly detection
+
+        Returns one row per calendar day with zero for days without sales,
+        the same as a DailySeries from the sales store.
+        """
+        if isinstance(sales_data, DailySeries):
+            # Already one total per day: no record parsing or aggregation needed
+            return sales_data.to_frame()
+        
         df = pd.DataFrame(sales_data)
         
         if df.empty:
@@ -108,16 +348,13 @@ class AnomalyDetectionService:
         # Convert date column
         df['date'] = pd.to_datetime(df['date'])
         
-        # Aggregate by date if multiple entries per day
-        df = df.groupby('date').agg({
+        # Aggregate by date if multiple entries per day, zero-filling days without sales
+        df = df.groupby(df['date'].dt.normalize()).agg({
             'quantity_sold': 'sum',
             'revenue': 'sum'
-        }).reset_index()
-        
-        # Sort by date
-        df = df.sort_values('date').reset_index(drop=True)
+        }).sort_index().asfreq('D', fill_value=0)
         
-        return df
+        return df.rename_axis('date').reset_index()
     
     def _engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Engineer features for anomaly detection"""
@@ -151,7 +388,7 @@ class AnomalyDetectionService:
             
             # Remove any infinite or NaN values
             features = features.replace([np.inf, -np.inf], np.nan)
-            features = features.fillna(method='ffill').fillna(0)
+            features = features.ffill().fillna(0)
             
             return features
             
@@ -159,22 +396,18 @@ class AnomalyDetectionService:
             logger.error(f"Feature engineering failed: {e}")
             return pd.DataFrame()
     
-    def _normalize_anomaly_score(self, score: float) -> float:
-        """Normalize anomaly score to 0-1 range where 1 is most anomalous"""
-        try:
-            # Isolation Forest scores are typically between -0.5 and 0.5
-            # Negative scores indicate anomalies
-            normalized = max(0, min(1, (0.5 - score) / 1.0))
-            return round(normalized, 3)
-        except:
-            return 0.5
+    def _normalize_anomaly_scores(self, scores: np.ndarray) -> np.ndarray:
+        """Normalize anomaly scores to 0-1 range where 1 is most anomalous"""
+        # Isolation Forest scores are typically between -0.5 and 0.5
+        # Negative scores indicate anomalies
+        return np.round(np.clip(0.5 - scores, 0, 1), 3)
     
     async def _simple_anomaly_detection(self, 
                                        product_id: int, 
-                                       sales_data: List[Dict]) -> Dict:
+                                       sales_data: Union[List[Dict], DailySeries]) -> Dict:
         """Simple statistical anomaly detection for limited data"""
         try:
-            df = pd.DataFrame(sales_data)
+            df = self._prepare_data(sales_data)
             
             if df.empty:
                 return {
@@ -185,10 +418,6 @@ class AnomalyDetectionService:
                     'note': 'Not enough data for anomaly detection'
                 }
             
-            # Convert date
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.sort_values('date')
-            
             # Simple statistical approach using Z-score
             mean_quantity = df['quantity_sold'].mean()
             std_quantity = df['quantity_sold'].std()
@@ -311,6 +540,21 @@ class AnomalyDetectionService:
         except Exception as e:
             logger.error(f"Alert generation failed: {e}")
             return []
+    
+    def get_stats(self) -> Dict:
+        """Return detector reuse, worker pool and request coalescing counters"""
+        return {
+            'models_in_memory': len(self.models),
+            'model_cache': self.models.get_stats(),
+            'detectors': {
+                **self.detector_stats,
+                'refit_interval_seconds': ANOMALY_REFIT_INTERVAL,
+                'drift_threshold': ANOMALY_DRIFT_THRESHOLD
+            },
+            'max_parallel': self.max_parallel,
+            'worker_pool': anomaly_pool.get_stats(),
+            'single_flight': self.single_flight.get_stats()
+        }
 
 # Singleton instance
 anomaly_service = AnomalyDetectionService()
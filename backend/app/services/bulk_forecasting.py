@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Union
+
+from app.services.catalog import get_product_category, load_sales_series
+from app.services.forecasting import (
+    FORECAST_CATEGORY_ENGINES,
+    forecasting_service,
+    forecast_pool,
+    resolve_engine
+)
+from app.services.sales_store import sales_store
+from app.services.worker_pool import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Products forecast together per pass of the vectorized statistical engine
+STATISTICAL_BATCH_SIZE = 1000
+
+async def product_engine(product_id: int, engine: Optional[str], category: Optional[str] = None) -> str:
+    """Resolve the engine for a product, looking up its category only when a category default applies"""
+    if not engine and category is None and FORECAST_CATEGORY_ENGINES:
+        category = await asyncio.to_thread(get_product_category, product_id)
+    return resolve_engine(engine, category)
+
+async def _aiter(products: Union[Iterable[Dict], AsyncIterable[Dict]]) -> AsyncIterator[Dict]:
+    if hasattr(products, '__aiter__'):
+        async for product in products:
+            yield product
+    else:
+        for product in products:
+            yield product
+
+async def _forecast_one(product_id: int, days_ahead: int, engine: str = 'prophet') -> Dict:
+    """Forecast one product with Prophet (or auto selection), retrying briefly if the pool is saturated"""
+    for attempt in range(5):
+        try:
+            sales_data = await load_sales_series(product_id)
+            result = await forecasting_service.generate_forecast(
+                product_id=product_id,
+                sales_data=sales_data,
+                days_ahead=days_ahead,
+                engine=engine
+            )
+            if result.get('error'):
+                return {"product_id": product_id, "status": "failed", "error": result['error']}
+            return {"product_id": product_id, "status": "ok", "forecast": result}
+        except PoolSaturatedError:
+            await asyncio.sleep(0.5 * (attempt + 1))
+        except Exception as e:
+            return {"product_id": product_id, "status": "failed", "error": str(e)}
+
+    return {"product_id": product_id, "status": "failed", "error": "Forecasting worker pool saturated"}
+
+async def _forecast_statistical_batch(product_ids: List[int], days_ahead: int) -> List[Dict]:
+    """Forecast a batch of products in one pass of the vectorized statistical engine"""
+    try:
+        await sales_store.ensure_loaded(product_ids)
+        sales_by_product = {
+            product_id: await load_sales_series(product_id) for product_id in product_ids
+        }
+        results = await forecasting_service.generate_statistical_forecasts(sales_by_product, days_ahead)
+    except Exception as e:
+        logger.error(f"Statistical batch forecast failed: {e}")
+        return [
+            {"product_id": product_id, "status": "failed", "error": str(e)} for product_id in product_ids
+        ]
+
+    return [
+        {"product_id": result['product_id'], "status": "failed", "error": result['error']}
+        if result.get('error') else
+        {"product_id": result['product_id'], "status": "ok", "forecast": result}
+        for result in results
+    ]
+
+async def iter_bulk_forecasts(products: Union[Iterable[Dict], AsyncIterable[Dict]],
+                              days_ahead: int,
+                              engine: Optional[str] = None) -> AsyncIterator[Dict]:
+    """
+    Forecast many products, yielding each result as soon as it is ready
+
+    Prophet products go to the worker pool in a sliding window that keeps
+    every worker busy without queueing the whole catalog in memory; products
+    on the statistical engine are collected into batches and forecast
+    together.
+
+    Args:
+        products: Iterable or async iterable (e.g. ``aiter_products``) of
+            ``{'id', 'category'}`` dicts (category may be None)
+        days_ahead: Number of days to forecast
+        engine: Engine for every product, or None for per-category defaults
+
+    Yields:
+        ``{'product_id', 'status', 'forecast'}`` or ``{'product_id', 'status', 'error'}``
+    """
+    window = max(1, min(forecast_pool.max_queue, max(1, forecast_pool.size) * 2))
+    in_flight = set()
+    statistical_batch: List[int] = []
+    product_iter = _aiter(products)
+    exhausted = False
+
+    try:
+        while in_flight or statistical_batch or not exhausted:
+            while not exhausted and len(in_flight) < window and len(statistical_batch) < STATISTICAL_BATCH_SIZE:
+                try:
+                    product = await product_iter.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+
+                product_engine_name = await product_engine(product['id'], engine, product.get('category'))
+                if product_engine_name == 'statistical':
+                    statistical_batch.append(product['id'])
+                else:
+                    in_flight.add(asyncio.create_task(_forecast_one(product['id'], days_ahead, product_engine_name)))
+
+            if statistical_batch and (exhausted or len(statistical_batch) >= STATISTICAL_BATCH_SIZE):
+                for line in await _forecast_statistical_batch(statistical_batch, days_ahead):
+                    yield line
+                statistical_batch = []
+                continue
+
+            if not in_flight:
+                continue
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # The consumer went away (e.g. client disconnected): stop outstanding work
+        for task in in_flight:
+            task.cancel()
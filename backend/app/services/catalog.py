@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+from app.services.sales_store import DailySeries, sales_store
+
+logger = logging.getLogger(__name__)
+
+# Demo catalog used when the products table is empty (mirrors the inventory demo data)
+DEMO_CATEGORIES = ["Beverages", "Snacks", "Electronics", "Clothing", "Home & Garden"]
+DEMO_PRODUCT_COUNT = 20
+
+# Days of sales history online forecasts (and the tuning that feeds them) fit on
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "30"))
+
+def _demo_category(product_id: int) -> str:
+    return DEMO_CATEGORIES[(product_id - 1) % len(DEMO_CATEGORIES)]
+
+def _demo_lead_time(product_id: int) -> int:
+    return (product_id % 5) + 2
+
+def count_products(category: Optional[str] = None) -> int:
+    """Count catalog products, optionally within one category"""
+    try:
+        from app.database import SessionLocal
+        from app.models.database import Product
+
+        with SessionLocal() as session:
+            query = session.query(Product.id)
+            if category:
+                query = query.filter(Product.category.ilike(category))
+            total = query.count()
+            if total or session.query(Product.id).count():
+                return total
+    except Exception as e:
+        logger.warning(f"Catalog count from database failed, using demo catalog: {e}")
+
+    return len(_demo_products(category))
+
+def _product_page(category: Optional[str], after_id: Optional[int], limit: int) -> Optional[List[Dict]]:
+    """
+    One page of products with IDs above ``after_id`` (blocking)
+
+    Each page opens and closes its own session. Returns None when the
+    products table is empty or unreadable, so callers use the demo catalog.
+    """
+    try:
+        from app.database import SessionLocal
+        from app.models.database import Product
+
+        with SessionLocal() as session:
+            query = session.query(Product.id, Product.category).order_by(Product.id)
+            if category:
+                query = query.filter(Product.category.ilike(category))
+            if after_id is not None:
+                query = query.filter(Product.id > after_id)
+            rows = query.limit(limit).all()
+            if rows or after_id is not None or session.query(Product.id).first() is not None:
+                return [{'id': product_id, 'category': product_category} for product_id, product_category in rows]
+    except Exception as e:
+        if after_id is not None:
+            raise
+        logger.warning(f"Catalog read from database failed, using demo catalog: {e}")
+
+    return None
+
+def _demo_products(category: Optional[str] = None) -> List[Dict]:
+    return [
+        {'id': product_id, 'category': _demo_category(product_id)}
+        for product_id in range(1, DEMO_PRODUCT_COUNT + 1)
+        if not category or _demo_category(product_id).lower() == category.lower()
+    ]
+
+def iter_products(category: Optional[str] = None, batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    Yield catalog products as ``{'id', 'category'}`` dicts (blocking)
+
+    Rows are read from the products table in pages of ``batch_size`` so
+    memory stays flat for large catalogs, and no session is held between
+    pages. Falls back to the demo catalog when the table is empty. Async
+    code uses ``aiter_products`` instead.
+
+    Args:
+        category: Only yield products in this category (case-insensitive)
+        batch_size: Rows fetched from the database per round trip
+    """
+    after_id = None
+    while True:
+        page = _product_page(category, after_id, batch_size)
+        if page is None:
+            yield from _demo_products(category)
+            return
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_id = page[-1]['id']
+
+async def aiter_products(category: Optional[str] = None, batch_size: int = 1000) -> AsyncIterator[Dict]:
+    """
+    Yield catalog products like ``iter_products`` without blocking the event loop
+
+    Each page is read in a worker thread, so a stream over a large catalog
+    never stalls other requests while it pages the products table.
+    """
+    after_id = None
+    while True:
+        page = await asyncio.to_thread(_product_page, category, after_id, batch_size)
+        if page is None:
+            for product in _demo_products(category):
+                yield product
+            return
+        for product in page:
+            yield product
+        if len(page) < batch_size:
+            return
+        after_id = page[-1]['id']
+
+async def list_products(category: Optional[str] = None) -> List[Dict]:
+    """All catalog products (or one category), read page by page off the event loop"""
+    return [product async for product in aiter_products(category=category)]
+
+def get_product_category(product_id: int) -> Optional[str]:
+    """Look up the category of a single product"""
+    try:
+        from app.database import SessionLocal
+        from app.models.database import Product
+
+        with SessionLocal() as session:
+            row = session.query(Product.category).filter(Product.id == product_id).first()
+            if row is not None:
+                return row[0]
+    except Exception as e:
+        logger.warning(f"Category lookup failed for product {product_id}: {e}")
+
+    return _demo_category(product_id)
+
+def load_inventory(category: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Load stock levels and lead times for the catalog as parallel arrays
+
+    Products without a recorded lead time get -1 so callers can apply their
+    own default. Falls back to the demo catalog when the table is empty.
+
+    Returns:
+        Dict with ``product_id``, ``category``, ``current_stock`` and
+        ``lead_time_days`` arrays, sorted by product ID
+    """
+    try:
+        from app.database import SessionLocal
+        from app.models.database import Product
+
+        with SessionLocal() as session:
+            query = session.query(
+                Product.id, Product.category, Product.current_stock, Product.lead_time_days
+            ).order_by(Product.id)
+            if category:
+                query = query.filter(Product.category.ilike(category))
+            rows = query.all()
+            if rows or session.query(Product.id).count():
+                return {
+                    'product_id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+                    'category': np.array([row[1] for row in rows], dtype=object),
+                    'current_stock': np.fromiter((row[2] or 0 for row in rows), dtype=np.float64, count=len(rows)),
+                    'lead_time_days': np.fromiter(
+                        (-1 if row[3] is None else row[3] for row in rows), dtype=np.float64, count=len(rows)
+                    )
+                }
+    except Exception as e:
+        logger.warning(f"Inventory read from database failed, using demo catalog: {e}")
+
+    products = list(iter_products(category=category))
+    product_ids = np.array([product['id'] for product in products], dtype=np.int64)
+    return {
+        'product_id': product_ids,
+        'category': np.array([product['category'] for product in products], dtype=object),
+        'current_stock': ((product_ids * 37) % 91 + 10).astype(np.float64),
+        'lead_time_days': np.array([_demo_lead_time(pid) for pid in product_ids], dtype=np.float64)
+    }
+
+async def load_sales_series(product_id: int, days_back: int = FORECAST_HISTORY_DAYS) -> Union[DailySeries, List[dict]]:
+    """
+    Load daily sales for a product
+
+    Returns a zero-copy DailySeries from the in-process sales store and falls
+    back to generated demo records when the product has no recorded sales.
+    """
+    series = await sales_store.get_series(product_id, days_back=days_back)
+    if series is not None:
+        return series
+
+    return generate_mock_sales_data(product_id, days_back=days_back)
+
+def generate_mock_sales_data(product_id: int, days_back: int = 30) -> List[dict]:
+    """Generate mock sales data for demo purposes"""
+    sales_data = []
+    base_demand = 20 + (product_id % 10)  # Different base demand per product
+
+    for i in range(days_back):
+        date = datetime.now() - timedelta(days=days_back - i)
+
+        # Add some patterns
+        weekday_factor = 1.2 if date.weekday() < 5 else 0.8  # Higher on weekdays
+        trend_factor = 1 + (i / days_back) * 0.1  # Slight upward trend
+        random_factor = random.uniform(0.7, 1.3)  # Random variation
+
+        quantity = max(0, int(base_demand * weekday_factor * trend_factor * random_factor))
+        revenue = quantity * (15.99 + (product_id % 5))  # Different prices
+
+        sales_data.append({
+            "date": date.isoformat(),
+            "quantity_sold": quantity,
+            "revenue": round(revenue, 2),
+            "store_id": f"store_{(i % 5) + 1}"
+        })
+
+    return sales_data
@@ -0,0 +1,96 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Neither engine refits on a held-out tail: Prophet is scored on its in-sample
+# fit of the last ERROR_TAIL_FRACTION of the history, the statistical engine
+# on its one-step-ahead residuals there. Both understate the error of a 7-day
+# forecast, so each is inflated before it becomes a score. The defaults are
+# the median ratio of rolling-origin MAPE (14-day initial window, 7-day
+# horizon, 4 folds) to that tail MAPE, measured on 30-day demo histories:
+# 1.7 for Prophet (quartiles 1.5-2.2) and 1.2 for the statistical engine
+# (0.9-1.8). Both ratios fall to about 1.0-1.1 on 90-day histories.
+CONFIDENCE_INFLATION = float(os.getenv("FORECAST_CONFIDENCE_INFLATION", "1.7"))
+ONE_STEP_CONFIDENCE_INFLATION = float(os.getenv("FORECAST_CONFIDENCE_ONE_STEP_INFLATION", "1.2"))
+CONFIDENCE_CACHE_SIZE = int(os.getenv("FORECAST_CONFIDENCE_CACHE_SIZE", "10000"))
+ERROR_TAIL_FRACTION = 0.2
+
+def series_fingerprint(df: pd.DataFrame) -> str:
+    """Stable fingerprint of a prepared (ds, y) series, used as its data version"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(df['ds'].values.astype('datetime64[ns]').view(np.int64).tobytes())
+    digest.update(df['y'].values.astype(np.float64).tobytes())
+    return digest.hexdigest()
+
+def in_sample_mape(actual: np.ndarray, fitted: np.ndarray) -> float:
+    """
+    MAPE of the in-sample fitted values over the last 20% of the history
+
+    The model has seen these days, so this is not a holdout error; see
+    CONFIDENCE_INFLATION. Days with no sales are divided by 1 rather than
+    ~0 so a single zero-demand day cannot dominate the error.
+    """
+    tail = max(1, int(round(len(actual) * ERROR_TAIL_FRACTION)))
+    actual = np.asarray(actual[-tail:], dtype=float)
+    fitted = np.asarray(fitted[-tail:], dtype=float)
+    return float(np.mean(np.abs(actual - fitted) / np.maximum(np.abs(actual), 1.0)) * 100)
+
+def confidence_from_mape(mape, data_points, inflation: float = CONFIDENCE_INFLATION):
+    """
+    Convert an in-sample MAPE into a calibrated 0.3-0.95 confidence score
+
+    ``inflation`` scales the MAPE to the expected out-of-sample error
+    (CONFIDENCE_INFLATION for Prophet's in-sample fit,
+    ONE_STEP_CONFIDENCE_INFLATION for one-step-ahead residuals). Works
+    element-wise on NumPy arrays as well as on scalars.
+    """
+    calibrated_mape = np.asarray(mape, dtype=float) * inflation
+    score = np.round(np.clip(1 - (calibrated_mape / 100), 0.3, 0.95), 2)
+    score = np.where(np.asarray(data_points) < 7, 0.6, score)
+    return float(score) if score.ndim == 0 else score
+
+class ConfidenceEngine:
+    """Computes forecast confidence once per (product, data version) and caches it"""
+
+    def __init__(self, max_entries: int = CONFIDENCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Tuple[int, str], float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, product_id: int, data_version: str) -> Optional[float]:
+        """Return the cached confidence score, or None if it must be computed"""
+        key = (product_id, data_version)
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+
+        self._scores.move_to_end(key)
+        self.hits += 1
+        return score
+
+    def record(self, product_id: int, data_version: str, mape: float, data_points: int) -> float:
+        """Convert a Prophet in-sample MAPE into a calibrated score and cache it"""
+        score = confidence_from_mape(mape, data_points)
+        self._scores[(product_id, data_version)] = score
+        self._scores.move_to_end((product_id, data_version))
+        while len(self._scores) > self.max_entries:
+            self._scores.popitem(last=False)
+
+        return score
+
+    def get_stats(self) -> Dict:
+        """Return cache size and hit/miss counters"""
+        return {
+            'entries': len(self._scores),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'inflation': CONFIDENCE_INFLATION,
+            'one_step_inflation': ONE_STEP_CONFIDENCE_INFLATION
+        }
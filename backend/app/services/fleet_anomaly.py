@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.anomaly_detection import (
+    ANOMALY_REFIT_INTERVAL,
+    _fit_detector_job,
+    _score_features,
+    anomaly_pool,
+    anomaly_service
+)
+from app.services.model_store import model_store
+from app.services.sales_store import sales_store
+
+logger = logging.getLogger(__name__)
+
+# The global detector is fitted on a random sample of feature rows (Isolation
+# Forest trees only look at 256 rows each) and scored in chunks spread over
+# the anomaly worker pool
+FLEET_ANOMALY_TRAIN_ROWS = int(os.getenv("FLEET_ANOMALY_TRAIN_ROWS", "100000"))
+FLEET_ANOMALY_SCORE_CHUNK_ROWS = int(os.getenv("FLEET_ANOMALY_SCORE_CHUNK_ROWS", "50000"))
+LOAD_BATCH_SIZE = 1000
+
+# Same columns, in the same order, as AnomalyDetectionService._engineer_features
+FEATURE_COLUMNS = [
+    'quantity', 'revenue', 'quantity_7d_mean', 'quantity_7d_std', 'revenue_7d_mean',
+    'dayofweek', 'quantity_trend', 'quantity_trend_3d', 'price_per_unit'
+]
+
+def _rolling_window(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing ``window``-day sums along the day axis"""
+    cumulative = np.cumsum(values, axis=1)
+    shifted = np.zeros_like(cumulative)
+    shifted[:, window:] = cumulative[:, :-window]
+    return cumulative - shifted
+
+def _lagged_diff(values: np.ndarray, valid: np.ndarray, lag: int) -> np.ndarray:
+    """Difference to ``lag`` days earlier, zero where that day is outside the series"""
+    diff = np.zeros_like(values)
+    diff[:, lag:] = values[:, lag:] - values[:, :-lag]
+    has_lag = np.zeros_like(valid)
+    has_lag[:, lag:] = valid[:, :-lag]
+    return np.where(has_lag, diff, 0.0)
+
+def engineer_feature_matrix(quantity: np.ndarray,
+                            revenue: np.ndarray,
+                            valid: np.ndarray,
+                            start_ordinal: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    SKU-normalized anomaly features for many series at once
+
+    Computes the ``_engineer_features`` columns for a (series, day) grid
+    with NumPy, then divides quantity-based columns by each series' mean
+    quantity, revenue-based ones by its mean revenue and price per unit by
+    its average price, so series of any sales volume share one detector.
+
+    Args:
+        quantity: (series, day) daily quantities, zero outside a series
+        revenue: (series, day) daily revenue, zero outside a series
+        valid: (series, day) mask of days within each series' history
+        start_ordinal: Date ordinal of the first grid day
+
+    Returns:
+        (rows, features) matrix of valid days and their (series, day) indices
+    """
+    quantity = np.where(valid, quantity, 0.0)
+    revenue = np.where(valid, revenue, 0.0)
+    counts = _rolling_window(valid.astype(float), 7)
+    safe_counts = np.maximum(counts, 1)
+
+    quantity_sum = _rolling_window(quantity, 7)
+    quantity_7d_mean = quantity_sum / safe_counts
+    quantity_7d_var = (_rolling_window(quantity ** 2, 7) - quantity_sum ** 2 / safe_counts) / np.maximum(counts - 1, 1)
+    quantity_7d_std = np.where(counts > 1, np.sqrt(np.clip(quantity_7d_var, 0, None)), 0.0)
+    revenue_7d_mean = _rolling_window(revenue, 7) / safe_counts
+
+    # date.fromordinal(1) is a Monday, matching pandas dayofweek
+    dayofweek = np.broadcast_to((start_ordinal - 1 + np.arange(quantity.shape[1])) % 7, quantity.shape)
+    price_per_unit = revenue / (quantity + 1e-8)
+
+    # Per-series scales
+    days = np.maximum(valid.sum(axis=1, keepdims=True), 1)
+    quantity_scale = np.maximum(quantity.sum(axis=1, keepdims=True) / days, 1.0)
+    revenue_mean = revenue.sum(axis=1, keepdims=True) / days
+    revenue_scale = np.where(revenue_mean > 0, revenue_mean, 1.0)
+    price_mean = revenue.sum(axis=1, keepdims=True) / np.maximum(quantity.sum(axis=1, keepdims=True), 1e-8)
+    price_scale = np.where(price_mean > 0, price_mean, 1.0)
+
+    columns = [
+        quantity / quantity_scale,
+        revenue / revenue_scale,
+        quantity_7d_mean / quantity_scale,
+        quantity_7d_std / quantity_scale,
+        revenue_7d_mean / revenue_scale,
+        dayofweek,
+        _lagged_diff(quantity, valid, 1) / quantity_scale,
+        _lagged_diff(quantity, valid, 3) / quantity_scale,
+        price_per_unit / price_scale
+    ]
+    series_index, day_index = np.nonzero(valid)
+    features = np.column_stack([column[series_index, day_index] for column in columns])
+    return np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0), np.column_stack([series_index, day_index])
+
+class FleetAnomalyScanner:
+    """
+    Catalog-wide anomaly scan with one global Isolation Forest
+
+    Every product (or product x store) series in the window is turned into
+    SKU-normalized feature rows in one vectorized pass and stacked into a
+    single matrix. One detector, fitted on a sample of that matrix and
+    persisted per level, scores all rows in chunks across the anomaly
+    worker pool, so the cost grows with the number of rows scored instead
+    of with one model fit per series. The stored detector is reused until
+    it is older than ANOMALY_REFIT_INTERVAL_SECONDS, its contamination
+    differs, or a refit is requested.
+    """
+
+    def __init__(self):
+        self.models: Dict[str, Dict] = {}
+        self._lock = asyncio.Lock()
+        self.stats = {'scans': 0, 'fits': 0, 'series_scanned': 0, 'rows_scored': 0, 'last_scan_seconds': None}
+
+    async def scan(self,
+                   product_ids: List[int],
+                   days_to_analyze: int = 30,
+                   level: str = 'product',
+                   contamination: float = 0.02,
+                   refit: bool = False,
+                   include_normal: bool = False) -> Dict:
+        """
+        Score every series of the given products with the global detector
+
+        Args:
+            product_ids: Products to scan
+            days_to_analyze: Days of recent sales per series
+            level: ``product`` (daily totals) or ``store`` (one series per product and store)
+            contamination: Expected proportion of anomalous days across the fleet
+            refit: Fit a new global detector even if the stored one is current
+            include_normal: Also return the non-anomalous points of flagged series
+
+        Returns:
+            Dict with flagged series and their anomaly points, counts and timings
+        """
+        started = time.perf_counter()
+        grid_start = date.today().toordinal() - days_to_analyze
+        keys, quantity, revenue, valid, skipped = await self._load_grid(product_ids, grid_start, days_to_analyze, level)
+        if not keys:
+            return {
+                'level': level, 'series_scanned': 0, 'series_skipped': skipped, 'rows_scored': 0,
+                'anomalies_detected': 0, 'results': [], 'detector': None,
+                'seconds': round(time.perf_counter() - started, 3)
+            }
+
+        features, index = await asyncio.to_thread(engineer_feature_matrix, quantity, revenue, valid, grid_start)
+        frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+        features_seconds = time.perf_counter() - started
+
+        async with self._lock:
+            detector, detector_info = await self._get_detector(level, frame, contamination, refit)
+
+        labels, scores = await self._score(detector, frame)
+        is_anomaly = labels == -1
+        anomaly_scores = anomaly_service._normalize_anomaly_scores(scores)
+
+        results = self._collect(keys, quantity, index, is_anomaly, anomaly_scores, grid_start, include_normal)
+        elapsed = time.perf_counter() - started
+        self.stats['scans'] += 1
+        self.stats['series_scanned'] += len(keys)
+        self.stats['rows_scored'] += len(frame)
+        self.stats['last_scan_seconds'] = round(elapsed, 3)
+
+        return {
+            'level': level,
+            'series_scanned': len(keys),
+            'series_skipped': skipped,
+            'rows_scored': len(frame),
+            'anomalies_detected': int(is_anomaly.sum()),
+            'results': results,
+            'detector': detector_info,
+            'analysis_period': f"{date.fromordinal(grid_start)} to {date.fromordinal(grid_start + quantity.shape[1] - 1)}",
+            'seconds': round(elapsed, 3),
+            'feature_seconds': round(features_seconds, 3)
+        }
+
+    async def _load_grid(self, product_ids: List[int], grid_start: int, days: int, level: str):
+        """Stack the series of all products onto one (series, day) grid"""
+        keys: List[Tuple[int, Optional[str]]] = []
+        views = []
+        skipped = 0
+        for offset in range(0, len(product_ids), LOAD_BATCH_SIZE):
+            batch = product_ids[offset:offset + LOAD_BATCH_SIZE]
+            await sales_store.ensure_loaded(batch)
+            for product_id in batch:
+                store_ids = sales_store.store_ids(product_id) if level == 'store' else [None]
+                for store_id in store_ids:
+                    series = await sales_store.get_series(product_id, days_back=days, store_id=store_id)
+                    if series is None or len(series) < 7:
+                        skipped += 1
+                        continue
+                    keys.append((product_id, store_id))
+                    views.append(series)
+
+        length = max((series.start.toordinal() - grid_start + len(series) for series in views), default=0)
+        quantity = np.zeros((len(views), length))
+        revenue = np.zeros((len(views), length))
+        valid = np.zeros((len(views), length), dtype=bool)
+        for row, series in enumerate(views):
+            first = series.start.toordinal() - grid_start
+            quantity[row, first:first + len(series)] = series.quantity
+            revenue[row, first:first + len(series)] = series.revenue
+            valid[row, first:first + len(series)] = True
+        return keys, quantity, revenue, valid, skipped
+
+    async def _get_detector(self, level: str, frame: pd.DataFrame, contamination: float, refit: bool) -> Tuple[Dict, Dict]:
+        """Return the stored global detector for a level, fitting one on a sample if due"""
+        detector = self.models.get(level)
+        if detector is None:
+            stored = await asyncio.to_thread(model_store.load, 'isolation_forest_fleet', level)
+            if stored is not None:
+                model, metadata = stored
+                detector = self.models[level] = {
+                    **model,
+                    'contamination': metadata.get('contamination'),
+                    'trained_at': datetime.fromisoformat(metadata['trained_at']),
+                    'training_rows': metadata.get('training_rows')
+                }
+
+        if refit:
+            reason = 'forced'
+        elif detector is None:
+            reason = 'missing'
+        elif detector['contamination'] != contamination:
+            reason = 'incompatible'
+        elif (datetime.now() - detector['trained_at']).total_seconds() > ANOMALY_REFIT_INTERVAL:
+            reason = 'schedule'
+        else:
+            reason = None
+
+        if reason is None:
+            return detector, {'mode': 'scored', 'trained_at': detector['trained_at'].isoformat(),
+                              'training_rows': detector['training_rows']}
+
+        sample = frame
+        if len(frame) > FLEET_ANOMALY_TRAIN_ROWS:
+            rows = np.random.default_rng(42).choice(len(frame), FLEET_ANOMALY_TRAIN_ROWS, replace=False)
+            sample = frame.iloc[np.sort(rows)]
+        fitted = await anomaly_pool.run(_fit_detector_job, sample, contamination)
+
+        detector = self.models[level] = {
+            **fitted,
+            'contamination': contamination,
+            'trained_at': datetime.now(),
+            'training_rows': len(sample)
+        }
+        self.stats['fits'] += 1
+        try:
+            await asyncio.to_thread(
+                model_store.save,
+                'isolation_forest_fleet',
+                level,
+                fitted,
+                'joblib',
+                {
+                    'contamination': contamination,
+                    'trained_at': detector['trained_at'].isoformat(),
+                    'training_rows': len(sample)
+                }
+            )
+        except Exception as e:
+            logger.error(f"Failed to persist fleet anomaly detector for level {level}: {e}")
+
+        return detector, {'mode': 'fitted', 'refit_reason': reason,
+                          'trained_at': detector['trained_at'].isoformat(), 'training_rows': len(sample)}
+
+    async def _score(self, detector: Dict, frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Score the feature matrix in chunks, at most one chunk per worker at a time"""
+        chunk = max(1, FLEET_ANOMALY_SCORE_CHUNK_ROWS)
+        semaphore = asyncio.Semaphore(max(1, anomaly_pool.size))
+
+        async def score_chunk(offset: int):
+            async with semaphore:
+                return await anomaly_pool.run(
+                    _score_features, detector['model'], detector['scaler'], frame.iloc[offset:offset + chunk]
+                )
+
+        parts = await asyncio.gather(*(score_chunk(offset) for offset in range(0, len(frame), chunk)))
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def _collect(self, keys, quantity, index, is_anomaly, anomaly_scores, grid_start, include_normal) -> List[Dict]:
+        """Group scored rows back into per-series results, keeping only flagged series"""
+        series_index, day_index = index[:, 0], index[:, 1]
+        flagged_counts = np.bincount(series_index, weights=is_anomaly, minlength=len(keys))
+        rows = np.flatnonzero(is_anomaly if not include_normal else flagged_counts[series_index] > 0)
+
+        points_by_series: Dict[int, List[Dict]] = {}
+        for row in rows.tolist():
+            series, day = int(series_index[row]), int(day_index[row])
+            points_by_series.setdefault(series, []).append({
+                'date': datetime.combine(date.fromordinal(grid_start + day), datetime.min.time()),
+                'value': float(quantity[series, day]),
+                'is_anomaly': bool(is_anomaly[row]),
+                'anomaly_score': float(anomaly_scores[row])
+            })
+
+        results = []
+        for series, points in points_by_series.items():
+            product_id, store_id = keys[series]
+            results.append({
+                'product_id': product_id,
+                'store_id': store_id,
+                'anomalies_detected': int(flagged_counts[series]),
+                'max_anomaly_score': max(point['anomaly_score'] for point in points if point['is_anomaly']),
+                'anomaly_points': points
+            })
+        results.sort(key=lambda result: result['max_anomaly_score'], reverse=True)
+        return results
+
+    def get_stats(self) -> Dict:
+        """Return scan counters and the loaded global detectors"""
+        return {
+            **self.stats,
+            'detectors': {
+                level: {'trained_at': detector['trained_at'].isoformat(), 'training_rows': detector['training_rows']}
+                for level, detector in self.models.items()
+            }
+        }
+
+# Singleton instance
+fleet_scanner = FleetAnomalyScanner()
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+from app.services.forecasting import forecasting_service
+from app.services.sales_store import DailySeries
+
+logger = logging.getLogger(__name__)
+
+# Tiered forecasts: how long to wait for Prophet before answering provisionally,
+# and how long finished jobs stay available for polling
+TIERED_INLINE_WAIT = float(os.getenv("FORECAST_TIERED_WAIT_MS", "200")) / 1000
+JOB_TTL = float(os.getenv("FORECAST_JOB_TTL_SECONDS", "600"))
+JOB_MAX_ENTRIES = int(os.getenv("FORECAST_JOB_MAX_ENTRIES", "10000"))
+
+class ForecastJobRegistry:
+    """
+    Background Prophet forecasts behind an instant provisional answer
+
+    A tiered request starts the Prophet forecast as a job and waits at most
+    ``inline_wait`` seconds for it. Cached models finish well within that
+    and are returned directly; otherwise the caller gets the moving-average
+    forecast marked provisional, with a job ID to poll or stream for the
+    Prophet result. Requests for a product and horizon already being
+    forecast join the running job. Finished jobs are kept for ``ttl_seconds``.
+    A job only completes with a Prophet forecast: when Prophet falls back to
+    the moving average (fit error, too little history) the job fails, so a
+    client never receives the provisional answer again labelled final.
+    """
+
+    def __init__(self,
+                 inline_wait: float = TIERED_INLINE_WAIT,
+                 ttl_seconds: float = JOB_TTL,
+                 max_jobs: int = JOB_MAX_ENTRIES):
+        self.inline_wait = inline_wait
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._active: Dict[tuple, str] = {}
+        self.stats = {
+            'submitted': 0, 'joined': 0, 'completed': 0, 'failed': 0,
+            'answered_inline': 0, 'answered_provisional': 0
+        }
+
+    async def forecast(self,
+                       product_id: int,
+                       sales_data: Union[List[Dict], DailySeries],
+                       days_ahead: int = 7) -> Dict:
+        """
+        Prophet forecast if it is ready quickly, else a provisional one plus a job
+
+        Args:
+            product_id: ID of the product
+            sales_data: Historical sales records or a DailySeries from the sales store
+            days_ahead: Number of days to forecast
+
+        Returns:
+            Forecast dictionary with ``provisional`` and ``job_id`` set
+        """
+        job = self.submit(product_id, sales_data, days_ahead)
+        await self.wait(job['job_id'], self.inline_wait)
+
+        if job['status'] == 'completed':
+            self.stats['answered_inline'] += 1
+            return {**job['result'], 'provisional': False, 'job_id': job['job_id']}
+
+        self.stats['answered_provisional'] += 1
+        provisional = await forecasting_service.provisional_forecast(product_id, sales_data, days_ahead)
+        return {**provisional, 'provisional': True, 'job_id': job['job_id']}
+
+    def submit(self,
+               product_id: int,
+               sales_data: Union[List[Dict], DailySeries],
+               days_ahead: int = 7) -> Dict:
+        """Start a background Prophet forecast, or return the one already running for this request"""
+        job_id = self._active.get((product_id, days_ahead))
+        if job_id is not None and job_id in self._jobs:
+            self.stats['joined'] += 1
+            return self._jobs[job_id]
+
+        self._prune()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'product_id': product_id,
+            'days_ahead': days_ahead,
+            'status': 'pending',
+            'created_at': datetime.now(),
+            'completed_at': None,
+            'elapsed_seconds': None,
+            'result': None,
+            'error': None
+        }
+        self._jobs[job['job_id']] = job
+        self._active[(product_id, days_ahead)] = job['job_id']
+        self._tasks[job['job_id']] = asyncio.create_task(self._run(job, sales_data))
+        self.stats['submitted'] += 1
+        return job
+
+    async def _run(self, job: Dict, sales_data: Union[List[Dict], DailySeries]) -> None:
+        started = time.perf_counter()
+        job['status'] = 'running'
+        try:
+            result = await forecasting_service.generate_forecast(
+                product_id=job['product_id'],
+                sales_data=sales_data,
+                days_ahead=job['days_ahead'],
+                engine='prophet'
+            )
+            if result.get('error') or result.get('fallback') or result.get('method') == 'moving_average':
+                # No better forecast than the provisional one the client already has
+                reason = result.get('error') or result.get('fallback') or 'insufficient_history'
+                job['status'] = 'failed'
+                job['error'] = f"Prophet forecast unavailable: {reason}"
+                self.stats['failed'] += 1
+            else:
+                job['result'] = result
+                job['status'] = 'completed'
+                self.stats['completed'] += 1
+        except asyncio.CancelledError:
+            job['status'] = 'failed'
+            job['error'] = 'cancelled'
+            raise
+        except Exception as e:
+            logger.error(f"Background forecast for product {job['product_id']} failed: {e!r}")
+            job['status'] = 'failed'
+            job['error'] = str(e) or type(e).__name__
+            self.stats['failed'] += 1
+        finally:
+            job['completed_at'] = datetime.now()
+            job['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+            self._tasks.pop(job['job_id'], None)
+            if self._active.get((job['product_id'], job['days_ahead'])) == job['job_id']:
+                del self._active[(job['product_id'], job['days_ahead'])]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a job by ID, or None if unknown or expired"""
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Wait up to ``timeout`` seconds for a job to finish and return it"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.wait({task}, timeout=timeout)
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        """Drop expired finished jobs, and the oldest finished ones beyond the cap"""
+        now = datetime.now()
+        for job_id, job in list(self._jobs.items()):
+            finished = job['completed_at'] is not None
+            expired = finished and (now - job['completed_at']).total_seconds() > self.ttl_seconds
+            if expired or (finished and len(self._jobs) >= self.max_jobs):
+                del self._jobs[job_id]
+
+    async def stop(self) -> None:
+        """Cancel running jobs"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict:
+        """Return job counters and how many jobs are running or retained"""
+        return {
+            **self.stats,
+            'running': len(self._tasks),
+            'retained': len(self._jobs),
+            'inline_wait_ms': round(self.inline_wait * 1000)
+        }
+
+# Singleton instance
+forecast_jobs = ForecastJobRegistry()
@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+import pandas as pd
+
+from app.services.bulk_forecasting import iter_bulk_forecasts, product_engine
+from app.services.catalog import aiter_products, load_sales_series
+from app.services.forecast_store import (
+    MATERIALIZED_HORIZON,
+    load_latest_forecast,
+    prune_forecasts,
+    save_forecasts
+)
+from app.services.forecasting import forecasting_service
+from app.services.restock import restock_engine
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Batch job schedule and read-path staleness threshold
+MATERIALIZE_INTERVAL = float(os.getenv("FORECAST_MATERIALIZE_INTERVAL_SECONDS", str(6 * 3600)))
+# The first scheduled run waits this long (default: one interval) so it
+# does not compete with the first live requests for the forecast pool
+MATERIALIZE_INITIAL_DELAY = float(os.getenv("FORECAST_MATERIALIZE_INITIAL_DELAY_SECONDS", str(MATERIALIZE_INTERVAL)))
+STALENESS_SECONDS = float(os.getenv("FORECAST_STALENESS_SECONDS", str(24 * 3600)))
+RETENTION_DAYS = int(os.getenv("FORECAST_RETENTION_DAYS", "90"))
+WRITE_BATCH_SIZE = 500
+
+# model_version prefixes each engine produces; every engine answers a
+# history shorter than two weeks with the moving average
+ENGINE_MODEL_VERSIONS = {
+    'prophet': ('prophet',),
+    'statistical': ('statistical',),
+    'auto': ('auto:',)
+}
+SHORT_HISTORY_MODEL_VERSION = 'simple_average_v1'
+
+def upcoming(forecast: Dict) -> Dict:
+    """Copy of a forecast without the days before today (a run can be up to a day old)"""
+    today = pd.Timestamp(date.today())
+    columns = forecast.get('columns')
+    if columns is not None:
+        keep = pd.DatetimeIndex(columns['date']) >= today
+        if keep.all():
+            return forecast
+        return {**forecast, 'columns': {name: values[keep] for name, values in columns.items()}}
+
+    points = [point for point in forecast.get('forecast_points', []) if pd.Timestamp(point['date']) >= today]
+    return {**forecast, 'forecast_points': points}
+
+def horizon_days(forecast: Dict) -> int:
+    """Number of forecast days a result covers"""
+    columns = forecast.get('columns')
+    if columns is not None:
+        return len(columns['date'])
+    return len(forecast.get('forecast_points', []))
+
+def produced_by(model_version: Optional[str], engine: str) -> bool:
+    """True if a stored forecast is what ``engine`` produces for its product"""
+    if not model_version:
+        return False
+    if model_version == SHORT_HISTORY_MODEL_VERSION:
+        return True
+    return model_version.startswith(ENGINE_MODEL_VERSIONS.get(engine, (engine,)))
+
+class ForecastMaterializer:
+    """
+    Precomputes forecasts for the whole catalog into the forecasts table
+
+    A background task re-runs the batch every ``interval_seconds``, starting
+    ``initial_delay_seconds`` after start-up. Reads are served from the
+    latest materialized run, from today onwards, and only trigger a refit
+    when that run is missing, older than the staleness threshold or no
+    longer covers the requested days.
+    """
+
+    def __init__(self,
+                 interval_seconds: float = MATERIALIZE_INTERVAL,
+                 staleness_seconds: float = STALENESS_SECONDS,
+                 retention_days: int = RETENTION_DAYS,
+                 initial_delay_seconds: float = MATERIALIZE_INITIAL_DELAY):
+        self.interval_seconds = interval_seconds
+        self.initial_delay_seconds = initial_delay_seconds
+        self.staleness_seconds = staleness_seconds
+        self.retention_days = retention_days
+        self._task: Optional[asyncio.Task] = None
+        self._run_task: Optional[asyncio.Task] = None
+        self._running = False
+        self.last_run: Optional[Dict] = None
+        self.stats = {'reads': 0, 'stale_refits': 0, 'missing_refits': 0}
+        self.single_flight = SingleFlight('forecast_refresh')
+
+    def start(self) -> None:
+        """Start the periodic batch job (no-op when the interval is 0)"""
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._schedule())
+
+    async def stop(self) -> None:
+        """Cancel the periodic batch job"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _schedule(self) -> None:
+        await asyncio.sleep(self.initial_delay_seconds)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Forecast materialization run failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start_run(self, category: Optional[str] = None, engine: Optional[str] = None) -> Optional[asyncio.Task]:
+        """
+        Claim the run and materialize in the background
+
+        The running flag is set before the task is scheduled, so two callers
+        can never both start a run. The task is kept until it finishes so it
+        cannot be garbage-collected mid-run.
+
+        Returns:
+            The run task, or None if a run is already in progress
+        """
+        if self._running:
+            return None
+        self._running = True
+        self._run_task = asyncio.create_task(self._run(category, engine))
+        self._run_task.add_done_callback(self._run_finished)
+        return self._run_task
+
+    def _run_finished(self, task: asyncio.Task) -> None:
+        if self._run_task is task:
+            self._run_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Forecast materialization run failed: {task.exception()}")
+
+    async def run_once(self, category: Optional[str] = None, engine: Optional[str] = None) -> Dict:
+        """
+        Materialize forecasts for every catalog product (or one category)
+
+        Returns:
+            Summary of the run, also kept in ``last_run``
+        """
+        if self._running:
+            return {'status': 'already_running'}
+
+        self._running = True
+        return await self._run(category, engine)
+
+    async def _run(self, category: Optional[str], engine: Optional[str]) -> Dict:
+        """Body of a materialization run; the caller has already set the running flag"""
+        started = time.perf_counter()
+        generated_at = datetime.now()
+        summary = {
+            'status': 'running',
+            'started_at': generated_at.isoformat(),
+            'category': category,
+            'products': 0,
+            'failed': 0,
+            'fallbacks': 0,
+            'rows_written': 0
+        }
+        self.last_run = summary
+
+        try:
+            pending = []
+            async for line in iter_bulk_forecasts(aiter_products(category=category), MATERIALIZED_HORIZON, engine):
+                summary['products'] += 1
+                if line['status'] != 'ok':
+                    summary['failed'] += 1
+                    continue
+                if line['forecast'].get('fallback'):
+                    # Moving average standing in for a failed fit; keep the previous run
+                    summary['fallbacks'] += 1
+                    continue
+
+                pending.append(line['forecast'])
+                if len(pending) >= WRITE_BATCH_SIZE:
+                    summary['rows_written'] += await asyncio.to_thread(save_forecasts, pending, generated_at)
+                    pending = []
+
+            if pending:
+                summary['rows_written'] += await asyncio.to_thread(save_forecasts, pending, generated_at)
+
+            cutoff = generated_at - timedelta(days=self.retention_days)
+            summary['rows_pruned'] = await asyncio.to_thread(prune_forecasts, cutoff)
+            summary['status'] = 'completed'
+            await self._refresh_restock_demand()
+        except asyncio.CancelledError:
+            summary['status'] = 'cancelled'
+            raise
+        except Exception as e:
+            summary['status'] = 'failed'
+            summary['error'] = str(e)
+            raise
+        finally:
+            summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+            self._running = False
+            logger.info(f"Forecast materialization {summary['status']}: {summary}")
+
+        return summary
+
+    async def _refresh_restock_demand(self) -> None:
+        """Reload the restock engine's demand snapshot from the run just written"""
+        try:
+            await restock_engine.refresh()
+        except Exception as e:
+            logger.error(f"Restock demand refresh failed: {e}")
+
+    def is_stale(self, materialized: Dict) -> bool:
+        """True if a materialized run is older than the staleness threshold"""
+        age = datetime.now() - materialized['generated_at'].replace(tzinfo=None)
+        return age.total_seconds() > self.staleness_seconds
+
+    async def get_forecast(self,
+                           product_id: int,
+                           engine: Optional[str] = None,
+                           deadline: Optional[float] = None,
+                           days_ahead: int = 1) -> Dict:
+        """
+        Return the latest materialized forecast, refitting on demand if needed
+
+        Args:
+            product_id: ID of the product
+            engine: If given, a materialized run from another engine is refit
+            deadline: Seconds an on-demand refit may take before the moving
+                average is returned instead (not stored)
+            days_ahead: Days from today the caller needs; a run that no
+                longer covers them is refit
+
+        Returns:
+            Forecast from today onwards (days before today are dropped), or
+            a forecast dictionary with an ``error`` key if the refit failed
+        """
+        self.stats['reads'] += 1
+        materialized = await asyncio.to_thread(load_latest_forecast, product_id)
+
+        if materialized is None:
+            self.stats['missing_refits'] += 1
+        elif self.is_stale(materialized) or (engine and not produced_by(materialized['model_version'], engine)):
+            self.stats['stale_refits'] += 1
+        else:
+            materialized = upcoming(materialized)
+            if horizon_days(materialized) >= days_ahead:
+                return materialized
+            self.stats['stale_refits'] += 1
+
+        return upcoming(await self.refresh_product(product_id, engine, deadline))
+
+    async def refresh_product(self,
+                              product_id: int,
+                              engine: Optional[str] = None,
+                              deadline: Optional[float] = None) -> Dict:
+        """
+        Forecast one product now and store it as its latest materialized run
+
+        Concurrent reads of the same missing or stale forecast share one
+        refit, which runs without a deadline. Each caller's ``deadline`` only
+        limits how long that caller waits; past it the caller gets the moving
+        average (not stored) and the refit still completes and is stored.
+        """
+        refit = self.single_flight.run(
+            (product_id, engine),
+            lambda: self._refresh_product(product_id, engine)
+        )
+        if deadline is None:
+            return await refit
+
+        sales_data = await load_sales_series(product_id)
+        return await forecasting_service.within_deadline(
+            refit, deadline, product_id, sales_data, MATERIALIZED_HORIZON
+        )
+
+    async def _refresh_product(self, product_id: int, engine: Optional[str]) -> Dict:
+        sales_data = await load_sales_series(product_id)
+        result = await forecasting_service.generate_forecast(
+            product_id=product_id,
+            sales_data=sales_data,
+            days_ahead=MATERIALIZED_HORIZON,
+            engine=await product_engine(product_id, engine)
+        )
+        # A fallback answers this read only and never replaces a stored run
+        if result.get('error') or result.get('fallback'):
+            return result
+
+        generated_at = datetime.now()
+        await asyncio.to_thread(save_forecasts, [result], generated_at)
+        return {**result, 'generated_at': generated_at}
+
+    def get_stats(self) -> Dict:
+        """Return schedule configuration, read counters and the last run summary"""
+        return {
+            'interval_seconds': self.interval_seconds,
+            'initial_delay_seconds': self.initial_delay_seconds,
+            'staleness_seconds': self.staleness_seconds,
+            'running': self._running,
+            **self.stats,
+            'coalesced_refits': self.single_flight.stats['coalesced'],
+            'last_run': self.last_run
+        }
+
+# Singleton instance
+forecast_materializer = ForecastMaterializer()
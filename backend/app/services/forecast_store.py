@@ -0,0 +1,189 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, select
+
+from app.database import SessionLocal
+from app.models.database import Forecast
+from app.utils.columnar import result_columns
+
+logger = logging.getLogger(__name__)
+
+# Materialized runs always cover the longest horizon the API serves
+MATERIALIZED_HORIZON = 30
+
+def _to_datetime(value) -> datetime:
+    return pd.Timestamp(value).to_pydatetime()
+
+def save_forecasts(results: List[Dict], generated_at: datetime) -> int:
+    """
+    Write forecast results to the forecasts table as one materialized run
+
+    Args:
+        results: Forecast dictionaries as returned by ForecastingService
+        generated_at: Timestamp shared by every row of this run
+
+    Returns:
+        Number of rows written
+    """
+    rows = []
+    for result in results:
+        columns = result_columns(result)
+        rows.extend(
+            {
+                'product_id': result['product_id'],
+                'forecast_date': _to_datetime(day),
+                'predicted_demand': demand,
+                'confidence_interval_lower': lower,
+                'confidence_interval_upper': upper,
+                'model_version': result.get('model_version'),
+                'confidence_score': result.get('confidence_score'),
+                'created_at': generated_at
+            }
+            for day, demand, lower, upper in zip(
+                columns['date'],
+                np.asarray(columns['predicted_demand']).tolist(),
+                np.asarray(columns['confidence_interval_lower']).tolist(),
+                np.asarray(columns['confidence_interval_upper']).tolist()
+            )
+        )
+    if not rows:
+        return 0
+
+    with SessionLocal() as session:
+        session.bulk_insert_mappings(Forecast, rows)
+        session.commit()
+
+    return len(rows)
+
+def load_latest_forecast(product_id: int) -> Optional[Dict]:
+    """
+    Return the most recent materialized forecast run for a product, or None
+
+    The run comes back as NumPy ``columns`` like a fresh model result, so
+    readers slice arrays and only build per-point dicts for the points format.
+    """
+    with SessionLocal() as session:
+        generated_at = (
+            session.query(func.max(Forecast.created_at))
+            .filter(Forecast.product_id == product_id)
+            .scalar()
+        )
+        if generated_at is None:
+            return None
+
+        rows = (
+            session.query(
+                Forecast.forecast_date,
+                Forecast.predicted_demand,
+                Forecast.confidence_interval_lower,
+                Forecast.confidence_interval_upper,
+                Forecast.model_version,
+                Forecast.confidence_score
+            )
+            .filter(Forecast.product_id == product_id, Forecast.created_at == generated_at)
+            .order_by(Forecast.forecast_date)
+            .all()
+        )
+
+    if not rows:
+        return None
+
+    return {
+        'product_id': product_id,
+        'model_version': rows[0].model_version,
+        'confidence_score': rows[0].confidence_score,
+        'generated_at': generated_at,
+        'columns': {
+            'date': np.array([row.forecast_date.replace(tzinfo=None) for row in rows], dtype='datetime64[ns]'),
+            'predicted_demand': np.fromiter((row.predicted_demand for row in rows), dtype=np.float64, count=len(rows)),
+            'confidence_interval_lower': np.fromiter(
+                (row.confidence_interval_lower for row in rows), dtype=np.float64, count=len(rows)
+            ),
+            'confidence_interval_upper': np.fromiter(
+                (row.confidence_interval_upper for row in rows), dtype=np.float64, count=len(rows)
+            )
+        }
+    }
+
+def load_latest_demand(horizon_days: int = 7) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Total predicted demand over the first ``horizon_days`` of every product's latest run
+
+    Aggregated in the database so the whole catalog comes back as two arrays.
+
+    Returns:
+        ``(product_ids, demand)`` sorted by product ID
+    """
+    latest = (
+        select(Forecast.product_id, func.max(Forecast.created_at).label('created_at'))
+        .group_by(Forecast.product_id)
+        .subquery()
+    )
+    steps = (
+        select(
+            Forecast.product_id,
+            Forecast.predicted_demand,
+            func.row_number().over(
+                partition_by=Forecast.product_id, order_by=Forecast.forecast_date
+            ).label('step')
+        )
+        .join(latest, and_(
+            Forecast.product_id == latest.c.product_id,
+            Forecast.created_at == latest.c.created_at
+        ))
+        .subquery()
+    )
+    query = (
+        select(steps.c.product_id, func.sum(steps.c.predicted_demand))
+        .where(steps.c.step <= horizon_days)
+        .group_by(steps.c.product_id)
+        .order_by(steps.c.product_id)
+    )
+
+    with SessionLocal() as session:
+        rows = session.execute(query).all()
+
+    product_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    demand = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return product_ids, demand
+
+def load_predictions(product_ids: Iterable[int], start: datetime, end: datetime) -> List[Tuple]:
+    """
+    Every materialized prediction for the given products and forecast dates
+
+    Returns:
+        ``(product_id, forecast_date, created_at, predicted_demand)`` rows for
+        forecast dates in ``[start, end)``
+    """
+    with SessionLocal() as session:
+        return [
+            tuple(row) for row in
+            session.query(
+                Forecast.product_id,
+                Forecast.forecast_date,
+                Forecast.created_at,
+                Forecast.predicted_demand
+            )
+            .filter(
+                Forecast.product_id.in_(list(product_ids)),
+                Forecast.forecast_date >= start,
+                Forecast.forecast_date < end
+            )
+            .all()
+        ]
+
+def prune_forecasts(older_than: datetime) -> int:
+    """Delete materialized runs generated before ``older_than``"""
+    with SessionLocal() as session:
+        deleted = (
+            session.query(Forecast)
+            .filter(Forecast.created_at < older_than)
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+
+    return deleted
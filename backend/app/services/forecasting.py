@@ -1,11 +1,34 @@
 import pandas as pd
 import numpy as np
 from prophet import Prophet
-from sklearn.metrics import mean_absolute_error, mean_squared_error
+from prophet.serialize import model_to_json, model_from_json
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import Awaitable, List, Dict, Optional, Tuple, Union
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import time
 import warnings
+from statistics import NormalDist
+
+from app.services.catalog import get_product_category
+from app.services.confidence import (
+    ERROR_TAIL_FRACTION,
+    ONE_STEP_CONFIDENCE_INFLATION,
+    ConfidenceEngine,
+    confidence_from_mape,
+    in_sample_mape,
+    series_fingerprint
+)
+from app.services.model_cache import ModelCache
+from app.services.model_selection import PROPHET_CONFIGS, model_selector, profile_series
+from app.services.model_store import model_store
+from app.services.restock import URGENCY_LEVELS, compute_restock
+from app.services.sales_store import DailySeries
+from app.services.single_flight import SingleFlight
+from app.services.worker_pool import WorkerPool, PoolSaturatedError
 
 # Suppress Prophet warnings
 warnings.filterwarnings('ignore')
@@ -13,110 +36,1016 @@ logging.getLogger('prophet').setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# Worker pool configuration
+FORECAST_POOL_SIZE = int(os.getenv("FORECAST_POOL_SIZE", str(os.cpu_count() or 1)))
+FORECAST_POOL_MAX_QUEUE = int(os.getenv("FORECAST_POOL_MAX_QUEUE", str(max(1, FORECAST_POOL_SIZE) * 8)))
+FORECAST_JOB_TIMEOUT = float(os.getenv("FORECAST_JOB_TIMEOUT_SECONDS", "60"))
+
+# Engine selection: "prophet", "statistical" or "auto" (cheapest adequate model
+# per series), optionally overridden per category
+# e.g. FORECAST_CATEGORY_ENGINES="Beverages:statistical,Snacks:auto"
+FORECAST_ENGINES = ('prophet', 'statistical', 'auto')
+FORECAST_DEFAULT_ENGINE = os.getenv("FORECAST_DEFAULT_ENGINE", "prophet")
+FORECAST_CATEGORY_ENGINES = {
+    category.strip().lower(): engine.strip()
+    for category, _, engine in (
+        item.rpartition(':') for item in os.getenv("FORECAST_CATEGORY_ENGINES", "").split(',') if ':' in item
+    )
+}
+
+# Warm-start refits seed Stan with the previous model's parameters
+FORECAST_WARM_START = os.getenv("FORECAST_WARM_START", "true").lower() in ("1", "true", "yes")
+WARM_START_MAX_LENGTH_CHANGE = 0.2  # Relative change in history length
+WARM_START_MAX_SCALE_CHANGE = 1.5  # Ratio between old and new max(|y|)
+
+# Fitted model cache configuration
+MODEL_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_MODEL_CACHE_MAX_ENTRIES", "5000"))
+MODEL_CACHE_MAX_MB = float(os.getenv("FORECAST_MODEL_CACHE_MAX_MB", "512"))
+MODEL_CACHE_TTL = float(os.getenv("FORECAST_MODEL_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Each fitted model predicts this many days once; shorter requests get a slice of it
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", "30"))
+HORIZON_FIELDS = ('ds', 'yhat', 'yhat_lower', 'yhat_upper')
+
+# Prediction intervals: "sampled" runs Prophet's simulation with
+# FORECAST_UNCERTAINTY_SAMPLES draws over the future dates only, "residual"
+# derives them analytically from the in-sample residuals (no simulation)
+FORECAST_INTERVAL_MODE = os.getenv("FORECAST_INTERVAL_MODE", "sampled")
+FORECAST_UNCERTAINTY_SAMPLES = int(os.getenv("FORECAST_UNCERTAINTY_SAMPLES", "1000"))
+
+# Prophet settings when no configuration was selected or tuned
+DEFAULT_PROPHET_PARAMS = {
+    'daily_seasonality': True,
+    'weekly_seasonality': True,
+    'yearly_seasonality': False,  # Not enough historical data typically
+    'interval_width': 0.8  # 80% confidence interval
+}
+
+# Compute deadline for API forecasts on the Prophet path (0 = none); past it
+# the request is answered with the moving average instead
+FORECAST_DEADLINE_MS = int(os.getenv("FORECAST_DEADLINE_MS", "3000"))
+
+# Hyperparameters found by offline tuning, stored per product or category
+TUNED_PARAMS_KIND = 'prophet_params'
+TUNED_PARAMS_TTL = float(os.getenv("FORECAST_TUNED_PARAMS_TTL_SECONDS", "3600"))
+
+def _warm_up_worker():
+    """Load Prophet and cmdstan in a forecasting worker with a tiny throwaway fit"""
+    warnings.filterwarnings('ignore')
+    logging.getLogger('prophet').setLevel(logging.WARNING)
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    
+    try:
+        df = pd.DataFrame({
+            'ds': pd.date_range('2024-01-01', periods=14, freq='D'),
+            'y': np.arange(14, dtype=float)
+        })
+        Prophet(weekly_seasonality=True, daily_seasonality=False, yearly_seasonality=False).fit(df)
+    except Exception as e:
+        logger.warning(f"Forecasting worker warm-up failed: {e}")
+
+def _point_predict(model: Prophet, df: pd.DataFrame) -> np.ndarray:
+    """Prophet's yhat for the given dates without simulating uncertainty"""
+    samples = model.uncertainty_samples
+    model.uncertainty_samples = 0
+    try:
+        return model.predict(df)['yhat'].to_numpy()
+    finally:
+        model.uncertainty_samples = samples
+
+def _residual_interval(yhat: np.ndarray,
+                       actual: np.ndarray,
+                       fitted: np.ndarray,
+                       interval_width: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Analytic prediction interval from the in-sample residuals
+    
+    ``yhat +/- z * sigma``, with the residual standard deviation widened by
+    ``sqrt(1 + h / n)`` at step ``h`` past ``n`` history days to stand in
+    for the trend uncertainty Prophet would simulate.
+    """
+    sigma = float(np.std(actual - fitted)) if len(actual) > 1 else 0.0
+    z = NormalDist().inv_cdf(0.5 + interval_width / 2)
+    spread = z * sigma * np.sqrt(1 + np.arange(1, len(yhat) + 1) / max(1, len(actual)))
+    return yhat - spread, yhat + spread
+
+def _predict_arrays(model: Prophet,
+                    days_ahead: int,
+                    need_fitted: bool = False,
+                    interval_mode: Optional[str] = None,
+                    samples: Optional[int] = None) -> Tuple[Dict, Optional[np.ndarray]]:
+    """
+    Predict ``days_ahead`` days past the history
+    
+    Only the future dates are predicted with intervals; the history gets a
+    point prediction, and only when the in-sample fit is needed (in-sample
+    error or residual intervals).
+    
+    Returns:
+        Tuple of (future arrays, fitted values over the history or None)
+    """
+    interval_mode = interval_mode or FORECAST_INTERVAL_MODE
+    samples = FORECAST_UNCERTAINTY_SAMPLES if samples is None else samples
+    residual = interval_mode == 'residual' or samples <= 0
+    
+    future = model.make_future_dataframe(periods=days_ahead, include_history=False)
+    history = model.history[['ds']]
+    fitted = None
+    
+    if residual:
+        # One point prediction over history and future dates
+        yhat = _point_predict(model, pd.concat([history, future], ignore_index=True))
+        fitted, yhat = yhat[:len(history)], yhat[len(history):]
+        yhat_lower, yhat_upper = _residual_interval(
+            yhat, model.history['y'].to_numpy(), fitted, model.interval_width
+        )
+    else:
+        if need_fitted:
+            fitted = _point_predict(model, history)
+        model.uncertainty_samples = samples
+        forecast = model.predict(future)
+        yhat = forecast['yhat'].to_numpy()
+        yhat_lower, yhat_upper = forecast['yhat_lower'].to_numpy(), forecast['yhat_upper'].to_numpy()
+    
+    return {
+        'ds': future['ds'].values,
+        'yhat': yhat,
+        'yhat_lower': yhat_lower,
+        'yhat_upper': yhat_upper
+    }, fitted
+
+def _expected_changepoints(data_points: int, n_changepoints: int = 25, changepoint_range: float = 0.8) -> int:
+    """Number of changepoints Prophet will actually use for a history of this length"""
+    hist_size = int(np.floor(data_points * changepoint_range))
+    return min(n_changepoints, hist_size - 1)
+
+def _stan_init(model: Prophet) -> Dict[str, np.ndarray]:
+    """Extract fitted parameters in the form Prophet accepts as ``fit(init=...)``"""
+    return {
+        'k': float(model.params['k'][0][0]),
+        'm': float(model.params['m'][0][0]),
+        'sigma_obs': float(model.params['sigma_obs'][0][0]),
+        'delta': np.asarray(model.params['delta'][0], dtype=float),
+        'beta': np.asarray(model.params['beta'][0], dtype=float)
+    }
+
+def prophet_params(config_name: Optional[str] = None, tuned: Optional[Dict] = None) -> Dict:
+    """
+    Prophet constructor arguments for a fit
+
+    Starts from the defaults, applies an auto-selected seasonality
+    configuration (only the seasonalities the series shows) and then the
+    hyperparameters found by offline tuning.
+    """
+    params = dict(DEFAULT_PROPHET_PARAMS)
+    if config_name is not None:
+        params.update(daily_seasonality=False, **PROPHET_CONFIGS[config_name])
+    params.update(tuned or {})
+    return params
+
+def _new_prophet(params: Optional[Dict] = None) -> Prophet:
+    return Prophet(**(params or DEFAULT_PROPHET_PARAMS))
+
+def category_params_key(category: str) -> str:
+    """Model store key of the hyperparameters tuned for a whole category"""
+    return f"category-{category}"
+
+def load_tuned_params(product_id: int) -> Optional[Dict]:
+    """Tuned Prophet hyperparameters for a product, else for its category (blocking)"""
+    metadata = model_store.latest_metadata(TUNED_PARAMS_KIND, product_id)
+    if metadata is None:
+        category = get_product_category(product_id)
+        if category:
+            metadata = model_store.latest_metadata(TUNED_PARAMS_KIND, category_params_key(category))
+    return metadata.get('params') if metadata else None
+
+def _prophet_forecast_job(ds: np.ndarray,
+                          y: np.ndarray,
+                          days_ahead: int,
+                          init: Optional[Dict[str, np.ndarray]] = None,
+                          params: Optional[Dict] = None) -> Dict:
+    """
+    Fit Prophet and predict ``days_ahead`` days (runs inside a worker process)
+    
+    Returns plain arrays plus the serialized model so the result is cheap to
+    send back to the event loop and can be cached for later predictions.
+    The in-sample error for confidence scoring comes from the residuals of this
+    same fit, so no second model is trained; it is always recorded so a
+    stored model can restore its confidence without a refit. When ``init`` holds the
+    parameters of the product's previous model, the optimizer starts from
+    them (warm start) and falls back to a cold fit if that fails. ``params``
+    overrides the default Prophet constructor arguments.
+    """
+    df = pd.DataFrame({'ds': ds, 'y': y})
+    started = time.perf_counter()
+    fit_mode = 'cold'
+    
+    model = _new_prophet(params)
+    if init is not None:
+        try:
+            model.fit(df, init=init)
+            fit_mode = 'warm'
+        except Exception as e:
+            logger.warning(f"Warm-start fit failed, refitting cold: {e}")
+            model = _new_prophet(params)
+    if fit_mode == 'cold':
+        model.fit(df)
+    fit_seconds = time.perf_counter() - started
+    
+    result, fitted = _predict_arrays(model, days_ahead, need_fitted=True)
+    
+    result.update({
+        'model_json': model_to_json(model),
+        'in_sample_mape': in_sample_mape(y, fitted),
+        'fit_mode': fit_mode,
+        'fit_seconds': fit_seconds,
+        'warm_start': _stan_init(model),
+        'y_scale': float(model.y_scale)
+    })
+    return result
+
+def _prophet_predict_job(model_json: str, days_ahead: int) -> Dict:
+    """Predict with a previously fitted, serialized model (runs inside a worker process)"""
+    model = model_from_json(model_json)
+    result, _ = _predict_arrays(model, days_ahead)
+    return result
+
+def _entry_size(entry: Dict) -> int:
+    """Cache footprint of a model entry: serialized model plus its predicted horizon"""
+    horizon = entry.get('horizon') or {}
+    return len(entry['model_json']) + sum(values.nbytes for values in horizon.values())
+
+# Shared pool of warmed-up forecasting processes
+forecast_pool = WorkerPool(
+    name='forecasting',
+    size=FORECAST_POOL_SIZE,
+    max_queue=FORECAST_POOL_MAX_QUEUE,
+    timeout=FORECAST_JOB_TIMEOUT,
+    initializer=_warm_up_worker
+)
+
+def resolve_engine(engine: Optional[str] = None, category: Optional[str] = None) -> str:
+    """Pick the forecasting engine from the request, the category default or the server default"""
+    if engine:
+        return engine
+    if category and category.lower() in FORECAST_CATEGORY_ENGINES:
+        return FORECAST_CATEGORY_ENGINES[category.lower()]
+    return FORECAST_DEFAULT_ENGINE
+
+class StatisticalForecaster:
+    """
+    Vectorized seasonal-naive, Holt-Winters and Croston forecasts
+    
+    All series are fitted together over a 2D matrix of shape (series, days),
+    so the per-step cost is a handful of NumPy operations over every series
+    at once. Each series gets the cheapest method that suits it: Croston
+    (SBA) for intermittent demand, damped additive Holt-Winters when there
+    are at least two full seasons, and seasonal naive otherwise.
+    """
+    
+    MODEL_VERSION = 'statistical_v1'
+    METHODS = ('seasonal_naive', 'holt_winters', 'croston')
+    Z_80 = 1.2816  # Two-sided 80% interval, matching Prophet's interval_width
+    
+    def __init__(self,
+                 season_length: int = 7,
+                 alpha: float = 0.3,
+                 beta: float = 0.05,
+                 gamma: float = 0.2,
+                 phi: float = 0.98,
+                 croston_alpha: float = 0.1,
+                 sparse_threshold: float = 0.5):
+        self.season_length = season_length
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.croston_alpha = croston_alpha
+        self.sparse_threshold = sparse_threshold
+    
+    def forecast(self, values: np.ndarray, horizon: int) -> Dict[str, np.ndarray]:
+        """
+        Forecast every row of ``values`` ``horizon`` days ahead
+        
+        Args:
+            values: Daily demand matrix of shape (series, days), no NaNs
+            horizon: Number of days to forecast
+            
+        Returns:
+            Dictionary of arrays: ``yhat``, ``yhat_lower``, ``yhat_upper``
+            (series x horizon), ``method`` (index into METHODS) and
+            ``one_step_mape`` (per series, over the last ERROR_TAIL_FRACTION of days)
+        """
+        values = np.asarray(values, dtype=float)
+        n_series, n_days = values.shape
+        m = self.season_length
+        
+        zero_fraction = (values <= 0).mean(axis=1)
+        method = np.zeros(n_series, dtype=np.int8)
+        method[n_days >= 2 * m] = 1
+        method[zero_fraction >= self.sparse_threshold] = 2
+        
+        yhat = np.empty((n_series, horizon))
+        fitted = np.full((n_series, n_days), np.nan)
+        
+        for code, fit in enumerate((self._seasonal_naive, self._holt_winters, self._croston)):
+            rows = np.flatnonzero(method == code)
+            if len(rows):
+                yhat[rows], fitted[rows] = fit(values[rows], horizon)
+        
+        # One-step-ahead residuals give both the interval width and the error score
+        residuals = values - fitted
+        sigma = np.nan_to_num(np.sqrt(np.nanmean(residuals ** 2, axis=1)), nan=0.0)
+        spread = self.Z_80 * sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))[None, :]
+        
+        tail = max(1, int(round(n_days * ERROR_TAIL_FRACTION)))
+        actual_tail = values[:, -tail:]
+        error = np.abs(actual_tail - fitted[:, -tail:]) / np.maximum(np.abs(actual_tail), 1.0)
+        mape = np.nan_to_num(np.nanmean(error, axis=1), nan=100.0) * 100
+        
+        yhat = np.maximum(yhat, 0)
+        return {
+            'yhat': yhat,
+            'yhat_lower': np.maximum(yhat - spread, 0),
+            'yhat_upper': yhat + spread,
+            'method': method,
+            'one_step_mape': mape
+        }
+    
+    def _seasonal_naive(self, values: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Repeat the last observed season"""
+        n_days = values.shape[1]
+        m = min(self.season_length, n_days)
+        steps = np.arange(horizon) % m
+        yhat = values[:, n_days - m + steps]
+        
+        fitted = np.full(values.shape, np.nan)
+        if m < n_days:
+            fitted[:, m:] = values[:, :-m]
+        return yhat, fitted
+    
+    def _holt_winters(self, values: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Damped additive Holt-Winters with fixed smoothing parameters"""
+        m = self.season_length
+        alpha, beta, gamma, phi = self.alpha, self.beta, self.gamma, self.phi
+        n_days = values.shape[1]
+        
+        level = values[:, :m].mean(axis=1)
+        trend = (values[:, m:2 * m].mean(axis=1) - level) / m
+        season = values[:, :m] - level[:, None]
+        fitted = np.empty(values.shape)
+        
+        for t in range(n_days):
+            s = t % m
+            y = values[:, t]
+            fitted[:, t] = level + phi * trend + season[:, s]
+            new_level = alpha * (y - season[:, s]) + (1 - alpha) * (level + phi * trend)
+            trend = beta * (new_level - level) + (1 - beta) * phi * trend
+            season[:, s] = gamma * (y - new_level) + (1 - gamma) * season[:, s]
+            level = new_level
+        
+        steps = np.arange(1, horizon + 1)
+        damped = np.cumsum(phi ** steps)
+        seasonal_index = (n_days + steps - 1) % m
+        yhat = level[:, None] + damped[None, :] * trend[:, None] + season[:, seasonal_index]
+        
+        # The first season only initialises the state
+        fitted[:, :m] = np.nan
+        return yhat, fitted
+    
+    def _croston(self, values: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Croston's method with the Syntetos-Boylan bias correction"""
+        a = self.croston_alpha
+        n_series, n_days = values.shape
+        nonzero = values > 0
+        
+        demand_count = nonzero.sum(axis=1)
+        size = np.where(demand_count > 0, values.sum(axis=1) / np.maximum(demand_count, 1), 0.0)
+        interval = n_days / np.maximum(demand_count, 1)
+        since_last = np.zeros(n_series)
+        fitted = np.empty(values.shape)
+        
+        for t in range(n_days):
+            fitted[:, t] = (1 - a / 2) * size / interval
+            since_last += 1
+            has_demand = nonzero[:, t]
+            size = np.where(has_demand, size + a * (values[:, t] - size), size)
+            interval = np.where(has_demand, interval + a * (since_last - interval), interval)
+            since_last = np.where(has_demand, 0, since_last)
+        
+        rate = (1 - a / 2) * size / interval
+        return np.repeat(rate[:, None], horizon, axis=1), fitted
+
+def resolve_deadline(deadline_ms: Optional[int] = None) -> Optional[float]:
+    """Deadline in seconds for a request, falling back to FORECAST_DEADLINE_MS (0 = none)"""
+    deadline_ms = FORECAST_DEADLINE_MS if deadline_ms is None else deadline_ms
+    return deadline_ms / 1000 if deadline_ms > 0 else None
+
 class ForecastingService:
-    def __init__(self):
-        """Initialize the forecasting service"""
-        self.models = {}  # Store trained models per product
+    def __init__(self, model_kind: str = 'prophet'):
+        """
+        Initialize the forecasting service
+        
+        Args:
+            model_kind: Model store family fitted Prophet models are saved
+                under; services forecasting something other than products
+                use their own so their keys never mix with product IDs
+        """
+        self.model_kind = model_kind
+        # Fitted models keyed by (product_id, fingerprint of the input series)
+        self.models = ModelCache(
+            max_entries=MODEL_CACHE_MAX_ENTRIES,
+            max_bytes=int(MODEL_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=MODEL_CACHE_TTL
+        )
+        self.confidence = ConfidenceEngine()
+        self.statistical = StatisticalForecaster()
+        self.warm_starts = {}  # Latest fitted parameters per product
+        self.tuned_params = {}  # Product ID -> (tuned hyperparameters or None, loaded at)
+        self.fit_stats = {
+            mode: {'fits': 0, 'total_seconds': 0.0} for mode in ('warm', 'cold')
+        }
+        self.fit_stats['warm_start_fallbacks'] = 0
+        self.config_fit_stats = {}  # Prophet configuration -> cold fit count and seconds
+        self.horizon_stats = {'computed': 0, 'sliced': 0}
+        self.deadline_stats = {'requests': 0, 'met': 0, 'missed': 0, 'cold_start_exempt': 0}
+        self.single_flight = SingleFlight('forecasting')
         
     async def generate_forecast(self, 
                               product_id: int, 
-                              sales_data: List[Dict], 
-                              days_ahead: int = 7) -> Dict:
+                              sales_data: Union[List[Dict], DailySeries], 
+                              days_ahead: int = 7,
+                              engine: str = 'prophet',
+                              deadline: Optional[float] = None) -> Dict:
         """
         Generate demand forecast using Facebook Prophet
         
         Args:
             product_id: ID of the product
-            sales_data: Historical sales data
+            sales_data: Historical sales records or a DailySeries from the sales store
             days_ahead: Number of days to forecast
+            engine: "prophet", "statistical" (vectorized Holt-Winters/Croston) or
+                "auto" (cheapest adequate model for the series)
+            deadline: Seconds the Prophet path may take (None = no limit); when
+                it runs out the moving-average forecast is returned with
+                ``fallback="deadline"``
             
         Returns:
             Dictionary with forecast results
         """
+        if engine == 'statistical':
+            results = await self.generate_statistical_forecasts({product_id: sales_data}, days_ahead)
+            return results[0]
+        
         try:
             # Prepare data for Prophet
             df = self._prepare_data(sales_data)
             
-            if len(df) < 14:  # Need at least 2 weeks of data
+            if engine != 'auto' and len(df) < 14:  # Need at least 2 weeks of data
                 return await self._simple_forecast(product_id, sales_data, days_ahead)
             
-            # Create and train Prophet model
-            model = Prophet(
-                daily_seasonality=True,
-                weekly_seasonality=True,
-                yearly_seasonality=False,  # Not enough historical data typically
-                interval_width=0.8  # 80% confidence interval
+            if engine == 'auto':
+                forecast = self._auto_forecast(product_id, sales_data, df, days_ahead)
+            else:
+                forecast = self._prophet_pipeline(product_id, df, days_ahead)
+            return await self.within_deadline(forecast, deadline, product_id, sales_data, days_ahead)
+            
+        except PoolSaturatedError:
+            raise
+        except Exception as e:
+            logger.error(f"Prophet forecasting failed for product {product_id}: {e!r}")
+            result = await self._simple_forecast(product_id, sales_data, days_ahead)
+            result['fallback'] = 'error'
+            return result
+    
+    async def within_deadline(self,
+                              forecast: Awaitable[Dict],
+                              deadline: Optional[float],
+                              product_id: int,
+                              sales_data: Union[List[Dict], DailySeries],
+                              days_ahead: int) -> Dict:
+        """
+        Await a Prophet-path forecast for ``deadline`` seconds, else answer with the moving average
+        
+        The deadline belongs to this caller only: the shared fit it waits on
+        is never given a deadline, so it completes for callers without one
+        (or with a later one) and is cached for the next request. Until the
+        worker pool has warmed up (Prophet loaded in every worker) no
+        deadline applies, so reads right after startup are not all fallbacks.
+        """
+        if deadline is None:
+            return await forecast
+        if not forecast_pool.is_warm():
+            self.deadline_stats['cold_start_exempt'] += 1
+            return await forecast
+        
+        self.deadline_stats['requests'] += 1
+        try:
+            result = await asyncio.wait_for(forecast, deadline)
+        except asyncio.TimeoutError:
+            self.deadline_stats['missed'] += 1
+            logger.warning(f"Forecast for product {product_id} missed its deadline, using the moving average")
+            result = await self._simple_forecast(product_id, sales_data, days_ahead)
+            result['fallback'] = 'deadline'
+            result['note'] = 'Moving average: the Prophet forecast did not finish within the deadline'
+            return result
+        
+        self.deadline_stats['met'] += 1
+        return result
+    
+    async def _auto_forecast(self,
+                             product_id: int,
+                             sales_data: Union[List[Dict], DailySeries],
+                             df: pd.DataFrame,
+                             days_ahead: int) -> Dict:
+        """
+        Forecast with the cheapest adequate model for the series (engine="auto")
+        
+        The choice and its estimated fit cost are recorded in ``model_version``
+        (e.g. ``auto:prophet_weekly:420ms``); the profile behind it is
+        returned under ``selection``.
+        """
+        started = time.perf_counter()
+        values = df.set_index('ds')['y'].asfreq('D', fill_value=0).to_numpy() if len(df) else np.zeros(0)
+        profile = profile_series(values, self.statistical.sparse_threshold)
+        tuned = await self._tuned_params(product_id)
+        choice = model_selector.select(
+            profile,
+            fit_costs=self._observed_fit_costs(),
+            is_cached=lambda model: (
+                (product_id, self._data_version(df, self._settings_name(model, tuned))) in self.models
             )
+        )
+        
+        model = choice['model']
+        if model == 'simple':
+            result = await self._simple_forecast(product_id, sales_data, days_ahead)
+        elif model == 'statistical':
+            result = (await self.generate_statistical_forecasts({product_id: sales_data}, days_ahead))[0]
+        else:
+            result = await self._prophet_pipeline(product_id, df, days_ahead, model)
+        
+        result['model_version'] = f"auto:{model}:{round(choice['estimated_seconds'] * 1000)}ms"
+        result['selection'] = {
+            **choice,
+            'profile': profile,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+        return result
+    
+    def _observed_fit_costs(self) -> Dict[str, float]:
+        """Average seconds per cold Prophet fit for each configuration fitted so far"""
+        return {
+            config_name: stats['total_seconds'] / stats['fits']
+            for config_name, stats in self.config_fit_stats.items()
+        }
+    
+    def _data_version(self, df: pd.DataFrame, config_name: Optional[str] = None) -> str:
+        """Data version of a series for one Prophet configuration (see ``_settings_name``)"""
+        fingerprint = series_fingerprint(df)
+        return fingerprint if config_name is None else f"{fingerprint}:{config_name}"
+    
+    def _settings_name(self, config_name: Optional[str], tuned: Optional[Dict]) -> Optional[str]:
+        """Name of a configuration plus tuned hyperparameters, e.g. ``prophet_weekly+tuned-1a2b3c4d``"""
+        if not tuned:
+            return config_name
+        digest = hashlib.blake2b(json.dumps(tuned, sort_keys=True).encode(), digest_size=4).hexdigest()
+        return f"{config_name or 'default'}+tuned-{digest}"
+    
+    async def _tuned_params(self, product_id: int) -> Optional[Dict]:
+        """
+        Hyperparameters stored by the offline tuning job for a product
+        
+        Looked up once per ``TUNED_PARAMS_TTL`` seconds so online fits pay no
+        search cost and only a small metadata read when the entry expires.
+        """
+        if not isinstance(product_id, (int, np.integer)):
+            return None
+        cached = self.tuned_params.get(product_id)
+        if cached is not None and time.monotonic() - cached[1] < TUNED_PARAMS_TTL:
+            return cached[0]
+        
+        try:
+            tuned = await asyncio.to_thread(load_tuned_params, product_id)
+        except Exception as e:
+            logger.warning(f"Tuned parameter lookup failed for product {product_id}: {e}")
+            tuned = None
+        self.tuned_params[product_id] = (tuned, time.monotonic())
+        return tuned
+    
+    async def _prophet_pipeline(self,
+                                product_id: int,
+                                df: pd.DataFrame,
+                                days_ahead: int,
+                                config_name: Optional[str] = None) -> Dict:
+        """Prophet forecast from the shared full-horizon prediction for this data and configuration"""
+        tuned = await self._tuned_params(product_id)
+        settings = self._settings_name(config_name, tuned)
+        
+        # Concurrent requests for the same data share one fit, whatever their horizon
+        data_version = self._data_version(df, settings)
+        horizon_days = max(days_ahead, FORECAST_HORIZON_DAYS)
+        horizon, confidence_score = await self.single_flight.run(
+            ('prophet', product_id, data_version, horizon_days),
+            lambda: self._prophet_horizon(
+                product_id, df, data_version, horizon_days, settings, prophet_params(config_name, tuned)
+            )
+        )
+        result = self._prophet_result(product_id, horizon, days_ahead, confidence_score, len(df))
+        if tuned:
+            result['tuned_params'] = tuned
+        return result
+    
+    async def _prophet_horizon(self,
+                               product_id: int,
+                               df: pd.DataFrame,
+                               data_version: str,
+                               horizon_days: int,
+                               config_name: Optional[str] = None,
+                               params: Optional[Dict] = None) -> Tuple[Dict, float]:
+        """
+        Full-horizon Prophet prediction for one version of the data
+        
+        The horizon is predicted once per fitted model and kept with it, so
+        requests for any shorter ``days_ahead`` are answered by slicing and
+        only a fit (or a cached model without a stored horizon) costs a
+        prediction.
+        
+        Returns:
+            Tuple of (horizon arrays, confidence score)
+        """
+        # Confidence only needs computing once per version of the data
+        cached = self.models.get((product_id, data_version))
+        if cached is None:
+            # Another worker or a previous run may already have fitted this data
+            cached = await self._load_stored_model(product_id, data_version)
+        
+        confidence_score = self.confidence.get(product_id, data_version)
+        if confidence_score is None and cached is not None and cached.get('in_sample_mape') is not None:
+            confidence_score = self.confidence.record(
+                product_id, data_version, cached['in_sample_mape'], len(df)
+            )
+        
+        if cached is not None and confidence_score is not None:
+            horizon = cached.get('horizon')
+            if horizon is not None and len(horizon['yhat']) >= horizon_days:
+                self.horizon_stats['sliced'] += 1
+                return horizon, confidence_score
             
-            model.fit(df)
+            # Unchanged data: skip the fit and only predict the horizon
+            horizon = await forecast_pool.run(
+                _prophet_predict_job, cached['model_json'], horizon_days
+            )
+            cached['horizon'] = horizon
+            self.models.put((product_id, data_version), cached, size_bytes=_entry_size(cached))
+        else:
+            # Fit and predict in a worker process so the event loop stays free
+            init = self._warm_start_params(product_id, df, config_name)
+            result = await forecast_pool.run(
+                _prophet_forecast_job,
+                df['ds'].values,
+                df['y'].values.astype(float),
+                horizon_days,
+                init,
+                params
+            )
+            self._record_fit(product_id, df, result, warm_requested=init is not None, config_name=config_name)
             
-            # Store model for future use
-            self.models[product_id] = {
-                'model': model,
+            if confidence_score is None:
+                confidence_score = self.confidence.record(
+                    product_id, data_version, result['in_sample_mape'], len(df)
+                )
+            
+            # Store model and its horizon for future use, in memory and on disk
+            horizon = {field: result[field] for field in HORIZON_FIELDS}
+            entry = {
+                'model_json': result['model_json'],
+                'horizon': horizon,
                 'trained_at': datetime.now(),
-                'data_points': len(df)
+                'data_points': len(df),
+                'fit_mode': result['fit_mode'],
+                'fit_seconds': round(result['fit_seconds'], 3),
+                'in_sample_mape': result['in_sample_mape'],
+                'config': config_name
             }
+            self.models.put((product_id, data_version), entry, size_bytes=_entry_size(entry))
+            await self._save_model(product_id, data_version, entry, result)
+        
+        self.horizon_stats['computed'] += 1
+        return horizon, confidence_score
+    
+    def _prophet_result(self,
+                        product_id: int,
+                        horizon: Dict,
+                        days_ahead: int,
+                        confidence_score: float,
+                        data_points: int) -> Dict:
+        """Build the forecast response from the first ``days_ahead`` days of a horizon"""
+        columns = {
+            'date': horizon['ds'][:days_ahead],
+            'predicted_demand': np.maximum(0, np.round(horizon['yhat'][:days_ahead], 2)),
+            'confidence_interval_lower': np.maximum(0, np.round(horizon['yhat_lower'][:days_ahead], 2)),
+            'confidence_interval_upper': np.maximum(0, np.round(horizon['yhat_upper'][:days_ahead], 2))
+        }
+        
+        return {
+            'product_id': product_id,
+            'model_version': 'prophet_v1',
+            'columns': columns,
+            'total_predicted_demand': round(float(columns['predicted_demand'].sum()), 2),
+            'confidence_score': confidence_score,
+            'method': 'prophet',
+            'data_points_used': data_points
+        }
+    
+    async def _load_stored_model(self, product_id: int, data_version: str) -> Optional[Dict]:
+        """
+        Lazily load a product's model from the on-disk store
+        
+        Restores the warm-start parameters whenever a stored model exists, and
+        returns the model itself (also adding it to the in-memory cache) only
+        if it was fitted on exactly this version of the data.
+        """
+        metadata = await asyncio.to_thread(model_store.latest_metadata, self.model_kind, product_id)
+        if metadata is None:
+            return None
+        
+        if product_id not in self.warm_starts and metadata.get('warm_start'):
+            self.warm_starts[product_id] = {
+                'params': {
+                    name: np.asarray(value) if isinstance(value, list) else value
+                    for name, value in metadata['warm_start'].items()
+                },
+                'y_scale': metadata['y_scale'],
+                'data_points': metadata['data_points'],
+                'config': metadata.get('config')
+            }
+        
+        if metadata.get('fingerprint') != data_version:
+            return None
+        
+        stored = await asyncio.to_thread(model_store.load, self.model_kind, product_id)
+        if stored is None or stored[1].get('fingerprint') != data_version:
+            return None
+        
+        model_json, metadata = stored
+        entry = {
+            'model_json': model_json,
+            'horizon': self._restore_horizon(metadata.get('horizon')),
+            'trained_at': datetime.fromisoformat(metadata['trained_at']),
+            'data_points': metadata['data_points'],
+            'fit_mode': metadata.get('fit_mode'),
+            'fit_seconds': metadata.get('fit_seconds'),
+            # Models saved before the rename recorded the same metric as holdout_mape
+            'in_sample_mape': metadata.get('in_sample_mape', metadata.get('holdout_mape')),
+            'config': metadata.get('config')
+        }
+        self.models.put((product_id, data_version), entry, size_bytes=_entry_size(entry))
+        return entry
+    
+    def _restore_horizon(self, stored: Optional[Dict]) -> Optional[Dict]:
+        """Turn a horizon saved in model metadata back into arrays"""
+        if not stored:
+            return None
+        horizon = {field: np.asarray(stored[field], dtype=float) for field in HORIZON_FIELDS[1:]}
+        horizon['ds'] = np.asarray(stored['ds'], dtype='datetime64[ns]')
+        return horizon
+    
+    async def _save_model(self, product_id: int, data_version: str, entry: Dict, result: Dict) -> None:
+        """Persist a freshly fitted model so other workers and restarts can reuse it"""
+        metadata = {
+            'fingerprint': data_version,
+            'trained_at': entry['trained_at'].isoformat(),
+            'data_points': entry['data_points'],
+            'fit_mode': entry['fit_mode'],
+            'fit_seconds': entry['fit_seconds'],
+            'in_sample_mape': entry['in_sample_mape'],
+            'config': entry['config'],
+            'y_scale': result['y_scale'],
+            'horizon': {
+                'ds': np.datetime_as_string(entry['horizon']['ds']).tolist(),
+                **{field: np.asarray(entry['horizon'][field], dtype=float).tolist() for field in HORIZON_FIELDS[1:]}
+            },
+            'warm_start': {
+                name: value.tolist() if isinstance(value, np.ndarray) else value
+                for name, value in result['warm_start'].items()
+            }
+        }
+        try:
+            await asyncio.to_thread(model_store.save, self.model_kind, product_id, entry['model_json'], 'json', metadata)
+        except Exception as e:
+            logger.error(f"Failed to persist Prophet model for product {product_id}: {e}")
+    
+    def _warm_start_params(self,
+                           product_id: int,
+                           df: pd.DataFrame,
+                           config_name: Optional[str] = None) -> Optional[Dict]:
+        """
+        Return the previous model's parameters if the series is structurally compatible
+        
+        A cold fit is used when there is no previous model, when it used a
+        different seasonality configuration or tuned hyperparameters, when the history length changed
+        enough to alter the number of changepoints or by more than 20%, or
+        when the demand scale moved by more than 1.5x.
+        """
+        previous = self.warm_starts.get(product_id)
+        if not FORECAST_WARM_START or previous is None:
+            return None
+        if previous.get('config') != config_name:
+            return None
+        
+        data_points = len(df)
+        if abs(data_points - previous['data_points']) > WARM_START_MAX_LENGTH_CHANGE * previous['data_points']:
+            return None
+        if len(previous['params']['delta']) != _expected_changepoints(data_points):
+            return None
+        
+        y_scale = float(np.abs(df['y']).max())
+        ratio = y_scale / previous['y_scale'] if previous['y_scale'] else np.inf
+        if not (1 / WARM_START_MAX_SCALE_CHANGE <= ratio <= WARM_START_MAX_SCALE_CHANGE):
+            return None
+        
+        return previous['params']
+    
+    def _record_fit(self,
+                    product_id: int,
+                    df: pd.DataFrame,
+                    result: Dict,
+                    warm_requested: bool,
+                    config_name: Optional[str] = None) -> None:
+        """Keep the fitted parameters for the next warm start and update fit timing stats"""
+        self.warm_starts[product_id] = {
+            'params': result['warm_start'],
+            'y_scale': result['y_scale'],
+            'data_points': len(df),
+            'config': config_name
+        }
+        
+        stats = self.fit_stats[result['fit_mode']]
+        stats['fits'] += 1
+        stats['total_seconds'] += result['fit_seconds']
+        if warm_requested and result['fit_mode'] == 'cold':
+            self.fit_stats['warm_start_fallbacks'] += 1
+        if result['fit_mode'] == 'cold' and config_name is not None:
+            config_stats = self.config_fit_stats.setdefault(config_name, {'fits': 0, 'total_seconds': 0.0})
+            config_stats['fits'] += 1
+            config_stats['total_seconds'] += result['fit_seconds']
+    
+    def get_deadline_stats(self) -> Dict:
+        """Return how many deadline-bound forecasts finished on the Prophet path or fell back"""
+        requests = self.deadline_stats['requests']
+        return {
+            'default_ms': FORECAST_DEADLINE_MS,
+            **self.deadline_stats,
+            'miss_rate': round(self.deadline_stats['missed'] / requests, 4) if requests else None
+        }
+    
+    def get_fit_stats(self) -> Dict:
+        """Return fit counts, average fit time for warm and cold fits, and horizon reuse"""
+        summary = {'warm_start_fallbacks': self.fit_stats['warm_start_fallbacks']}
+        for mode in ('warm', 'cold'):
+            stats = self.fit_stats[mode]
+            summary[mode] = {
+                'fits': stats['fits'],
+                'total_seconds': round(stats['total_seconds'], 3),
+                'avg_seconds': round(stats['total_seconds'] / stats['fits'], 3) if stats['fits'] else None
+            }
+        
+        warm_avg, cold_avg = summary['warm']['avg_seconds'], summary['cold']['avg_seconds']
+        summary['warm_speedup'] = round(cold_avg / warm_avg, 2) if warm_avg and cold_avg else None
+        summary['cold_avg_seconds_by_config'] = {
+            config_name: round(seconds, 3) for config_name, seconds in self._observed_fit_costs().items()
+        }
+        summary['horizon'] = {'days': FORECAST_HORIZON_DAYS, **self.horizon_stats}
+        summary['prediction'] = {
+            'interval_mode': FORECAST_INTERVAL_MODE,
+            'uncertainty_samples': FORECAST_UNCERTAINTY_SAMPLES
+        }
+        return summary
+    
+    async def generate_statistical_forecasts(self,
+                                             sales_by_product: Dict[int, List[Dict]],
+                                             days_ahead: int = 7) -> List[Dict]:
+        """
+        Forecast many products at once with the vectorized statistical engine
+        
+        Args:
+            sales_by_product: Historical sales data keyed by product ID
+            days_ahead: Number of days to forecast
             
-            # Create future dataframe
-            future = model.make_future_dataframe(periods=days_ahead)
-            
-            # Generate forecast
-            forecast = model.predict(future)
+        Returns:
+            List of forecast dictionaries in the same order as the input
+        """
+        results: Dict[int, Dict] = {}
+        frames = {}
+        
+        for product_id, sales_data in sales_by_product.items():
+            if not sales_data:
+                continue
+            try:
+                frames[product_id] = self._prepare_data(sales_data)
+            except Exception as e:
+                logger.error(f"Statistical forecast data preparation failed for product {product_id}: {e}")
+                results[product_id] = await self._simple_forecast(product_id, sales_data, days_ahead)
+        
+        frames = {product_id: df for product_id, df in frames.items() if len(df) > 0}
+        for product_id in sales_by_product:
+            if product_id not in frames and product_id not in results:
+                results[product_id] = await self._simple_forecast(product_id, sales_by_product[product_id], days_ahead)
+        
+        if frames:
+            values, last_dates, lengths = self._daily_matrix(list(frames.values()))
+            forecast = self.statistical.forecast(values, days_ahead)
+            confidence = confidence_from_mape(forecast['one_step_mape'], lengths, ONE_STEP_CONFIDENCE_INFLATION)
             
-            # Extract forecast points
-            forecast_points = []
-            for i in range(-days_ahead, 0):
-                point = {
-                    'date': forecast.iloc[i]['ds'],
-                    'predicted_demand': max(0, round(forecast.iloc[i]['yhat'], 2)),
-                    'confidence_interval_lower': max(0, round(forecast.iloc[i]['yhat_lower'], 2)),
-                    'confidence_interval_upper': max(0, round(forecast.iloc[i]['yhat_upper'], 2))
+            for row, product_id in enumerate(frames):
+                dates = pd.date_range(last_dates[row] + pd.Timedelta(days=1), periods=days_ahead, freq='D')
+                columns = {
+                    'date': dates.values,
+                    'predicted_demand': np.round(forecast['yhat'][row], 2),
+                    'confidence_interval_lower': np.round(forecast['yhat_lower'][row], 2),
+                    'confidence_interval_upper': np.round(forecast['yhat_upper'][row], 2)
                 }
-                forecast_points.append(point)
-            
-            # Calculate total predicted demand
-            total_demand = sum(point['predicted_demand'] for point in forecast_points)
-            
-            # Calculate confidence score based on model performance
-            confidence_score = await self._calculate_confidence(model, df)
-            
-            return {
-                'product_id': product_id,
-                'model_version': 'prophet_v1',
-                'forecast_points': forecast_points,
-                'total_predicted_demand': round(total_demand, 2),
-                'confidence_score': confidence_score,
-                'method': 'prophet',
-                'data_points_used': len(df)
-            }
-            
-        except Exception as e:
-            logger.error(f"Prophet forecasting failed for product {product_id}: {e}")
-            return await self._simple_forecast(product_id, sales_data, days_ahead)
+                
+                results[product_id] = {
+                    'product_id': product_id,
+                    'model_version': StatisticalForecaster.MODEL_VERSION,
+                    'columns': columns,
+                    'total_predicted_demand': round(float(columns['predicted_demand'].sum()), 2),
+                    'confidence_score': float(confidence[row]),
+                    'method': StatisticalForecaster.METHODS[forecast['method'][row]],
+                    'data_points_used': int(lengths[row])
+                }
+        
+        return [results[product_id] for product_id in sales_by_product]
+    
+    def _daily_matrix(self, frames: List[pd.DataFrame]) -> Tuple[np.ndarray, List[pd.Timestamp], np.ndarray]:
+        """
+        Stack prepared (ds, y) frames into one (series, days) matrix
+        
+        Missing days count as zero demand. Shorter series are right-aligned and
+        padded on the left by repeating their first season, which keeps the
+        weekly phase intact for the seasonal methods.
+        """
+        m = self.statistical.season_length
+        series = []
+        for df in frames:
+            index = pd.date_range(df['ds'].iloc[0], df['ds'].iloc[-1], freq='D')
+            series.append(df.set_index('ds')['y'].reindex(index, fill_value=0).to_numpy(dtype=float))
+        
+        lengths = np.array([len(y) for y in series])
+        width = int(lengths.max())
+        values = np.empty((len(series), width))
+        for row, y in enumerate(series):
+            pad = width - len(y)
+            if pad:
+                first_season = y[:m]
+                repeats = -(-pad // len(first_season)) + 1
+                values[row, :pad] = np.tile(first_season, repeats)[-pad:]
+            values[row, pad:] = y
+        
+        last_dates = [df['ds'].iloc[-1] for df in frames]
+        return values, last_dates, lengths
     
-    def _prepare_data(self, sales_data: List[Dict]) -> pd.DataFrame:
-        """Prepare sales data for Prophet model"""
+    def _prepare_data(self, sales_data: Union[List[Dict], DailySeries]) -> pd.DataFrame:
+        """
+        Prepare sales data for Prophet model
+
+        Returns one row per calendar day from the first to the last sale, with
+        zero for days without sales, whether the input is a DailySeries or a
+        list of records.
+        """
+        if isinstance(sales_data, DailySeries):
+            # Already one total per day: no record parsing or aggregation needed
+            return pd.DataFrame({'ds': sales_data.dates(), 'y': sales_data.quantity})
+        
         df = pd.DataFrame(sales_data)
+        if df.empty:
+            return pd.DataFrame({'ds': pd.to_datetime([]), 'y': np.zeros(0)})
         
-        # Convert to Prophet format (ds, y)
-        df['ds'] = pd.to_datetime(df['date'])
+        # Convert to Prophet format (ds, y) at daily granularity
+        df['ds'] = pd.to_datetime(df['date']).dt.normalize()
         df['y'] = df['quantity_sold']
         
-        # Aggregate by date if multiple entries per day
-        df = df.groupby('ds')['y'].sum().reset_index()
+        # Aggregate by date if multiple entries per day, zero-filling days without sales
+        daily = df.groupby('ds')['y'].sum().sort_index().asfreq('D', fill_value=0)
         
-        # Sort by date
-        df = df.sort_values('ds').reset_index(drop=True)
-        
-        return df[['ds', 'y']]
+        return daily.rename_axis('ds').reset_index()
+    
+    async def provisional_forecast(self,
+                                   product_id: int,
+                                   sales_data: Union[List[Dict], DailySeries],
+                                   days_ahead: int) -> Dict:
+        """Moving-average forecast to answer with while a model forecast is still running"""
+        return await self._simple_forecast(product_id, sales_data, days_ahead)
     
     async def _simple_forecast(self, 
                              product_id: int, 
-                             sales_data: List[Dict], 
+                             sales_data: Union[List[Dict], DailySeries], 
                              days_ahead: int) -> Dict:
         """Simple moving average forecast for limited data"""
         try:
-            df = pd.DataFrame(sales_data)
+            df = self._prepare_data(sales_data)
             
             if len(df) == 0:
                 # No data available
@@ -124,7 +1053,7 @@ class ForecastingService:
             else:
                 # Calculate moving average
                 recent_days = min(7, len(df))
-                avg_demand = df.tail(recent_days)['quantity_sold'].mean()
+                avg_demand = df.tail(recent_days)['y'].mean()
             
             # Generate simple forecast
             forecast_points = []
@@ -166,41 +1095,6 @@ class ForecastingService:
                 'confidence_score': 0
             }
     
-    async def _calculate_confidence(self, model: Prophet, df: pd.DataFrame) -> float:
-        """Calculate confidence score based on model performance"""
-        try:
-            if len(df) < 7:
-                return 0.6
-            
-            # Use last 20% of data for validation
-            train_size = int(len(df) * 0.8)
-            train_df = df.iloc[:train_size]
-            test_df = df.iloc[train_size:]
-            
-            # Train on subset
-            model_test = Prophet(daily_seasonality=True, weekly_seasonality=True)
-            model_test.fit(train_df)
-            
-            # Predict on test set
-            future_test = model_test.make_future_dataframe(periods=len(test_df))
-            forecast_test = model_test.predict(future_test)
-            
-            # Calculate error metrics
-            actual = test_df['y'].values
-            predicted = forecast_test.iloc[-len(test_df):]['yhat'].values
-            
-            mae = mean_absolute_error(actual, predicted)
-            mape = np.mean(np.abs((actual - predicted) / (actual + 1e-8))) * 100
-            
-            # Convert to confidence score (0-1)
-            confidence = max(0.3, min(0.95, 1 - (mape / 100)))
-            
-            return round(confidence, 2)
-            
-        except Exception as e:
-            logger.error(f"Confidence calculation failed: {e}")
-            return 0.7  # Default confidence
-    
     async def get_restock_recommendations(self, 
                                         current_stock: int, 
                                         forecast_data: Dict, 
@@ -209,31 +1103,15 @@ class ForecastingService:
         try:
             total_predicted_demand = forecast_data.get('total_predicted_demand', 0)
             
-            # Add safety stock
-            safety_stock = total_predicted_demand * (safety_stock_days / 7)
-            
-            # Calculate recommended order quantity
-            required_stock = total_predicted_demand + safety_stock
-            reorder_quantity = max(0, required_stock - current_stock)
-            
-            # Determine urgency
-            days_of_stock = current_stock / max(1, total_predicted_demand / 7)
-            
-            if days_of_stock < 2:
-                urgency = "critical"
-            elif days_of_stock < 5:
-                urgency = "high"
-            elif days_of_stock < 10:
-                urgency = "medium"
-            else:
-                urgency = "low"
+            # Same vectorized rules as the catalog-wide restock engine
+            result = compute_restock(current_stock, total_predicted_demand, 0, safety_stock_days)
             
             return {
-                'recommended_quantity': round(reorder_quantity),
-                'urgency': urgency,
-                'days_of_stock_remaining': round(days_of_stock, 1),
-                'safety_stock_recommendation': round(safety_stock),
-                'total_required': round(required_stock)
+                'recommended_quantity': int(result['recommended_quantity']),
+                'urgency': URGENCY_LEVELS[int(result['urgency'])],
+                'days_of_stock_remaining': float(result['days_of_stock_remaining']),
+                'safety_stock_recommendation': int(result['safety_stock_recommendation']),
+                'total_required': int(result['total_required'])
             }
             
         except Exception as e:
@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.catalog import generate_mock_sales_data
+from app.services.forecasting import ForecastingService, forecast_pool, resolve_engine
+from app.services.sales_store import sales_store
+from app.utils.columnar import FORECAST_COLUMNS, result_columns
+
+logger = logging.getLogger(__name__)
+
+# SKU shares within a store-category are taken from this much recent history
+# and recomputed at most once per TTL
+PROPORTION_WINDOW_DAYS = int(os.getenv("HIERARCHY_PROPORTION_WINDOW_DAYS", "28"))
+PROPORTION_TTL = float(os.getenv("HIERARCHY_PROPORTION_TTL_SECONDS", "3600"))
+UNCATEGORIZED = "Uncategorized"
+
+# Model store family of the category and store-category Prophet models
+NODE_MODEL_KIND = 'prophet_hierarchy'
+
+def category_node(category: str) -> str:
+    """Forecast key of a category-level series"""
+    return f"category:{category}"
+
+def store_category_node(category: str, store_id: str) -> str:
+    """Forecast key of a store-category series"""
+    return f"category:{category}/store:{store_id}"
+
+class HierarchicalForecaster:
+    """
+    Forecasts SKUs through the category > store-category > SKU hierarchy
+
+    Models are fitted only for category and store-category series, so the
+    number of expensive fits grows with categories and stores rather than
+    with SKUs. Forecasts are reconciled middle-out: store-category forecasts
+    are rescaled to sum to their category forecast, then split across SKUs
+    with cached historical proportions, so every level adds up exactly.
+
+    Node series are forecast by a forecasting service of their own, so node
+    keys never share the product model, confidence, warm-start or
+    single-flight caches, nor the products' model store family.
+
+    Interval bounds are reconciled the same way as the point forecast: each
+    bound is scaled by the ratio of the category bound to the sum of the
+    store-category bounds. The sum of 80% bounds is not the 80% bound of the
+    sum, so reconciled and SKU intervals are approximate; only the point
+    forecasts are coherent.
+    """
+
+    MODEL_VERSION = 'hierarchical_v1'
+
+    def __init__(self,
+                 proportion_window_days: int = PROPORTION_WINDOW_DAYS,
+                 proportion_ttl: float = PROPORTION_TTL):
+        self.proportion_window_days = proportion_window_days
+        self.proportion_ttl = proportion_ttl
+        self.proportions: Dict[str, Dict] = {}
+        self.forecasting = ForecastingService(model_kind=NODE_MODEL_KIND)
+        self.stats = {
+            'runs': 0,
+            'node_forecasts': 0,
+            'skus_forecast': 0,
+            'proportion_hits': 0,
+            'proportion_misses': 0
+        }
+
+    async def forecast(self,
+                       products: Iterable[Dict],
+                       days_ahead: int = 7,
+                       engine: Optional[str] = None,
+                       days_back: int = 30) -> Dict:
+        """
+        Forecast a set of products hierarchically
+
+        Args:
+            products: Iterable of ``{'id', 'category'}`` dicts
+            days_ahead: Number of days to forecast
+            engine: Engine for every node, or None for per-category defaults
+            days_back: Days of sales history to load per product
+
+        Returns:
+            Dictionary with reconciled per-category totals and per-SKU forecasts
+        """
+        started = time.perf_counter()
+        products = list(products)
+        history = await self._load_history(products, days_back)
+
+        categories = []
+        sku_forecasts = []
+        node_count = 0
+        for category, frame in history.groupby('category', sort=True):
+            nodes = self._node_series(category, frame)
+            node_results = await self._forecast_nodes(nodes, days_ahead, resolve_engine(engine, category))
+            node_count += len(node_results)
+
+            category_result, skus = self._reconcile(category, frame, node_results, days_ahead)
+            categories.append(category_result)
+            sku_forecasts.extend(skus)
+
+        self.stats['runs'] += 1
+        self.stats['node_forecasts'] += node_count
+        self.stats['skus_forecast'] += len(sku_forecasts)
+
+        return {
+            'model_version': self.MODEL_VERSION,
+            'days_ahead': days_ahead,
+            'products': len(sku_forecasts),
+            'node_forecasts': node_count,
+            'categories': categories,
+            'forecasts': sku_forecasts,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+
+    async def _load_history(self, products: List[Dict], days_back: int) -> pd.DataFrame:
+        """Load sales history into one long (product, category, store, day) frame"""
+        await sales_store.ensure_loaded([product['id'] for product in products])
+
+        frames = []
+        for product in products:
+            category = product.get('category') or UNCATEGORIZED
+            store_ids = sales_store.store_ids(product['id'])
+            for store_id in store_ids:
+                series = await sales_store.get_series(product['id'], days_back=days_back, store_id=store_id)
+                if series is not None:
+                    frames.append(pd.DataFrame({
+                        'product_id': product['id'],
+                        'category': category,
+                        'store_id': store_id,
+                        'ds': series.dates(),
+                        'y': series.quantity
+                    }))
+            if store_ids:
+                continue
+
+            # No recorded sales: use generated demo history
+            df = pd.DataFrame(generate_mock_sales_data(product['id'], days_back=days_back))
+            frames.append(pd.DataFrame({
+                'product_id': product['id'],
+                'category': category,
+                'store_id': df['store_id'].astype(str),
+                'ds': pd.to_datetime(df['date']).dt.normalize(),
+                'y': df['quantity_sold'].astype(float)
+            }))
+
+        if not frames:
+            return pd.DataFrame(columns=['product_id', 'category', 'store_id', 'ds', 'y'])
+
+        return pd.concat(frames, ignore_index=True)
+
+    def _node_series(self, category: str, frame: pd.DataFrame) -> Dict[str, List[Dict]]:
+        """
+        Aggregate a category's sales into category and store-category series
+
+        Every node covers the category's full date range; days a store sold
+        nothing count as zero demand so all nodes forecast the same dates.
+        """
+        index = pd.date_range(frame['ds'].min(), frame['ds'].max(), freq='D')
+        daily = frame.pivot_table(index='ds', columns='store_id', values='y', aggfunc='sum', fill_value=0)
+        daily = daily.reindex(index, fill_value=0)
+
+        def records(values: pd.Series) -> List[Dict]:
+            return [
+                {'date': day.isoformat(), 'quantity_sold': float(quantity)}
+                for day, quantity in values.items()
+            ]
+
+        nodes = {category_node(category): records(daily.sum(axis=1))}
+        for store_id in daily.columns:
+            nodes[store_category_node(category, store_id)] = records(daily[store_id])
+        return nodes
+
+    async def _forecast_nodes(self, nodes: Dict[str, List[Dict]], days_ahead: int, engine: str) -> Dict[str, Dict]:
+        """Forecast every node of one category with the regular forecasting service"""
+        if engine == 'statistical':
+            results = await self.forecasting.generate_statistical_forecasts(nodes, days_ahead)
+            return {result['product_id']: result for result in results}
+
+        # Keep the worker pool busy without overflowing its queue
+        window = asyncio.Semaphore(max(1, min(forecast_pool.max_queue, max(1, forecast_pool.size) * 2)))
+
+        async def forecast_node(node: str, sales_data: List[Dict]) -> Dict:
+            async with window:
+                return await self.forecasting.generate_forecast(
+                    product_id=node,
+                    sales_data=sales_data,
+                    days_ahead=days_ahead,
+                    engine=engine
+                )
+
+        results = await asyncio.gather(*(forecast_node(node, data) for node, data in nodes.items()))
+        return {node: result for node, result in zip(nodes, results)}
+
+    def _sku_shares(self, category: str, frame: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Historical share of each SKU within each store-category (rows sum to 1)
+
+        Cached per category until the TTL expires or the category's SKUs or
+        stores change. Stores with no recent sales fall back to the SKUs'
+        category-wide shares.
+
+        Returns:
+            ``(shares, store_weights)`` where ``shares`` is indexed by store
+            and has one column per SKU, and ``store_weights`` is each store's
+            share of recent category sales
+        """
+        product_ids = tuple(sorted(frame['product_id'].unique()))
+        store_ids = tuple(sorted(frame['store_id'].unique()))
+        cached = self.proportions.get(category)
+        if (cached is not None
+                and cached['product_ids'] == product_ids
+                and cached['store_ids'] == store_ids
+                and time.monotonic() - cached['computed_at'] < self.proportion_ttl):
+            self.stats['proportion_hits'] += 1
+            return cached['shares'], cached['store_weights']
+
+        self.stats['proportion_misses'] += 1
+        since = frame['ds'].max() - pd.Timedelta(days=self.proportion_window_days - 1)
+        recent = frame[frame['ds'] >= since]
+        sales = (
+            recent.pivot_table(index='store_id', columns='product_id', values='y', aggfunc='sum', fill_value=0)
+            .reindex(index=list(store_ids), columns=list(product_ids), fill_value=0)
+            .astype(float)
+        )
+
+        sku_totals = sales.sum(axis=0)
+        if sku_totals.sum() > 0:
+            category_shares = sku_totals / sku_totals.sum()
+        else:
+            category_shares = pd.Series(1.0 / len(product_ids), index=sales.columns)
+
+        store_totals = sales.sum(axis=1)
+        shares = sales.div(store_totals.where(store_totals > 0), axis=0)
+        shares = shares.apply(lambda row: category_shares if row.isna().all() else row, axis=1)
+
+        if store_totals.sum() > 0:
+            store_weights = store_totals / store_totals.sum()
+        else:
+            store_weights = pd.Series(1.0 / len(store_ids), index=sales.index)
+
+        self.proportions[category] = {
+            'product_ids': product_ids,
+            'store_ids': store_ids,
+            'shares': shares,
+            'store_weights': store_weights,
+            'computed_at': time.monotonic()
+        }
+        return shares, store_weights
+
+    def _reconcile(self,
+                   category: str,
+                   frame: pd.DataFrame,
+                   node_results: Dict[str, Dict],
+                   days_ahead: int) -> Tuple[Dict, List[Dict]]:
+        """Make store-category and SKU forecasts sum to the category forecast"""
+        shares, store_weights = self._sku_shares(category, frame)
+        store_ids = list(shares.index)
+        top = node_results[category_node(category)]
+
+        def arrays(result: Dict) -> np.ndarray:
+            columns = result_columns(result)
+            values = np.zeros((3, days_ahead))
+            for i, name in enumerate(FORECAST_COLUMNS[1:]):
+                column = np.nan_to_num(np.asarray(columns[name][:days_ahead], dtype=np.float64))
+                values[i, :len(column)] = column
+            return values
+
+        # (3, horizon) for the category, (stores, 3, horizon) for the stores
+        top_values = arrays(top)
+        store_values = np.stack([
+            arrays(node_results[store_category_node(category, store_id)]) for store_id in store_ids
+        ])
+
+        # Middle-out: scale stores to the category total, or split the
+        # category by historical store weights where the stores forecast zero.
+        # Lower and upper bounds are scaled bound by bound, which is only an
+        # approximation of the interval of the reconciled forecast
+        totals = store_values.sum(axis=0)
+        weights = store_weights.to_numpy()[:, None, None]
+        reconciled = np.where(
+            totals > 0,
+            store_values * np.divide(top_values, totals, out=np.zeros_like(top_values), where=totals > 0),
+            top_values * weights
+        )
+
+        # SKU = sum over stores of reconciled store forecast x SKU share
+        sku_values = np.einsum('sp,skh->pkh', shares.to_numpy(), reconciled)
+        dates = [pd.Timestamp(day) for day in result_columns(top)['date'][:days_ahead]]
+        data_points = frame.groupby('product_id')['ds'].nunique()
+
+        skus = []
+        for column, product_id in enumerate(shares.columns):
+            values = np.round(sku_values[column], 2)
+            skus.append({
+                'product_id': int(product_id),
+                'category': category,
+                'model_version': self.MODEL_VERSION,
+                'forecast_points': [
+                    {
+                        'date': dates[i],
+                        'predicted_demand': float(values[0, i]),
+                        'confidence_interval_lower': float(values[1, i]),
+                        'confidence_interval_upper': float(values[2, i])
+                    }
+                    for i in range(len(dates))
+                ],
+                'total_predicted_demand': round(float(values[0].sum()), 2),
+                'confidence_score': top.get('confidence_score'),
+                'method': f"hierarchical:{top.get('method')}",
+                'data_points_used': int(data_points.get(product_id, 0))
+            })
+
+        category_result = {
+            'category': category,
+            'method': top.get('method'),
+            'confidence_score': top.get('confidence_score'),
+            'total_predicted_demand': round(float(top_values[0].sum()), 2),
+            'stores': {
+                store_id: round(float(reconciled[row, 0].sum()), 2) for row, store_id in enumerate(store_ids)
+            },
+            'sku_count': len(skus)
+        }
+        return category_result, skus
+
+    def get_stats(self) -> Dict:
+        """Return run counters, the size of the proportion cache and the node model cache"""
+        return {
+            **self.stats,
+            'cached_categories': len(self.proportions),
+            'node_models': self.forecasting.models.get_stats()
+        }
+
+# Singleton instance
+hierarchical_forecaster = HierarchicalForecaster()
@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class ModelCache:
+    """
+    Bounded in-memory cache of fitted models
+
+    Entries are evicted least-recently-used first whenever the entry count or
+    the memory budget is exceeded, and are treated as missing once they are
+    older than the TTL.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        """
+        Args:
+            max_entries: Maximum number of cached models
+            max_bytes: Memory budget for all cached models
+            ttl_seconds: Age after which an entry is no longer served
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._is_expired(entry)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key`` and mark it recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if self._is_expired(entry):
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry['value']
+
+    def put(self, key: Hashable, value: Any, size_bytes: int) -> None:
+        """Insert or replace an entry, evicting older ones to stay within budget"""
+        if key in self._entries:
+            self._remove(key)
+
+        if size_bytes > self.max_bytes:
+            # A single model larger than the whole budget is never cached
+            return
+
+        self._entries[key] = {
+            'value': value,
+            'size_bytes': size_bytes,
+            'stored_at': time.monotonic()
+        }
+        self._bytes += size_bytes
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove an entry and return its value"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._remove(key)
+        return entry['value']
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        """Return cache occupancy and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+    def _is_expired(self, entry: Dict) -> bool:
+        return time.monotonic() - entry['stored_at'] > self.ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size_bytes']
@@ -0,0 +1,187 @@
+import logging
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# CPU time a single auto-selected forecast may spend on fitting, and the
+# Prophet fit cost assumed until real fits have been timed
+AUTO_CPU_BUDGET = float(os.getenv("FORECAST_AUTO_CPU_BUDGET_MS", "1000")) / 1000
+AUTO_PROPHET_COST = float(os.getenv("FORECAST_AUTO_PROPHET_COST_MS", "600")) / 1000
+
+# Profile thresholds
+MIN_PROPHET_LENGTH = 28  # Four weeks before changepoints are worth fitting
+MIN_YEARLY_LENGTH = 730  # Two years before yearly seasonality can be estimated
+SEASONAL_STRENGTH = 0.15  # Share of spectral power at the period to count as seasonal
+LEVEL_SHIFT = 1.0  # Change in mean between first and last quarter, in standard deviations
+
+# Prophet configurations the selector can choose, with fit cost relative to
+# a weekly-only fit (used to estimate configurations not yet timed); daily
+# seasonality is never used on daily-aggregated data
+PROPHET_CONFIGS = {
+    'prophet_trend': {'weekly_seasonality': False, 'yearly_seasonality': False},
+    'prophet_weekly': {'weekly_seasonality': True, 'yearly_seasonality': False},
+    'prophet_yearly': {'weekly_seasonality': False, 'yearly_seasonality': True},
+    'prophet_weekly_yearly': {'weekly_seasonality': True, 'yearly_seasonality': True}
+}
+PROPHET_RELATIVE_COST = {
+    'prophet_trend': 0.7, 'prophet_weekly': 1.0, 'prophet_yearly': 1.3, 'prophet_weekly_yearly': 1.6
+}
+
+# Cost of the non-Prophet candidates in seconds (vectorized NumPy, per series)
+CHEAP_COST = {'simple': 0.0005, 'statistical': 0.002}
+
+def _spectral_strength(power: np.ndarray, n: int, period: float, longest_period: Optional[float] = None) -> float:
+    """
+    Share of spectral power within one bin of the given period
+
+    Measured against all non-DC power, or only against periods up to
+    ``longest_period`` so slow cycles do not mask a short one.
+    """
+    first = 1 if longest_period is None else max(1, int(n / longest_period))
+    total = power[first:].sum()
+    if total <= 0 or period >= n:
+        return 0.0
+    k = n / period
+    bins = np.arange(max(1, int(np.floor(k)) - 1), min(len(power), int(np.ceil(k)) + 2))
+    return float(power[bins].sum() / total)
+
+def profile_series(values: np.ndarray, sparse_threshold: float = 0.5) -> Dict:
+    """
+    Cheap statistical profile of a daily demand series
+
+    One FFT plus a few reductions: length, share of zero days, coefficient
+    of variation, dominant period, weekly and yearly spectral strength and
+    the level shift between the first and last quarter of the history.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = float(values.mean()) if n else 0.0
+    std = float(values.std()) if n else 0.0
+
+    profile = {
+        'length': n,
+        'zero_fraction': round(float((values <= 0).mean()), 3) if n else 1.0,
+        'cv': round(std / mean, 3) if mean > 0 else None,
+        'dominant_period': None,
+        'weekly_strength': 0.0,
+        'yearly_strength': 0.0,
+        'level_shift': 0.0
+    }
+    profile['intermittent'] = profile['zero_fraction'] >= sparse_threshold
+    if n < 14 or std == 0:
+        return profile
+
+    # Remove the linear trend so it does not leak into the low frequencies
+    t = np.arange(n)
+    detrended = values - np.polyval(np.polyfit(t, values, 1), t)
+    power = np.abs(np.fft.rfft(detrended)) ** 2
+    if len(power) > 1 and power[1:].sum() > 0:
+        k = int(np.argmax(power[1:])) + 1
+        profile['dominant_period'] = round(n / k, 1)
+        profile['weekly_strength'] = round(_spectral_strength(power, n, 7, longest_period=60), 3)
+        if n >= MIN_YEARLY_LENGTH:
+            profile['yearly_strength'] = round(_spectral_strength(power, n, 365.25), 3)
+
+    quarter = max(1, n // 4)
+    profile['level_shift'] = round(float(abs(values[-quarter:].mean() - values[:quarter].mean())) / std, 3)
+    return profile
+
+class ModelSelector:
+    """
+    Picks the cheapest adequate model for a series within a CPU budget
+
+    Moving average for short histories, the vectorized statistical engine
+    (Croston / Holt-Winters) for intermittent, stable or purely weekly
+    series, and Prophet only when the profile shows what Prophet adds over
+    it: level shifts (changepoints) or yearly seasonality. The Prophet
+    configuration includes only the seasonalities found in the spectrum.
+    A Prophet candidate over budget falls back to the next cheaper one;
+    a model already fitted on the same data costs nothing. Each candidate
+    is costed from its own observed cold fits; configurations not fitted
+    yet are estimated from the others scaled by PROPHET_RELATIVE_COST.
+    """
+
+    def __init__(self, budget_seconds: float = AUTO_CPU_BUDGET, prophet_cost: float = AUTO_PROPHET_COST):
+        self.budget_seconds = budget_seconds
+        self.prophet_cost = prophet_cost
+        self.stats = {'selections': 0, 'over_budget': 0, 'by_model': {}}
+
+    def prophet_candidates(self, profile: Dict) -> list:
+        """Prophet configurations the profile calls for, most capable first"""
+        if profile['length'] < MIN_PROPHET_LENGTH or profile['intermittent']:
+            return []
+
+        weekly = profile['weekly_strength'] >= SEASONAL_STRENGTH
+        short_term = 'prophet_weekly' if weekly else 'prophet_trend'
+        if profile['yearly_strength'] >= SEASONAL_STRENGTH:
+            return ['prophet_weekly_yearly' if weekly else 'prophet_yearly', short_term]
+        if profile['level_shift'] >= LEVEL_SHIFT:
+            return [short_term]
+        return []
+
+    def select(self,
+               profile: Dict,
+               fit_costs: Optional[Dict[str, float]] = None,
+               is_cached=lambda model: False) -> Dict:
+        """
+        Choose a model for a profiled series
+
+        Args:
+            profile: Output of ``profile_series``
+            fit_costs: Observed seconds per cold fit of each Prophet configuration
+            is_cached: Returns True if a candidate is already fitted on this data
+
+        Returns:
+            Dict with ``model``, ``reason`` and ``estimated_seconds``
+        """
+        fit_costs = fit_costs or {}
+        # Weekly-fit equivalent of what has been observed, for configurations never timed
+        observed = [
+            seconds / PROPHET_RELATIVE_COST[name]
+            for name, seconds in fit_costs.items() if name in PROPHET_RELATIVE_COST
+        ]
+        base_cost = float(np.mean(observed)) if observed else self.prophet_cost
+        choice = None
+
+        if profile['length'] < 14:
+            choice = {'model': 'simple', 'reason': 'short_history'}
+        else:
+            for model in self.prophet_candidates(profile):
+                if is_cached(model):
+                    cost = 0.0
+                else:
+                    cost = fit_costs.get(model, base_cost * PROPHET_RELATIVE_COST[model])
+                if cost <= self.budget_seconds:
+                    reason = 'yearly_seasonality' if 'yearly' in model else 'level_shift'
+                    choice = {'model': model, 'reason': reason, 'estimated_seconds': round(cost, 3)}
+                    break
+                self.stats['over_budget'] += 1
+
+            if choice is None:
+                if profile['intermittent']:
+                    reason = 'intermittent'
+                elif self.prophet_candidates(profile):
+                    reason = 'over_budget'
+                else:
+                    reason = 'statistical_adequate'
+                choice = {'model': 'statistical', 'reason': reason}
+
+        choice.setdefault('estimated_seconds', CHEAP_COST.get(choice['model'], 0.0))
+        choice['budget_seconds'] = self.budget_seconds
+        self.stats['selections'] += 1
+        self.stats['by_model'][choice['model']] = self.stats['by_model'].get(choice['model'], 0) + 1
+        return choice
+
+    def get_stats(self) -> Dict:
+        """Return selection counts per model and budget settings"""
+        return {
+            **self.stats,
+            'budget_ms': round(self.budget_seconds * 1000),
+            'default_prophet_cost_ms': round(self.prophet_cost * 1000)
+        }
+
+# Singleton instance
+model_selector = ModelSelector()
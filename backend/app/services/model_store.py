@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", "model_store")
+MODEL_STORE_KEEP_VERSIONS = int(os.getenv("MODEL_STORE_KEEP_VERSIONS", "3"))
+
+FORMATS = {'json': '.json', 'joblib': '.joblib'}
+
+class ModelStore:
+    """
+    Versioned on-disk store for fitted models shared by all worker processes
+
+    Layout: ``<root>/<kind>/<key>/<version><ext>`` plus a ``latest.json``
+    pointer holding the newest version's metadata. Every file is written to
+    a temporary name and moved into place with ``os.replace``, so readers in
+    other processes only ever see complete files and need no locking.
+    """
+
+    def __init__(self, root: str = MODEL_STORE_DIR, keep_versions: int = MODEL_STORE_KEEP_VERSIONS):
+        self.root = Path(root)
+        self.keep_versions = max(1, keep_versions)
+        self.stats = {'saves': 0, 'loads': 0, 'load_misses': 0, 'errors': 0}
+
+    def save(self, kind: str, key: Any, model: Any, fmt: str, metadata: Optional[Dict] = None) -> str:
+        """
+        Persist a model as a new version and point ``latest`` at it
+
+        Args:
+            kind: Model family, e.g. "prophet" or "isolation_forest"
+            key: Model key within the family, e.g. a product ID
+            model: JSON string for fmt="json", any joblib-picklable object otherwise
+            fmt: "json" or "joblib"
+            metadata: JSON-serializable details stored alongside the model
+
+        Returns:
+            The new version identifier
+        """
+        directory = self._directory(kind, key)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        version = f"{time.time_ns()}-{os.getpid()}"
+        filename = version + FORMATS[fmt]
+
+        if fmt == 'json':
+            self._atomic_write(directory / filename, lambda f: f.write(model.encode('utf-8')))
+        else:
+            import joblib
+            self._atomic_write(directory / filename, lambda f: joblib.dump(model, f))
+
+        meta = {
+            **(metadata or {}),
+            'kind': kind,
+            'key': str(key),
+            'version': version,
+            'format': fmt,
+            'filename': filename,
+            'saved_at': datetime.now().isoformat()
+        }
+        self._atomic_write(directory / 'latest.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+        self.stats['saves'] += 1
+        self._prune(directory)
+        return version
+
+    def latest_metadata(self, kind: str, key: Any) -> Optional[Dict]:
+        """Return the newest version's metadata without loading the model"""
+        try:
+            with open(self._directory(kind, key) / 'latest.json', 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Unreadable model metadata for {kind}/{key}: {e}")
+            return None
+
+    def load(self, kind: str, key: Any) -> Optional[Tuple[Any, Dict]]:
+        """
+        Load the newest version of a model
+
+        Returns:
+            ``(model, metadata)`` or None if nothing usable is stored
+        """
+        # A concurrent save may prune the version we just read about; retry once
+        for _ in range(2):
+            metadata = self.latest_metadata(kind, key)
+            if metadata is None:
+                self.stats['load_misses'] += 1
+                return None
+
+            path = self._directory(kind, key) / metadata['filename']
+            try:
+                if metadata['format'] == 'json':
+                    model = path.read_text(encoding='utf-8')
+                else:
+                    import joblib
+                    model = joblib.load(path)
+                self.stats['loads'] += 1
+                return model, metadata
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"Failed to load model {kind}/{key}: {e}")
+                return None
+
+        self.stats['load_misses'] += 1
+        return None
+
+    def get_stats(self) -> Dict:
+        """Return store location and counters for this process"""
+        return {'root': str(self.root.resolve()), 'keep_versions': self.keep_versions, **self.stats}
+
+    def _directory(self, kind: str, key: Any) -> Path:
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))
+        return self.root / kind / safe_key
+
+    def _atomic_write(self, path: Path, write) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _prune(self, directory: Path) -> None:
+        """Delete all but the newest ``keep_versions`` model files"""
+        versions = sorted(
+            (p for p in directory.iterdir()
+             if p.suffix in FORMATS.values() and p.name != 'latest.json' and not p.name.startswith('.')),
+            key=lambda p: int(p.stem.split('-')[0])
+        )
+        for path in versions[:-self.keep_versions]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+# Singleton instance
+model_store = ModelStore()
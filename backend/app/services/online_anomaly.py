@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import math
+import os
+from collections import deque
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from app.services.sales_store import sales_store
+
+logger = logging.getLogger(__name__)
+
+# Baseline smoothing: the level adapts over ONLINE_ANOMALY_SPAN_DAYS, each
+# weekday's offset over ONLINE_ANOMALY_SEASONAL_SPAN_WEEKS of that weekday
+ONLINE_ANOMALY_SPAN_DAYS = int(os.getenv("ONLINE_ANOMALY_SPAN_DAYS", "28"))
+ONLINE_ANOMALY_SEASONAL_SPAN_WEEKS = int(os.getenv("ONLINE_ANOMALY_SEASONAL_SPAN_WEEKS", "8"))
+
+# Robust z-score beyond which a day is anomalous, days of history needed
+# before scoring, and the smallest deviation scale in units
+ONLINE_ANOMALY_THRESHOLD = float(os.getenv("ONLINE_ANOMALY_THRESHOLD", "3.5"))
+ONLINE_ANOMALY_WARMUP_DAYS = int(os.getenv("ONLINE_ANOMALY_WARMUP_DAYS", "14"))
+ONLINE_ANOMALY_MIN_SCALE = float(os.getenv("ONLINE_ANOMALY_MIN_SCALE", "1.0"))
+
+# History replayed when a product is first seen, how old a day may be and
+# still raise an event (older days only update the baseline), and how many
+# recent events are kept for SSE replay
+ONLINE_ANOMALY_SEED_DAYS = int(os.getenv("ONLINE_ANOMALY_SEED_DAYS", "56"))
+ONLINE_ANOMALY_EVENT_MAX_AGE_DAYS = int(os.getenv("ONLINE_ANOMALY_EVENT_MAX_AGE_DAYS", "2"))
+ONLINE_ANOMALY_MAX_EVENTS = int(os.getenv("ONLINE_ANOMALY_MAX_EVENTS", "1000"))
+ONLINE_ANOMALY_SUBSCRIBER_QUEUE = int(os.getenv("ONLINE_ANOMALY_SUBSCRIBER_QUEUE", "100"))
+
+# Residuals kept for the MAD estimate
+RESIDUAL_WINDOW = 28
+MAD_TO_STD = 1.4826
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+class _ProductBaseline:
+    """Fixed-size online state for one product's daily demand"""
+
+    __slots__ = (
+        'mean', 'variance', 'seasonal', 'residuals', 'scale', 'days',
+        'open_day', 'open_value', 'flagged_day'
+    )
+
+    def __init__(self):
+        self.mean = 0.0
+        self.variance = 0.0
+        self.seasonal = [0.0] * 7  # Offset from the level per weekday
+        self.residuals = deque(maxlen=RESIDUAL_WINDOW)
+        self.scale = ONLINE_ANOMALY_MIN_SCALE
+        self.days = 0  # Completed days folded into the baseline
+        self.open_day = None  # Ordinal of the day still receiving sales
+        self.open_value = 0.0
+        self.flagged_day = None  # Open day that already raised a spike event
+
+class OnlineAnomalyDetector:
+    """
+    Streaming anomaly detection on daily demand as sales are ingested
+
+    Registered as a sales store listener. Each product keeps an EWMA level
+    and variance, a day-of-week offset and a ring of recent residuals whose
+    MAD gives a robust deviation scale, all in fixed memory. The newest day
+    stays open while its running total grows: a total already far above
+    the expected value raises a ``demand_spike`` event right away, since
+    cumulative totals only increase. When sales arrive for a later day the
+    open day is closed, scored in both directions (a low total raises
+    ``sudden_drop``) and folded into the baseline in O(1), clipped to the
+    threshold so anomalies do not shift it. Days without sales in between
+    count as zero demand. A product seen for the first time is seeded from
+    its recent history in the sales store.
+    """
+
+    def __init__(self):
+        self.alpha = 2 / (ONLINE_ANOMALY_SPAN_DAYS + 1)
+        self.seasonal_alpha = 2 / (ONLINE_ANOMALY_SEASONAL_SPAN_WEEKS + 1)
+        self.threshold = ONLINE_ANOMALY_THRESHOLD
+        self._products: Dict[int, _ProductBaseline] = {}
+        self._events = deque(maxlen=ONLINE_ANOMALY_MAX_EVENTS)
+        self._next_event_id = 1
+        self._subscribers: List[asyncio.Queue] = []
+        self._lock = asyncio.Lock()
+        self.stats = {
+            'updates': 0, 'days_closed': 0, 'late_updates': 0, 'products_seeded': 0,
+            'events': 0, 'events_dropped': 0
+        }
+
+    async def observe(self, updates: List[Dict]) -> Dict:
+        """
+        Update baselines with new daily totals and emit anomaly events
+
+        Args:
+            updates: ``{'product_id', 'date', 'quantity_sold'}`` dicts with each day's current total
+
+        Returns:
+            Counts of updates applied and events emitted
+        """
+        emitted = 0
+        async with self._lock:
+            for update in updates:
+                day = update['date'].date() if isinstance(update['date'], datetime) else update['date']
+                ordinal = day.toordinal()
+                product_id = update['product_id']
+
+                state = self._products.get(product_id)
+                if state is None:
+                    state = await self._seed(product_id, ordinal)
+
+                emitted += self._apply(product_id, state, ordinal, float(update['quantity_sold']))
+
+        return {'updates': len(updates), 'events': emitted}
+
+    async def _seed(self, product_id: int, before_ordinal: int) -> _ProductBaseline:
+        """Create a product's state from its recent history before the given day"""
+        state = self._products[product_id] = _ProductBaseline()
+        try:
+            series = await sales_store.get_series(product_id, days_back=ONLINE_ANOMALY_SEED_DAYS)
+        except Exception as e:
+            logger.error(f"Online anomaly seeding failed for product {product_id}: {e}")
+            return state
+
+        if series is not None:
+            start = series.start.toordinal()
+            for offset, quantity in enumerate(series.quantity.tolist()):
+                if start + offset >= before_ordinal:
+                    break
+                self._fold(state, start + offset, quantity)
+            self.stats['products_seeded'] += 1
+        return state
+
+    def _apply(self, product_id: int, state: _ProductBaseline, ordinal: int, value: float) -> int:
+        """Apply one daily total in O(1) and return the number of events emitted"""
+        self.stats['updates'] += 1
+        if state.open_day is not None and ordinal < state.open_day:
+            # Closed days are already part of the baseline
+            self.stats['late_updates'] += 1
+            return 0
+
+        emitted = 0
+        if state.open_day is not None and ordinal > state.open_day:
+            closed_day = state.open_day
+            emitted += self._close_day(product_id, state)
+            # Days without any sales, up to one span, count as zero demand
+            for gap_day in range(max(closed_day + 1, ordinal - ONLINE_ANOMALY_SPAN_DAYS), ordinal):
+                self._fold(state, gap_day, 0.0)
+
+        if state.open_day != ordinal:
+            state.open_day, state.flagged_day = ordinal, None
+        state.open_value = value
+
+        # A running total can only grow, so a spike is certain before the day ends
+        score = self._score(state, ordinal, value)
+        if score is not None and score > self.threshold and state.flagged_day != ordinal:
+            state.flagged_day = ordinal
+            emitted += self._emit(product_id, state, ordinal, value, score, partial=True)
+        return emitted
+
+    def _close_day(self, product_id: int, state: _ProductBaseline) -> int:
+        """Score the open day's final total and fold it into the baseline"""
+        ordinal, value = state.open_day, state.open_value
+        emitted = 0
+        score = self._score(state, ordinal, value)
+        if score is not None and state.flagged_day != ordinal and abs(score) > self.threshold:
+            emitted = self._emit(product_id, state, ordinal, value, score, partial=False)
+
+        self._fold(state, ordinal, value)
+        state.open_day, state.flagged_day = None, None
+        self.stats['days_closed'] += 1
+        return emitted
+
+    def _expected(self, state: _ProductBaseline, ordinal: int) -> float:
+        # date.fromordinal(1) is a Monday, matching datetime.weekday()
+        return state.mean + state.seasonal[(ordinal - 1) % 7]
+
+    def _score(self, state: _ProductBaseline, ordinal: int, value: float) -> Optional[float]:
+        """Robust z-score of a daily total, or None during warm-up"""
+        if state.days < ONLINE_ANOMALY_WARMUP_DAYS:
+            return None
+        return (value - self._expected(state, ordinal)) / state.scale
+
+    def _fold(self, state: _ProductBaseline, ordinal: int, value: float) -> None:
+        """Add one completed day to the EWMA level, weekday offsets and residual ring"""
+        weekday = (ordinal - 1) % 7
+        if state.days == 0:
+            state.mean = value
+            state.days = 1
+            return
+
+        expected = self._expected(state, ordinal)
+        if state.days >= ONLINE_ANOMALY_WARMUP_DAYS:
+            # Clip anomalies so they do not drag the baseline after them
+            limit = self.threshold * state.scale
+            value = min(max(value, expected - limit), expected + limit)
+
+        state.residuals.append(value - expected)
+
+        deviation = value - state.seasonal[weekday] - state.mean
+        state.mean += self.alpha * deviation
+        state.variance = (1 - self.alpha) * (state.variance + self.alpha * deviation * deviation)
+        state.seasonal[weekday] += self.seasonal_alpha * (value - state.mean - state.seasonal[weekday])
+
+        if len(state.residuals) >= 7:
+            residuals = list(state.residuals)
+            center = _median(residuals)
+            spread = MAD_TO_STD * _median([abs(r - center) for r in residuals])
+        else:
+            spread = math.sqrt(state.variance)
+        state.scale = max(spread, ONLINE_ANOMALY_MIN_SCALE)
+        state.days += 1
+
+    def _emit(self, product_id: int, state: _ProductBaseline, ordinal: int,
+              value: float, score: float, partial: bool) -> int:
+        """Record an anomaly event and push it to subscribers"""
+        if date.today().toordinal() - ordinal > ONLINE_ANOMALY_EVENT_MAX_AGE_DAYS:
+            return 0  # Backfilled history only updates the baseline
+
+        event = {
+            'id': self._next_event_id,
+            'product_id': product_id,
+            'date': date.fromordinal(ordinal).isoformat(),
+            'type': 'demand_spike' if score > 0 else 'sudden_drop',
+            'severity': 'high' if abs(score) >= 2 * self.threshold else 'medium',
+            'value': value,
+            'expected': round(self._expected(state, ordinal), 2),
+            'z_score': round(score, 2),
+            'anomaly_score': round(min(1.0, abs(score) / (2 * self.threshold)), 3),
+            'partial_day': partial,
+            'detected_at': datetime.now().isoformat()
+        }
+        self._next_event_id += 1
+        self._events.append(event)
+        self.stats['events'] += 1
+
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.stats['events_dropped'] += 1
+        return 1
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue that receives every new event until ``unsubscribe``"""
+        queue = asyncio.Queue(maxsize=ONLINE_ANOMALY_SUBSCRIBER_QUEUE)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def recent_events(self, after_id: int = 0, product_id: Optional[int] = None) -> List[Dict]:
+        """Retained events newer than ``after_id``, optionally for one product"""
+        return [
+            event for event in self._events
+            if event['id'] > after_id and (product_id is None or event['product_id'] == product_id)
+        ]
+
+    def get_baseline(self, product_id: int) -> Optional[Dict]:
+        """Current baseline of a product, or None if it has not been seen"""
+        state = self._products.get(product_id)
+        if state is None:
+            return None
+        return {
+            'product_id': product_id,
+            'days_observed': state.days,
+            'warmed_up': state.days >= ONLINE_ANOMALY_WARMUP_DAYS,
+            'level': round(state.mean, 2),
+            'std': round(math.sqrt(state.variance), 2),
+            'robust_scale': round(state.scale, 2),
+            'weekday_offsets': [round(offset, 2) for offset in state.seasonal],
+            'open_day': date.fromordinal(state.open_day).isoformat() if state.open_day else None,
+            'open_day_total': state.open_value if state.open_day else None
+        }
+
+    def get_stats(self) -> Dict:
+        """Return update and event counters and the number of tracked products"""
+        return {
+            **self.stats,
+            'products_tracked': len(self._products),
+            'subscribers': len(self._subscribers),
+            'events_retained': len(self._events),
+            'threshold': self.threshold
+        }
+
+# Singleton instance
+online_anomaly_detector = OnlineAnomalyDetector()
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.services.catalog import load_inventory
+from app.services.forecast_store import load_latest_demand
+
+logger = logging.getLogger(__name__)
+
+# Demand planning window and defaults for products without their own settings
+RESTOCK_HORIZON_DAYS = 7
+RESTOCK_DEFAULT_LEAD_TIME_DAYS = float(os.getenv("RESTOCK_DEFAULT_LEAD_TIME_DAYS", "0"))
+RESTOCK_DEMAND_TTL = float(os.getenv("RESTOCK_DEMAND_TTL_SECONDS", "300"))
+
+# Urgency by days of stock left after the lead time: < 2 critical, < 5 high, < 10 medium
+URGENCY_LEVELS = ('critical', 'high', 'medium', 'low')
+URGENCY_THRESHOLDS = np.array([2.0, 5.0, 10.0])
+
+def compute_restock(current_stock,
+                    weekly_demand,
+                    lead_time_days=0,
+                    safety_stock_days=3) -> Dict[str, np.ndarray]:
+    """
+    Reorder quantity, urgency and days of stock for many products in one pass
+
+    All arguments broadcast against each other, so scalars can be mixed with
+    per-product arrays.
+
+    Args:
+        current_stock: Units on hand
+        weekly_demand: Predicted demand over the next 7 days
+        lead_time_days: Days until a new order arrives
+        safety_stock_days: Extra days of demand to keep as buffer
+
+    Returns:
+        Dict of arrays: recommended_quantity, urgency (index into
+        URGENCY_LEVELS), days_of_stock_remaining, safety_stock_recommendation
+        and total_required
+    """
+    stock = np.asarray(current_stock, dtype=np.float64)
+    demand = np.asarray(weekly_demand, dtype=np.float64)
+    lead_time = np.asarray(lead_time_days, dtype=np.float64)
+    daily_demand = demand / 7
+
+    safety_stock = demand * (np.asarray(safety_stock_days, dtype=np.float64) / 7)
+    required_stock = demand + safety_stock + daily_demand * lead_time
+    reorder_quantity = np.maximum(0, required_stock - stock)
+
+    days_of_stock = stock / np.maximum(1, daily_demand)
+    urgency = np.searchsorted(URGENCY_THRESHOLDS, days_of_stock - lead_time, side='right')
+
+    return {
+        'recommended_quantity': np.round(reorder_quantity),
+        'urgency': urgency,
+        'days_of_stock_remaining': np.round(days_of_stock, 1),
+        'safety_stock_recommendation': np.round(safety_stock),
+        'total_required': np.round(required_stock)
+    }
+
+class RestockEngine:
+    """
+    Catalog-wide restock recommendations from materialized forecasts
+
+    The 7-day demand of every product's latest materialized forecast is
+    loaded as one array and kept for ``demand_ttl`` seconds (the
+    materializer reloads it right after each run, so requests rarely pay
+    for the load); stock and lead times are read fresh per request.
+    Recommendations for the whole catalog are then one vectorized pass plus
+    a sort.
+    """
+
+    def __init__(self,
+                 demand_ttl: float = RESTOCK_DEMAND_TTL,
+                 default_lead_time_days: float = RESTOCK_DEFAULT_LEAD_TIME_DAYS):
+        self.demand_ttl = demand_ttl
+        self.default_lead_time_days = default_lead_time_days
+        self._demand: Optional[tuple] = None
+        self._demand_loaded_at = 0.0
+        self.stats = {'requests': 0, 'demand_loads': 0}
+
+    async def refresh(self) -> None:
+        """Reload the demand snapshot from the latest materialized forecasts"""
+        self._demand = await asyncio.to_thread(load_latest_demand, RESTOCK_HORIZON_DAYS)
+        self._demand_loaded_at = time.monotonic()
+        self.stats['demand_loads'] += 1
+
+    async def _weekly_demand(self) -> tuple:
+        if self._demand is None or time.monotonic() - self._demand_loaded_at > self.demand_ttl:
+            await self.refresh()
+        return self._demand
+
+    async def recommend(self,
+                        category: Optional[str] = None,
+                        safety_stock_days: int = 3,
+                        limit: Optional[int] = 100,
+                        min_urgency: str = 'low') -> Dict:
+        """
+        Ranked restock recommendations for the catalog (or one category)
+
+        Args:
+            category: Only consider products in this category
+            safety_stock_days: Extra days of demand to keep as buffer
+            limit: Maximum number of recommendations returned (None = all)
+            min_urgency: Drop products less urgent than this level
+
+        Returns:
+            Dictionary with the ranked recommendations and per-urgency counts
+        """
+        started = time.perf_counter()
+        self.stats['requests'] += 1
+
+        inventory = await asyncio.to_thread(load_inventory, category)
+        forecast_ids, forecast_demand = await self._weekly_demand()
+
+        # Align materialized demand to the catalog (both sorted by product ID)
+        product_ids = inventory['product_id']
+        position = np.minimum(np.searchsorted(forecast_ids, product_ids), max(0, len(forecast_ids) - 1))
+        has_forecast = (
+            forecast_ids[position] == product_ids if len(forecast_ids) else np.zeros(len(product_ids), dtype=bool)
+        )
+
+        product_ids = product_ids[has_forecast]
+        categories = inventory['category'][has_forecast]
+        stock = inventory['current_stock'][has_forecast]
+        demand = forecast_demand[position[has_forecast]]
+        lead_time = inventory['lead_time_days'][has_forecast]
+        lead_time = np.where(lead_time < 0, self.default_lead_time_days, lead_time)
+
+        result = compute_restock(stock, demand, lead_time, safety_stock_days)
+
+        # Most urgent first, then fewest days of stock left after the lead time
+        urgency = result['urgency']
+        cover = result['days_of_stock_remaining'] - lead_time
+        order = np.lexsort((cover, urgency))
+        order = order[urgency[order] <= URGENCY_LEVELS.index(min_urgency)]
+        counts = np.bincount(urgency, minlength=len(URGENCY_LEVELS))
+        if limit is not None:
+            order = order[:limit]
+
+        recommendations = [
+            {
+                'product_id': int(product_ids[i]),
+                'category': categories[i],
+                'current_stock': int(stock[i]),
+                'predicted_weekly_demand': round(float(demand[i]), 2),
+                'lead_time_days': float(lead_time[i]),
+                'recommended_quantity': int(result['recommended_quantity'][i]),
+                'urgency': URGENCY_LEVELS[urgency[i]],
+                'days_of_stock_remaining': float(result['days_of_stock_remaining'][i]),
+                'safety_stock_recommendation': int(result['safety_stock_recommendation'][i]),
+                'total_required': int(result['total_required'][i])
+            }
+            for i in order
+        ]
+
+        return {
+            'recommendations': recommendations,
+            'products_evaluated': int(len(product_ids)),
+            'missing_forecasts': int((~has_forecast).sum()),
+            'urgency_counts': {level: int(counts[i]) for i, level in enumerate(URGENCY_LEVELS)},
+            'total_recommended_quantity': int(result['recommended_quantity'].sum()),
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def get_stats(self) -> Dict:
+        """Return request counters and the age of the demand snapshot"""
+        return {
+            **self.stats,
+            'demand_products': 0 if self._demand is None else int(len(self._demand[0])),
+            'demand_age_seconds': None if self._demand is None else round(time.monotonic() - self._demand_loaded_at, 1)
+        }
+
+# Singleton instance
+restock_engine = RestockEngine()
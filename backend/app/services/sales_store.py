@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Days of history kept per series; older days are dropped when a series grows
+SALES_STORE_MAX_DAYS = int(os.getenv("SALES_STORE_MAX_DAYS", "400"))
+INITIAL_CAPACITY = 64
+# Seconds to wait before retrying products whose history load failed
+SALES_STORE_RETRY_SECONDS = float(os.getenv("SALES_STORE_RETRY_SECONDS", "30"))
+
+def _ordinal(value) -> int:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+class DailySeries:
+    """
+    Read-only daily view of one sales series
+
+    ``quantity`` and ``revenue`` are non-writable NumPy views into the
+    store's buffers (no copy); ``quantity[i]`` is the total for
+    ``start + i`` days, with zero for days without sales. The store copies
+    a buffer before writing to it once a view of it was handed out, so a
+    view never changes while it is being read.
+    """
+
+    __slots__ = ('product_id', 'store_id', 'start', 'quantity', 'revenue')
+
+    def __init__(self, product_id: int, store_id: Optional[str], start: date,
+                 quantity: np.ndarray, revenue: np.ndarray):
+        self.product_id = product_id
+        self.store_id = store_id
+        self.start = start
+        self.quantity = quantity
+        self.revenue = revenue
+
+    def __len__(self) -> int:
+        return len(self.quantity)
+
+    def dates(self) -> np.ndarray:
+        """Calendar day of every value as datetime64[ns]"""
+        return (np.datetime64(self.start, 'D') + np.arange(len(self.quantity))).astype('datetime64[ns]')
+
+    def to_frame(self) -> pd.DataFrame:
+        """Sales records as a (date, quantity_sold, revenue) frame"""
+        return pd.DataFrame({'date': self.dates(), 'quantity_sold': self.quantity, 'revenue': self.revenue})
+
+class _Series:
+    """Growable pair of contiguous day-indexed buffers, copied on write once shared"""
+
+    __slots__ = ('start', 'length', 'quantity', 'revenue', 'shared')
+
+    def __init__(self):
+        self.start = 0
+        self.length = 0
+        self.quantity = np.zeros(INITIAL_CAPACITY)
+        self.revenue = np.zeros(INITIAL_CAPACITY)
+        self.shared = False
+
+    def add(self, ordinal: int, quantity: float, revenue: float) -> None:
+        if self.length == 0:
+            self.start = ordinal
+        index = ordinal - self.start
+        if index < 0:
+            self._resize(len(self.quantity) - index, shift=-index)
+            index = 0
+        elif index >= len(self.quantity):
+            self._resize(max(2 * len(self.quantity), index + 1), shift=0)
+        elif self.shared:
+            self.quantity, self.revenue = self.quantity.copy(), self.revenue.copy()
+            self.shared = False
+
+        self.quantity[index] += quantity
+        self.revenue[index] += revenue
+        self.length = max(self.length, index + 1)
+
+        if self.length > 2 * SALES_STORE_MAX_DAYS:
+            self._resize(2 * SALES_STORE_MAX_DAYS, shift=SALES_STORE_MAX_DAYS - self.length)
+
+    def _resize(self, capacity: int, shift: int) -> None:
+        """
+        Move the data into new buffers
+
+        A positive ``shift`` prepends that many empty days; a negative one
+        drops that many of the oldest days. Views handed out earlier keep
+        pointing at the old buffers, so they stay valid.
+        """
+        drop = max(0, -shift)
+        shift = max(0, shift)
+        kept = self.length - drop
+        quantity = np.zeros(capacity)
+        revenue = np.zeros(capacity)
+        quantity[shift:shift + kept] = self.quantity[drop:self.length]
+        revenue[shift:shift + kept] = self.revenue[drop:self.length]
+        self.quantity, self.revenue = quantity, revenue
+        self.shared = False
+        self.start += drop - shift
+        self.length = kept + shift
+
+    def total(self, ordinal: int) -> float:
+        index = ordinal - self.start
+        return float(self.quantity[index]) if 0 <= index < self.length else 0.0
+
+    def view(self, since_ordinal: Optional[int]) -> Tuple[int, np.ndarray, np.ndarray]:
+        offset = 0 if since_ordinal is None else min(self.length, max(0, since_ordinal - self.start))
+        quantity = self.quantity[offset:self.length]
+        revenue = self.revenue[offset:self.length]
+        quantity.flags.writeable = False
+        revenue.flags.writeable = False
+        self.shared = True
+        return self.start + offset, quantity, revenue
+
+def _load_sales_rows(product_ids: List[int], since: datetime) -> List[Tuple]:
+    from app.database import SessionLocal
+    from app.models.database import SalesData
+
+    with SessionLocal() as session:
+        return [
+            tuple(row) for row in
+            session.query(
+                SalesData.product_id, SalesData.date, SalesData.quantity_sold,
+                SalesData.revenue, SalesData.store_id
+            )
+            .filter(SalesData.product_id.in_(product_ids), SalesData.date >= since)
+            .all()
+        ]
+
+def _insert_sales_rows(records: List[Dict]) -> None:
+    from app.database import SessionLocal
+    from app.models.database import SalesData
+
+    with SessionLocal() as session:
+        session.bulk_insert_mappings(SalesData, records)
+        session.commit()
+
+class SalesSeriesStore:
+    """
+    In-process daily sales series per product and per (product, store)
+
+    Each series is a pair of contiguous NumPy buffers (quantity, revenue)
+    indexed by day. A product is loaded from the sales_data table the first
+    time it is read; after that, ingested sales are added to the buffers
+    (copying a buffer first if a reader holds a view of it), so readers get
+    zero-copy slices instead of rebuilding and re-aggregating a DataFrame
+    per request. A failed load is not retried for SALES_STORE_RETRY_SECONDS.
+    """
+
+    def __init__(self):
+        self._products: Dict[int, _Series] = {}
+        self._stores: Dict[int, Dict[str, _Series]] = {}
+        self._loaded: Set[int] = set()
+        self._retry_after: Dict[int, float] = {}
+        self._listeners: List[Callable[[List[Dict]], Awaitable]] = []
+        self._ingest_lock = asyncio.Lock()
+        self.stats = {'reads': 0, 'empty_reads': 0, 'products_loaded': 0, 'load_failures': 0, 'records_ingested': 0}
+
+    def add_listener(self, listener: Callable[[List[Dict]], Awaitable]) -> None:
+        """
+        Call ``await listener(updates)`` after every ingest
+
+        ``updates`` holds one ``{'product_id', 'date', 'quantity_sold'}`` dict
+        per product and day touched, with the day's new total.
+        """
+        self._listeners.append(listener)
+
+    async def ensure_loaded(self, product_ids: List[int]) -> None:
+        """Load products not yet in memory from the sales_data table"""
+        now = time.monotonic()
+        missing = sorted({
+            product_id for product_id in product_ids
+            if product_id not in self._loaded and self._retry_after.get(product_id, 0.0) <= now
+        })
+        if not missing:
+            return
+
+        since = datetime.combine(date.today() - timedelta(days=SALES_STORE_MAX_DAYS), datetime.min.time())
+        try:
+            rows = await asyncio.to_thread(_load_sales_rows, missing, since)
+        except Exception as e:
+            logger.warning(
+                f"Sales history load failed for {len(missing)} products, "
+                f"retrying in {SALES_STORE_RETRY_SECONDS:.0f}s: {e}"
+            )
+            self.stats['load_failures'] += 1
+            retry_at = time.monotonic() + SALES_STORE_RETRY_SECONDS
+            self._retry_after.update((product_id, retry_at) for product_id in missing)
+            return
+
+        # Another caller may have loaded some of them while we were reading
+        loading = {product_id for product_id in missing if product_id not in self._loaded}
+        self._loaded.update(loading)
+        for product_id in loading:
+            self._retry_after.pop(product_id, None)
+        self.stats['products_loaded'] += len(loading)
+        for product_id, day, quantity, revenue, store_id in rows:
+            if product_id in loading:
+                self._add(product_id, _ordinal(day), quantity, revenue, store_id)
+
+    async def get_series(self,
+                         product_id: int,
+                         days_back: Optional[int] = 30,
+                         store_id: Optional[str] = None) -> Optional[DailySeries]:
+        """
+        Zero-copy daily series for a product (or one of its stores)
+
+        Args:
+            product_id: ID of the product
+            days_back: Only days on or after today minus ``days_back`` (None = all)
+            store_id: Return this store's series instead of the product total
+
+        Returns:
+            DailySeries, or None if the product has no sales in the window
+        """
+        await self.ensure_loaded([product_id])
+        self.stats['reads'] += 1
+
+        series = self._products.get(product_id) if store_id is None else self._stores.get(product_id, {}).get(store_id)
+        since = None if days_back is None else (date.today() - timedelta(days=days_back)).toordinal()
+        if series is None:
+            self.stats['empty_reads'] += 1
+            return None
+
+        start, quantity, revenue = series.view(since)
+        if len(quantity) == 0:
+            self.stats['empty_reads'] += 1
+            return None
+        return DailySeries(product_id, store_id, date.fromordinal(start), quantity, revenue)
+
+    def store_ids(self, product_id: int) -> List[str]:
+        """Stores with recorded sales for a loaded product"""
+        return sorted(self._stores.get(product_id, {}))
+
+    async def ingest(self, records: List[Dict], persist: bool = True) -> Dict:
+        """
+        Add sales records to the series and notify listeners
+
+        Args:
+            records: ``{'product_id', 'date', 'quantity_sold', 'revenue', 'store_id'}`` dicts
+            persist: Also write the records to the sales_data table
+
+        Returns:
+            Counts of ingested records and of product-days updated
+        """
+        async with self._ingest_lock:
+            # Load existing history first so persisted rows are not counted twice
+            product_ids = [record['product_id'] for record in records]
+            await self.ensure_loaded(product_ids)
+            if not self._loaded.issuperset(product_ids):
+                raise RuntimeError("Sales history could not be loaded, records were not ingested")
+            if persist:
+                await asyncio.to_thread(_insert_sales_rows, records)
+
+            touched = set()
+            for record in records:
+                ordinal = _ordinal(record['date'])
+                self._add(
+                    record['product_id'],
+                    ordinal,
+                    record['quantity_sold'],
+                    record.get('revenue', 0.0),
+                    record.get('store_id')
+                )
+                touched.add((record['product_id'], ordinal))
+
+        self.stats['records_ingested'] += len(records)
+        updates = [
+            {
+                'product_id': product_id,
+                'date': date.fromordinal(ordinal),
+                'quantity_sold': self._products[product_id].total(ordinal)
+            }
+            for product_id, ordinal in sorted(touched)
+        ]
+        for listener in self._listeners:
+            try:
+                await listener(updates)
+            except Exception as e:
+                logger.error(f"Sales listener {listener!r} failed: {e}")
+
+        return {'records_ingested': len(records), 'product_days_updated': len(updates)}
+
+    def _add(self, product_id: int, ordinal: int, quantity: float, revenue: float, store_id: Optional[str]) -> None:
+        product = self._products.get(product_id)
+        if product is None:
+            product = self._products[product_id] = _Series()
+        product.add(ordinal, quantity, revenue or 0.0)
+
+        if store_id is not None:
+            stores = self._stores.setdefault(product_id, {})
+            store = stores.get(store_id)
+            if store is None:
+                store = stores[store_id] = _Series()
+            store.add(ordinal, quantity, revenue or 0.0)
+
+    def get_stats(self) -> Dict:
+        """Return series counts, buffer memory and read/ingest counters"""
+        series = list(self._products.values()) + [
+            store for stores in self._stores.values() for store in stores.values()
+        ]
+        return {
+            'products': len(self._products),
+            'store_series': len(series) - len(self._products),
+            'buffer_bytes': sum(s.quantity.nbytes + s.revenue.nbytes for s in series),
+            **self.stats
+        }
+
+# Singleton instance
+sales_store = SalesSeriesStore()
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight computation
+
+    The first caller for a key starts the computation as its own task; callers
+    arriving while it runs await the same task and share its result (or its
+    exception). Cancelling one caller does not cancel the shared computation
+    for the others. Nothing is cached once the computation finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'failures': 0}
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn()`` unless a computation for ``key`` is already in flight
+
+        Args:
+            key: Identity of the computation, e.g. (product ID, data version)
+            fn: Zero-argument coroutine function doing the work
+
+        Returns:
+            The result of the shared computation
+        """
+        self.stats['calls'] += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats['executions'] += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.stats['coalesced'] += 1
+
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Retrieve the exception so it is not reported as unhandled when every caller went away
+        if not task.cancelled() and task.exception() is not None:
+            self.stats['failures'] += 1
+
+    def get_stats(self) -> Dict:
+        """Return call counters; ``coalesced`` is the number of computations saved"""
+        return {'name': self.name, 'in_flight': len(self._in_flight), **self.stats}
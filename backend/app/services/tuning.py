@@ -0,0 +1,433 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.bulk_forecasting import product_engine
+from app.services.catalog import FORECAST_HISTORY_DAYS, aiter_products, list_products, load_sales_series
+from app.services.forecasting import (
+    TUNED_PARAMS_KIND,
+    _new_prophet,
+    _warm_up_worker,
+    category_params_key,
+    forecasting_service,
+    prophet_params,
+    resolve_engine
+)
+from app.services.model_selection import model_selector, profile_series
+from app.services.model_store import model_store
+from app.services.worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Tuning runs in its own pool so a search over the catalog never queues
+# behind online forecasts; one process by default so it does not compete
+# with the forecasting and anomaly pools for cores
+TUNING_WORKERS = int(os.getenv("FORECAST_TUNING_WORKERS", "1"))
+TUNING_JOB_TIMEOUT = float(os.getenv("FORECAST_TUNING_JOB_TIMEOUT_SECONDS", "600"))
+
+# Rolling-origin cross-validation over the same FORECAST_HISTORY_DAYS window
+# online fits use: train on everything before a cutoff, score the next
+# CV_HORIZON_DAYS, move the cutoff CV_PERIOD_DAYS forward. Only the latest
+# CV_MAX_FOLDS cutoffs are used; the defaults give 4 folds on 30 days.
+CV_INITIAL_DAYS = int(os.getenv("FORECAST_TUNING_CV_INITIAL_DAYS", "14"))
+CV_PERIOD_DAYS = int(os.getenv("FORECAST_TUNING_CV_PERIOD_DAYS", "3"))
+CV_HORIZON_DAYS = int(os.getenv("FORECAST_TUNING_CV_HORIZON_DAYS", "7"))
+CV_MAX_FOLDS = int(os.getenv("FORECAST_TUNING_CV_MAX_FOLDS", "4"))
+
+# Searched by default; includes Prophet's own defaults (0.05, 10, additive)
+# so a tuned configuration never scores worse than the untuned one
+DEFAULT_GRID = {
+    'changepoint_prior_scale': [0.01, 0.05, 0.5],
+    'seasonality_prior_scale': [1.0, 10.0],
+    'seasonality_mode': ['additive', 'multiplicative']
+}
+
+# Hyperparameters that can be tuned without changing the model structure
+# (the number of changepoints must stay stable for warm starts)
+TUNABLE_PARAMS = {
+    'changepoint_prior_scale': float,
+    'seasonality_prior_scale': float,
+    'holidays_prior_scale': float,
+    'seasonality_mode': str
+}
+
+def expand_grid(grid: Optional[Dict[str, List]] = None) -> List[Dict]:
+    """
+    Every combination of a parameter grid, in a stable order
+
+    Raises:
+        ValueError: For parameters that cannot be tuned or empty value lists
+    """
+    grid = grid or DEFAULT_GRID
+    unknown = sorted(set(grid) - set(TUNABLE_PARAMS))
+    if unknown:
+        raise ValueError(f"Cannot tune {', '.join(unknown)}; tunable: {', '.join(TUNABLE_PARAMS)}")
+    if any(not values for values in grid.values()):
+        raise ValueError("Every grid parameter needs at least one value")
+
+    names = sorted(grid)
+    return [
+        {name: TUNABLE_PARAMS[name](value) for name, value in zip(names, values)}
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+def new_run_id() -> str:
+    """Sortable ID naming a tuning run and its checkpoint file"""
+    return f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+def _params_key(params: Dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+def _cross_validate_job(ds: np.ndarray,
+                        y: np.ndarray,
+                        params: Dict,
+                        initial: int,
+                        period: int,
+                        horizon: int,
+                        max_folds: int) -> Dict:
+    """
+    Rolling-origin cross-validation of one parameter set (runs inside a worker process)
+
+    Scores are pooled over all folds: MAPE with zero-demand days divided by
+    1 (as for the confidence score) and MAE.
+    """
+    started = time.perf_counter()
+    cutoffs = list(range(initial, len(y) - horizon + 1, period))[-max_folds:]
+    if not cutoffs:
+        raise ValueError(f"Need at least {initial + horizon} days of history, got {len(y)}")
+
+    actual, predicted = [], []
+    for cutoff in cutoffs:
+        model = _new_prophet(params)
+        model.fit(pd.DataFrame({'ds': ds[:cutoff], 'y': y[:cutoff]}))
+        window = pd.DataFrame({'ds': ds[cutoff:cutoff + horizon]})
+        predicted.append(model.predict(window)['yhat'].to_numpy())
+        actual.append(y[cutoff:cutoff + horizon])
+
+    actual = np.concatenate(actual)
+    errors = np.abs(actual - np.concatenate(predicted))
+    return {
+        'mape': round(float(np.mean(errors / np.maximum(np.abs(actual), 1.0)) * 100), 4),
+        'mae': round(float(errors.mean()), 4),
+        'folds': len(cutoffs),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+class ForecastTuner:
+    """
+    Offline Prophet hyperparameter search with rolling-origin cross-validation
+
+    Every parameter set of the grid is cross-validated for every target (a
+    product, or the summed demand of a category) across the tuning worker
+    pool. Each finished evaluation is appended to the run's checkpoint file
+    at once, so an interrupted run resumed with its ``run_id`` only does
+    the remaining work. The best parameters per target are saved in the
+    model store, where online Prophet fits look them up (product first,
+    then its category) without any search cost.
+    """
+
+    def __init__(self, workers: int = TUNING_WORKERS, checkpoint_dir: Optional[str] = None):
+        self.pool = WorkerPool(
+            'tuning',
+            size=workers,
+            max_queue=max(1, workers) * 4,
+            timeout=TUNING_JOB_TIMEOUT,
+            initializer=_warm_up_worker
+        )
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else model_store.root / 'tuning'
+        self._running = False
+        self.last_run: Optional[Dict] = None
+        self.stats = {'runs': 0, 'evaluations': 0, 'failed_evaluations': 0, 'winners_saved': 0}
+
+    def checkpoint_path(self, run_id: str) -> Path:
+        return self.checkpoint_dir / f"{run_id}.jsonl"
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self, **kwargs) -> Optional[asyncio.Task]:
+        """
+        Claim the tuner and run it in the background with ``run``'s arguments
+
+        The running flag is set before the task is scheduled, so two callers
+        can never both start a run.
+
+        Returns:
+            The run task, or None if a run is already in progress
+        """
+        if self._running:
+            return None
+        self._running = True
+        return asyncio.create_task(self._run(**kwargs))
+
+    async def run(self,
+                  product_ids: Optional[List[int]] = None,
+                  category: Optional[str] = None,
+                  scope: str = 'product',
+                  grid: Optional[Dict[str, List]] = None,
+                  run_id: Optional[str] = None) -> Dict:
+        """
+        Tune Prophet hyperparameters for products or categories
+
+        Args:
+            product_ids: Products to tune (scope "product"); None = the catalog or ``category``
+            category: Only this category (None = all categories)
+            scope: "product" tunes each product, "category" each category's summed demand
+            grid: Parameter grid (None = DEFAULT_GRID)
+            run_id: Resume this run from its checkpoint (its original targets and grid are used)
+
+        Returns:
+            Run summary
+        """
+        if self._running:
+            raise RuntimeError("A tuning run is already in progress")
+
+        self._running = True
+        return await self._run(product_ids, category, scope, grid, run_id)
+
+    async def _run(self,
+                   product_ids: Optional[List[int]] = None,
+                   category: Optional[str] = None,
+                   scope: str = 'product',
+                   grid: Optional[Dict[str, List]] = None,
+                   run_id: Optional[str] = None) -> Dict:
+        """Body of a tuning run; the caller has already set the running flag"""
+        started = time.perf_counter()
+        spec = {'product_ids': product_ids, 'category': category, 'scope': scope, 'grid': grid or DEFAULT_GRID}
+        run_id = run_id or new_run_id()
+        summary = {
+            'run_id': run_id,
+            'status': 'running',
+            'started_at': datetime.now().isoformat(),
+            'targets': 0, 'grid_size': 0,
+            'evaluated': 0, 'resumed': 0, 'failed': 0, 'skipped': 0, 'tuned': 0
+        }
+        self.last_run = summary
+        try:
+            path = self.checkpoint_path(run_id)
+            stored_spec, done, finished = await asyncio.to_thread(self._read_checkpoint, path)
+            if stored_spec is None:
+                await asyncio.to_thread(self._append, path, {'spec': spec})
+            else:
+                spec = stored_spec
+            candidates = expand_grid(spec['grid'])
+            targets = await self._targets(spec)
+            summary.update(scope=spec['scope'], targets=len(targets), grid_size=len(candidates))
+
+            # Enough targets in flight to keep every worker busy, without
+            # loading the whole catalog's history at once
+            in_flight = max(1, self.pool.size) * 2
+            slots = asyncio.Semaphore(in_flight)
+            window = max(2, -(-in_flight // len(candidates)) + 1)
+            pending = set()
+            try:
+                for target in targets:
+                    if len(pending) >= window:
+                        _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    pending.add(asyncio.create_task(
+                        self._tune_target(target, candidates, run_id, path, done, finished, slots, summary)
+                    ))
+                if pending:
+                    await asyncio.wait(pending)
+            finally:
+                for task in pending:
+                    task.cancel()
+
+            summary['status'] = 'completed'
+        except asyncio.CancelledError:
+            summary['status'] = 'cancelled'
+            raise
+        except Exception as e:
+            logger.error(f"Tuning run {run_id} failed: {e}")
+            summary.update(status='failed', error=str(e))
+        finally:
+            summary['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+            self.stats['runs'] += 1
+            self._running = False
+
+        return summary
+
+    async def _tune_target(self,
+                           target: Dict,
+                           candidates: List[Dict],
+                           run_id: str,
+                           path: Path,
+                           done: Dict[Tuple[str, str], Dict],
+                           finished: set,
+                           slots: asyncio.Semaphore,
+                           summary: Dict) -> None:
+        """Cross-validate every candidate for one target and save the winner"""
+        key = str(target['key'])
+        if key in finished:
+            summary['resumed'] += len(candidates)
+            summary['tuned'] += 1
+            return
+
+        try:
+            df = await self._load_target(target)
+        except Exception as e:
+            logger.error(f"Could not load history for tuning target {key}: {e}")
+            summary['skipped'] += 1
+            return
+        if len(df) < CV_INITIAL_DAYS + CV_HORIZON_DAYS:
+            summary['skipped'] += 1
+            return
+
+        ds = df['ds'].values
+        y = df['y'].values.astype(float)
+        config_name = await self._online_config(target, y)
+
+        async def evaluate(params: Dict) -> Optional[Dict]:
+            previous = done.get((key, _params_key(params)))
+            if previous is not None:
+                summary['resumed'] += 1
+                return previous
+
+            async with slots:
+                try:
+                    score = await self.pool.run(
+                        _cross_validate_job, ds, y, prophet_params(config_name, tuned=params),
+                        CV_INITIAL_DAYS, CV_PERIOD_DAYS, CV_HORIZON_DAYS, CV_MAX_FOLDS
+                    )
+                except Exception as e:
+                    logger.warning(f"Cross-validation of {params} for {key} failed: {e!r}")
+                    summary['failed'] += 1
+                    self.stats['failed_evaluations'] += 1
+                    return None
+
+            record = {'target': key, 'params': params, **score}
+            await asyncio.to_thread(self._append, path, record)
+            summary['evaluated'] += 1
+            self.stats['evaluations'] += 1
+            return record
+
+        scores = [record for record in await asyncio.gather(*(evaluate(p) for p in candidates)) if record]
+        if not scores:
+            return
+
+        best = min(scores, key=lambda record: (record['mape'], record['mae']))
+        metadata = {
+            'params': best['params'],
+            'mape': best['mape'],
+            'mae': best['mae'],
+            'folds': best['folds'],
+            'grid_size': len(candidates),
+            'config': config_name,
+            'data_points': len(df),
+            'run_id': run_id,
+            'tuned_at': datetime.now().isoformat()
+        }
+        await asyncio.to_thread(
+            model_store.save, TUNED_PARAMS_KIND, target['key'], json.dumps(best['params']), 'json', metadata
+        )
+        forecasting_service.tuned_params.clear()
+        self.stats['winners_saved'] += 1
+        summary['tuned'] += 1
+
+        # A target with failed evaluations is retried when the run is resumed
+        if len(scores) == len(candidates):
+            await asyncio.to_thread(self._append, path, {'target': key, 'winner': best['params']})
+
+    async def _online_config(self, target: Dict, y: np.ndarray) -> Optional[str]:
+        """
+        Prophet configuration the target's online fits start from
+
+        The auto engine fits the seasonality configuration the series
+        profile calls for; the prophet engine (and an auto series that would
+        not get Prophet) uses the defaults. Candidates are cross-validated on
+        the same base so the winner is tuned for the model it will be used in.
+        """
+        if 'product_id' in target:
+            engine = await product_engine(target['product_id'], None)
+        else:
+            engine = resolve_engine(category=target['category'])
+        if engine != 'auto':
+            return None
+
+        configs = model_selector.prophet_candidates(
+            profile_series(y, forecasting_service.statistical.sparse_threshold)
+        )
+        return configs[0] if configs else None
+
+    async def _targets(self, spec: Dict) -> List[Dict]:
+        """Products or categories a run covers"""
+        if spec['scope'] == 'category':
+            if spec['category']:
+                categories = [spec['category']]
+            else:
+                categories = sorted({product['category'] async for product in aiter_products()})
+            return [{'key': category_params_key(category), 'category': category} for category in categories]
+
+        product_ids = spec['product_ids'] or [product['id'] for product in await list_products(spec['category'])]
+        return [{'key': product_id, 'product_id': product_id} for product_id in product_ids]
+
+    async def _load_target(self, target: Dict) -> pd.DataFrame:
+        """Prepared (ds, y) history of a product, or the summed history of a category"""
+        if 'product_id' in target:
+            sales_data = await load_sales_series(target['product_id'], days_back=FORECAST_HISTORY_DAYS)
+            return forecasting_service._prepare_data(sales_data)
+
+        frames = []
+        async for product in aiter_products(target['category']):
+            sales_data = await load_sales_series(product['id'], days_back=FORECAST_HISTORY_DAYS)
+            frames.append(forecasting_service._prepare_data(sales_data))
+        if not frames:
+            return pd.DataFrame({'ds': [], 'y': []})
+        return pd.concat(frames).groupby('ds', as_index=False)['y'].sum()
+
+    def _read_checkpoint(self, path: Path) -> Tuple[Optional[Dict], Dict[Tuple[str, str], Dict], set]:
+        """Run spec, finished evaluations and finished targets recorded in a checkpoint"""
+        spec, done, finished = None, {}, set()
+        if not path.exists():
+            return spec, done, finished
+
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Line cut short by an interrupted write
+                if 'spec' in record:
+                    spec = record['spec']
+                elif 'winner' in record:
+                    finished.add(record['target'])
+                else:
+                    done[(record['target'], _params_key(record['params']))] = record
+        return spec, done, finished
+
+    def _append(self, path: Path, record: Dict) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+    def stop(self) -> None:
+        """Stop the tuning worker processes"""
+        self.pool.shutdown()
+
+    def get_stats(self) -> Dict:
+        """Return cross-validation settings, counters and the latest run summary"""
+        return {
+            'running': self._running,
+            'workers': self.pool.size,
+            'cross_validation': {
+                'initial_days': CV_INITIAL_DAYS,
+                'period_days': CV_PERIOD_DAYS,
+                'horizon_days': CV_HORIZON_DAYS,
+                'max_folds': CV_MAX_FOLDS
+            },
+            **self.stats,
+            'last_run': self.last_run
+        }
+
+# Singleton instance
+forecast_tuner = ForecastTuner()
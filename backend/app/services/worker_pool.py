@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when a worker pool already holds its maximum number of jobs"""
+
+
+def _noop() -> None:
+    """Placeholder job used to spin up worker processes ahead of real work"""
+    return None
+
+
+class WorkerPool:
+    """
+    Pool of long-lived worker processes for CPU-bound model work
+
+    Jobs are submitted from the event loop and awaited, so a multi-second
+    model fit never blocks other requests served by the same uvicorn worker.
+    Each process runs ``initializer`` once at start-up, which is where heavy
+    imports and warm-up fits belong.
+    """
+
+    def __init__(self,
+                 name: str,
+                 size: int,
+                 max_queue: int,
+                 timeout: Optional[float] = None,
+                 initializer: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            name: Name used in logs and stats
+            size: Number of worker processes (0 runs jobs in threads instead)
+            max_queue: Maximum number of running plus queued jobs; a job
+                holds its slot until it finishes, even after its caller timed out
+            timeout: Default per-job timeout in seconds
+            initializer: Callable run once in every worker process
+        """
+        self.name = name
+        self.size = max(0, size)
+        self.max_queue = max(1, max_queue)
+        self.timeout = timeout
+        self.initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._warm_up: list = []
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'busy_seconds': 0.0
+        }
+
+    def start(self, warm: bool = True) -> None:
+        """Create the worker processes, optionally spawning all of them up front"""
+        if self.size == 0 or self._executor is not None:
+            return
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=self.initializer
+        )
+
+        if warm:
+            # Submitting one job per worker forces every process to start and
+            # run the initializer now rather than on the first real request
+            self._warm_up = [self._executor.submit(_noop) for _ in range(self.size)]
+
+        logger.info(f"Worker pool '{self.name}' started with {self.size} processes")
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, cancelling jobs that have not started"""
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info(f"Worker pool '{self.name}' shut down")
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run ``fn(*args)`` in a worker process and await its result
+
+        Args:
+            fn: Module-level (picklable) function to execute
+            *args: Picklable positional arguments
+            timeout: Seconds to wait for the result, defaults to the pool timeout
+
+        Returns:
+            Whatever ``fn`` returns
+
+        Raises:
+            PoolSaturatedError: If the queue depth limit is reached
+            asyncio.TimeoutError: If the job does not finish in time
+        """
+        if self._pending >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise PoolSaturatedError(
+                f"Worker pool '{self.name}' is saturated ({self._pending} jobs pending)"
+            )
+
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+
+        self._pending += 1
+        self.stats['submitted'] += 1
+        started = time.perf_counter()
+        executor = None
+        job = None
+        try:
+            if self.size == 0:
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(max_workers=self.max_queue, thread_name_prefix=self.name)
+                job = self._threads.submit(fn, *args)
+            else:
+                if self._executor is None:
+                    self.start(warm=False)
+                executor = self._executor
+                job = executor.submit(fn, *args)
+
+            # The slot is held until the job itself finishes: a job that has
+            # already started keeps running in its worker after a timeout, so
+            # freeing the slot when the caller gives up would over-admit work
+            job.add_done_callback(lambda _: self._release(loop))
+
+            # Cancelling the wrapper on timeout also cancels the job if it
+            # is still queued; a job that already started runs to completion
+            # and its result is discarded
+            result = await asyncio.wait_for(asyncio.wrap_future(job), timeout)
+            self.stats['completed'] += 1
+            return result
+
+        except asyncio.TimeoutError:
+            self.stats['timed_out'] += 1
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer); replace the pool
+            self.stats['failed'] += 1
+            if executor is not None and self._executor is executor:
+                logger.error(f"Worker pool '{self.name}' broke, restarting it")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        finally:
+            if job is None:
+                # Never submitted, so no callback will free the slot
+                self._pending -= 1
+            self.stats['busy_seconds'] += time.perf_counter() - started
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Free a job's slot once it has finished (called from the executor's thread)"""
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            # Event loop already closed: nobody is left to submit more work
+            self._decrement()
+
+    def _decrement(self) -> None:
+        self._pending -= 1
+
+    def is_warm(self) -> bool:
+        """True once every worker has run its initializer, or a job has completed"""
+        if self.size == 0 or self.stats['completed'] > 0:
+            return True
+        return bool(self._warm_up) and all(future.done() for future in self._warm_up)
+
+    def get_stats(self) -> Dict:
+        """Return pool configuration and job counters"""
+        return {
+            'name': self.name,
+            'size': self.size,
+            'max_queue': self.max_queue,
+            'timeout_seconds': self.timeout,
+            'pending': self._pending,
+            'running': self._executor is not None or self.size == 0,
+            'warm': self.is_warm(),
+            **{key: round(value, 3) if isinstance(value, float) else value
+               for key, value in self.stats.items()}
+        }
@@ -0,0 +1,111 @@
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import Response
+
+# Opt-in compact format: one array per field instead of one object per point
+COLUMNAR_MEDIA_TYPE = "application/vnd.walmartiq.columnar+json"
+FORECAST_COLUMNS = ('date', 'predicted_demand', 'confidence_interval_lower', 'confidence_interval_upper')
+ANOMALY_COLUMNS = ('date', 'value', 'is_anomaly', 'anomaly_score')
+
+def wants_columnar(format: Optional[str] = None, accept: Optional[str] = None) -> bool:
+    """True if the request asked for columns via ``format=columnar`` or the Accept header"""
+    if format:
+        return format == 'columnar'
+    return bool(accept) and COLUMNAR_MEDIA_TYPE in accept
+
+def _to_lists(columns: Dict[str, np.ndarray], names: tuple, limit: Optional[int]) -> Dict[str, list]:
+    """Convert NumPy columns to JSON-ready lists in one C-level pass per column"""
+    out = {}
+    for name in names:
+        values = np.asarray(columns[name])[:limit]
+        if np.issubdtype(values.dtype, np.datetime64):
+            out[name] = np.datetime_as_string(values, unit='s').tolist()
+        else:
+            out[name] = values.tolist()
+    return out
+
+def _from_points(points: list, names: tuple, limit: Optional[int]) -> Dict[str, list]:
+    """Columns for results that only carry per-point dicts (e.g. moving-average forecasts)"""
+    points = points[:limit]
+    out = {name: [point.get(name) for point in points] for name in names}
+    out['date'] = [pd.Timestamp(value).isoformat() for value in out['date']]
+    return out
+
+def result_columns(result: Dict) -> Dict[str, np.ndarray]:
+    """
+    NumPy date / demand / bound columns of a forecast result
+
+    Model and materialized results already carry them; only small
+    moving-average results are converted from their points.
+    """
+    columns = result.get('columns')
+    if columns is not None:
+        return columns
+
+    points = result.get('forecast_points', [])
+    return {
+        'date': np.array([pd.Timestamp(point['date']).to_datetime64() for point in points], dtype='datetime64[ns]'),
+        **{
+            name: np.array([point.get(name) or 0.0 for point in points], dtype=np.float64)
+            for name in FORECAST_COLUMNS[1:]
+        }
+    }
+
+def forecast_points(result: Dict, limit: Optional[int] = None) -> List[Dict]:
+    """Per-point dicts for the points response format, built from the columns only when asked for"""
+    if result.get('columns') is None:
+        return result.get('forecast_points', [])[:limit]
+
+    columns = result['columns']
+    return [
+        {
+            'date': pd.Timestamp(day),
+            'predicted_demand': demand,
+            'confidence_interval_lower': lower,
+            'confidence_interval_upper': upper
+        }
+        for day, demand, lower, upper in zip(
+            columns['date'][:limit],
+            np.asarray(columns['predicted_demand'][:limit]).tolist(),
+            np.asarray(columns['confidence_interval_lower'][:limit]).tolist(),
+            np.asarray(columns['confidence_interval_upper'][:limit]).tolist()
+        )
+    ]
+
+def forecast_columns(result: Dict, days_ahead: Optional[int] = None) -> Dict[str, list]:
+    """Parallel date / demand / bound arrays for a forecast result"""
+    columns = result.get('columns')
+    if columns is None:
+        return _from_points(result.get('forecast_points', []), FORECAST_COLUMNS, days_ahead)
+    return _to_lists(columns, FORECAST_COLUMNS, days_ahead)
+
+def anomaly_columns(result: Dict) -> Dict[str, list]:
+    """Parallel date / value / flag / score arrays for an anomaly detection result"""
+    columns = result.get('columns')
+    if columns is None:
+        return _from_points(result.get('anomaly_points', []), ANOMALY_COLUMNS, None)
+    return _to_lists(columns, ANOMALY_COLUMNS, None)
+
+def forecast_payload(result: Dict, columnar: bool) -> Dict:
+    """
+    JSON-ready copy of a forecast result in points or columnar form
+
+    The NumPy ``columns`` carried by service results never leave as-is:
+    they are sent as lists, or turned into ``forecast_points`` only here.
+    """
+    payload = {key: value for key, value in result.items() if key not in ('columns', 'forecast_points')}
+    if columnar:
+        payload['columns'] = forecast_columns(result)
+    else:
+        payload['forecast_points'] = forecast_points(result)
+    return payload
+
+def columnar_response(content: Dict) -> Response:
+    """Serialize a columnar payload without per-point response model validation"""
+    return Response(
+        content=json.dumps(content, separators=(',', ':'), default=str),
+        media_type=COLUMNAR_MEDIA_TYPE
+    )
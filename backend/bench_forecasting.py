@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Forecasting Performance Benchmark
+Drives the forecasting service with synthetic sales series and reports
+latency percentiles, parent and worker peak memory and throughput per core
+as JSON.
+
+Usage:
+    python bench_forecasting.py --skus 50 --days 90 --output bench_results.json
+    python bench_forecasting.py --compare bench_baseline.json --tolerance 0.2
+    python bench_forecasting.py --scenarios predict_scaling --history-lengths 90,365,730,1460
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Keep benchmark models out of the real model store and off the schedule
+os.environ.setdefault("MODEL_STORE_DIR", tempfile.mkdtemp(prefix="bench-model-store-"))
+os.environ.setdefault("FORECAST_MATERIALIZE_INTERVAL_SECONDS", "0")
+
+SCENARIOS = ('prophet_fit', 'prophet_predict', 'prophet_cached_read', 'statistical', 'statistical_batch', 'simple', 'restock', 'predict_scaling')
+
+# Prediction variants compared by predict_scaling: the old full-history
+# prediction with 1000 uncertainty samples, and the future-only fast path
+PREDICT_MODES = ('full_sampled', 'future_sampled', 'future_residual')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the demand forecasting service")
+    parser.add_argument("--skus", type=int, default=20, help="Number of synthetic products")
+    parser.add_argument("--days", type=int, default=90, help="Days of sales history per product")
+    parser.add_argument("--horizon", type=int, default=7, help="Days to forecast ahead")
+    parser.add_argument("--workers", type=int, default=None, help="Forecasting worker processes (default: FORECAST_POOL_SIZE)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic series")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown of p50 latency")
+    parser.add_argument("--history-lengths", default="90,365,730", help="History days per predict_scaling model")
+    parser.add_argument("--predict-repeats", type=int, default=5, help="Predictions timed per predict_scaling mode")
+    return parser.parse_args()
+
+def synthetic_series(skus: int, days: int, seed: int):
+    """Weekly-seasonal, trending demand with a share of intermittent products"""
+    from app.services.sales_store import DailySeries
+
+    rng = np.random.default_rng(seed)
+    start = date.today() - timedelta(days=days)
+    t = np.arange(days)
+    series = {}
+    for product_id in range(1, skus + 1):
+        base = rng.uniform(5, 50)
+        weekly = 1 + rng.uniform(0.1, 0.4) * np.sin(2 * np.pi * (t + product_id) / 7)
+        trend = 1 + rng.uniform(-0.2, 0.3) * t / days
+        quantity = rng.poisson(base * weekly * trend).astype(float)
+        if product_id % 5 == 0:
+            quantity *= rng.random(days) < 0.3  # Intermittent demand
+        series[product_id] = DailySeries(product_id, None, start, quantity, quantity * 9.99)
+    return series
+
+def predict_once(model, mode, horizon):
+    """One prediction of ``horizon`` days in a predict_scaling mode"""
+    from app.services.forecasting import _predict_arrays
+
+    if mode == 'full_sampled':
+        model.uncertainty_samples = 1000
+        return model.predict(model.make_future_dataframe(periods=horizon))
+    return _predict_arrays(model, horizon, interval_mode=mode.split('_')[1])
+
+async def predict_scaling(args, history_lengths):
+    """Predict latency per mode as the fitted history grows (in-process, one fit per length)"""
+    from app.services.forecasting import _new_prophet
+
+    results = {}
+    for days in history_lengths:
+        rng = np.random.default_rng(args.seed)
+        t = np.arange(days)
+        y = rng.poisson(20 * (1 + 0.3 * np.sin(2 * np.pi * t / 7)) * (1 + 0.2 * t / days)).astype(float)
+        model = _new_prophet()
+        model.fit(pd.DataFrame({'ds': pd.date_range(end=date.today(), periods=days, freq='D'), 'y': y}))
+
+        for mode in PREDICT_MODES:
+            async def call(mode=mode):
+                predict_once(model, mode, args.horizon)
+
+            name = f"predict_{mode}_{days}d"
+            results[name] = await measure(name, [call] * args.predict_repeats, 1)
+            results[name]['history_days'] = days
+    return results
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        'count': int(len(values)),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+        'mean_ms': round(float(values.mean()), 3)
+    }
+
+def _worker_pids():
+    """PIDs of this process's children (pool workers), empty where /proc is unavailable"""
+    pids = []
+    try:
+        for tid in os.listdir('/proc/self/task'):
+            with open(f'/proc/self/task/{tid}/children') as f:
+                pids.extend(int(pid) for pid in f.read().split())
+    except OSError:
+        return []
+    return pids
+
+def reset_worker_peaks():
+    """Reset each worker's peak RSS to its current RSS (Linux)"""
+    for pid in _worker_pids():
+        try:
+            with open(f'/proc/{pid}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+def worker_peak_rss_mb():
+    """Sum of the workers' peak RSS since the last reset, None if it cannot be read"""
+    total_kb = None
+    for pid in _worker_pids():
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total_kb = (total_kb or 0) + int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return None if total_kb is None else round(total_kb / 1024, 1)
+
+async def measure(name, calls, cores, concurrency=1):
+    """
+    Run coroutine factories and record per-call latency, wall time and peak memory
+
+    Fits and predictions run in spawned workers, so memory is reported
+    twice: Python allocations of this (parent) process from tracemalloc,
+    and worker peak RSS, sampled per worker process (VmHWM, reset at the
+    start of the scenario) and summed over the workers.
+    """
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    reset_worker_peaks()
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        **percentiles(latencies),
+        'wall_seconds': round(wall, 3),
+        'throughput_per_second': round(len(latencies) / wall, 2),
+        'throughput_per_core': round(len(latencies) / wall / max(1, cores), 2),
+        'cores': cores,
+        'parent_peak_memory_mb': round(peak / 1024 / 1024, 2),
+        'worker_peak_rss_mb': worker_peak_rss_mb()
+    }
+    workers = 'n/a' if result['worker_peak_rss_mb'] is None else f"{result['worker_peak_rss_mb']:.1f} MB"
+    print(f"  {name:<30} p50 {result['p50_ms']:>10.2f} ms   p99 {result['p99_ms']:>10.2f} ms   "
+          f"{result['throughput_per_second']:>10.1f}/s   parent {result['parent_peak_memory_mb']:.1f} MB   "
+          f"workers {workers}")
+    return result
+
+async def run(args):
+    from app.services.forecasting import _prophet_predict_job, forecasting_service, forecast_pool
+    from app.services.model_store import model_store
+    from app.services.restock import compute_restock
+
+    if args.workers is not None:
+        forecast_pool.size = args.workers
+    forecast_pool.start()
+    pool_cores = max(1, forecast_pool.size)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    series = synthetic_series(args.skus, args.days, args.seed)
+    concurrency = max(1, pool_cores * 2)
+    results = {}
+
+    print(f"Benchmarking {args.skus} SKUs x {args.days} days, horizon {args.horizon}, {pool_cores} worker(s)")
+    try:
+        if {'prophet_fit', 'prophet_predict', 'prophet_cached_read'} & set(scenarios):
+            # First pass fits every product and stores its model
+            results['prophet_fit'] = await measure('prophet_fit', [
+                lambda pid=pid: forecasting_service.generate_forecast(pid, series[pid], args.horizon, engine='prophet')
+                for pid in series
+            ], pool_cores, concurrency)
+            results['prophet_fit']['fit_stats'] = forecasting_service.get_fit_stats()
+
+            if 'prophet_predict' in scenarios:
+                # A real Prophet prediction from each stored model in a worker;
+                # the service would answer from its cached horizon instead
+                models = {pid: model_store.load('prophet', pid)[0] for pid in series}
+                results['prophet_predict'] = await measure('prophet_predict', [
+                    lambda pid=pid: forecast_pool.run(_prophet_predict_job, models[pid], args.horizon)
+                    for pid in series
+                ], pool_cores, concurrency)
+
+            if 'prophet_cached_read' in scenarios:
+                # Same data again: served by slicing each product's cached horizon
+                results['prophet_cached_read'] = await measure('prophet_cached_read', [
+                    lambda pid=pid: forecasting_service.generate_forecast(pid, series[pid], args.horizon, engine='prophet')
+                    for pid in series
+                ], pool_cores, concurrency)
+
+        if 'statistical' in scenarios:
+            results['statistical'] = await measure('statistical', [
+                lambda pid=pid: forecasting_service.generate_forecast(pid, series[pid], args.horizon, engine='statistical')
+                for pid in series
+            ], 1)
+
+        if 'statistical_batch' in scenarios:
+            batch = await measure('statistical_batch', [
+                lambda: forecasting_service.generate_statistical_forecasts(series, args.horizon)
+            ], 1)
+            batch['series_per_second'] = round(args.skus / max(batch['wall_seconds'], 1e-9), 1)
+            results['statistical_batch'] = batch
+
+        if 'simple' in scenarios:
+            results['simple'] = await measure('simple', [
+                lambda pid=pid: forecasting_service._simple_forecast(pid, series[pid], args.horizon)
+                for pid in series
+            ], 1)
+
+        if 'restock' in scenarios:
+            forecasts = {
+                pid: {'total_predicted_demand': float(series[pid].quantity[-7:].sum())} for pid in series
+            }
+            results['restock'] = await measure('restock', [
+                lambda pid=pid: forecasting_service.get_restock_recommendations(50, forecasts[pid], 3)
+                for pid in series
+            ], 1)
+
+            stock = np.full(args.skus, 50.0)
+            demand = np.array([forecasts[pid]['total_predicted_demand'] for pid in series])
+
+            async def vectorized():
+                compute_restock(stock, demand, 2, 3)
+
+            vector = await measure('restock_vector', [vectorized], 1)
+            vector['skus_per_second'] = round(args.skus / max(vector['wall_seconds'], 1e-9), 1)
+            results['restock_vectorized'] = vector
+
+        if 'predict_scaling' in scenarios:
+            lengths = [int(days) for days in args.history_lengths.split(",") if days.strip()]
+            results.update(await predict_scaling(args, lengths))
+    finally:
+        forecast_pool.shutdown()
+
+    return results
+
+def metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+
+    try:
+        import prophet
+        prophet_version = prophet.__version__
+    except Exception:
+        prophet_version = None
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'prophet': prophet_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'max_rss_mb': round(usage_self / 1024, 1),
+        'max_rss_workers_mb': round(usage_children / 1024, 1),
+        'args': vars(args)
+    }
+
+def compare(results, baseline_path, tolerance):
+    """Return scenarios whose p50 latency regressed beyond the tolerance"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get('p50_ms'):
+            continue
+        change = current['p50_ms'] / previous['p50_ms'] - 1
+        status = "REGRESSION" if change > tolerance else "ok"
+        print(f"  {name:<30} {previous['p50_ms']:>10.2f} -> {current['p50_ms']:>10.2f} ms  ({change:+.1%})  {status}")
+        if change > tolerance:
+            regressions.append({'scenario': name, 'baseline_p50_ms': previous['p50_ms'],
+                                'p50_ms': current['p50_ms'], 'change': round(change, 4)})
+    return regressions
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    results = asyncio.run(run(args))
+    report = {'meta': metadata(args), 'results': results}
+
+    exit_code = 0
+    if args.compare:
+        print(f"\nComparing p50 latency with {args.compare} (tolerance {args.tolerance:.0%})")
+        report['regressions'] = compare(results, args.compare, args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nResults written to {args.output}")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -70,6 +71,46 @@ except NameError:
     print("Database not available, running without database")
     pass
 
+# Forecasting worker pool, materialization schedule, background jobs and accuracy aggregates lifecycle
+if forecasting_available:
+    from app.services.accuracy import accuracy_tracker
+    from app.services.forecast_jobs import forecast_jobs
+    from app.services.forecasting import forecast_pool
+    from app.services.forecast_materializer import forecast_materializer
+    from app.services.tuning import forecast_tuner
+    from app.services.sales_store import sales_store
+
+    @app.on_event("startup")
+    async def start_forecast_pool():
+        forecast_pool.start()
+        forecast_materializer.start()
+        await asyncio.to_thread(accuracy_tracker.load)
+        accuracy_tracker.start()
+        sales_store.add_listener(accuracy_tracker.record_actuals)
+
+    @app.on_event("shutdown")
+    async def stop_forecast_pool():
+        await forecast_materializer.stop()
+        await forecast_jobs.stop()
+        forecast_pool.shutdown()
+        forecast_tuner.stop()
+        await accuracy_tracker.stop()
+
+# Anomaly detection worker pool lifecycle and online detection of ingested sales
+if anomaly_available:
+    from app.services.anomaly_detection import anomaly_pool
+    from app.services.online_anomaly import online_anomaly_detector
+    from app.services.sales_store import sales_store
+
+    @app.on_event("startup")
+    async def start_anomaly_pool():
+        anomaly_pool.start()
+        sales_store.add_listener(online_anomaly_detector.observe)
+
+    @app.on_event("shutdown")
+    async def stop_anomaly_pool():
+        anomaly_pool.shutdown()
+
 # Include routers
 app.include_router(computer_vision.router, prefix="/api/v1/vision", tags=["Computer Vision"])
 app.include_router(computer_vision.router, prefix="/api/computer-vision", tags=["Computer Vision Alt"])  # Alternative route
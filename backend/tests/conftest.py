@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Point the app at a throwaway database and model store before anything
+# under app/ is imported (both are read at import time)
+_scratch = Path(tempfile.mkdtemp(prefix="walmartiq-tests-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch / 'test.db'}")
+os.environ.setdefault("MODEL_STORE_DIR", str(_scratch / "model_store"))
+os.environ.setdefault("FORECAST_MATERIALIZE_INTERVAL_SECONDS", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def database():
+    """Create the tables in the scratch database"""
+    from app.database import Base, engine
+    import app.models.database  # noqa: F401  (registers the models)
+
+    Base.metadata.create_all(bind=engine)
+    return engine
@@ -0,0 +1,86 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services.accuracy import WINDOW_DAYS, AccuracyTracker
+from app.services.forecast_store import save_forecasts
+
+BASE_DAY = date(2026, 1, 1)
+
+
+def _materialize(product_id: int, created: date, days: list, predicted: float) -> None:
+    """Store one materialized run predicting ``predicted`` for every day"""
+    save_forecasts(
+        [{
+            'product_id': product_id,
+            'model_version': 'test',
+            'forecast_points': [
+                {
+                    'date': datetime.combine(day, datetime.min.time()),
+                    'predicted_demand': predicted,
+                    'confidence_interval_lower': predicted,
+                    'confidence_interval_upper': predicted
+                }
+                for day in days
+            ]
+        }],
+        datetime.combine(created, datetime.min.time())
+    )
+
+
+def _actual(product_id: int, day: date, quantity: float) -> dict:
+    return {'product_id': product_id, 'date': day, 'quantity_sold': quantity}
+
+
+@pytest.fixture
+def tracker(database):
+    return AccuracyTracker(save_interval_seconds=0)
+
+
+def test_resent_daily_total_replaces_the_earlier_actual(tracker):
+    day = BASE_DAY + timedelta(days=1)
+    _materialize(101, BASE_DAY, [day], predicted=10.0)
+
+    first = asyncio.run(tracker.record_actuals([_actual(101, day, 8.0)]))
+    asyncio.run(tracker.record_actuals([_actual(101, day, 12.0)]))
+
+    assert first['matched'] == 1
+    lifetime = tracker.get_metrics(101)['lifetime']
+    assert lifetime['observations'] == 1
+    assert lifetime['mean_absolute_error'] == 2.0
+    assert lifetime['bias'] == -2.0
+    assert lifetime['by_horizon']['1d']['observations'] == 1
+
+
+def test_day_evicted_from_the_ring_is_not_counted_twice(tracker):
+    old_day = BASE_DAY + timedelta(days=1)
+    new_day = old_day + timedelta(days=WINDOW_DAYS)  # Same ring slot
+    _materialize(102, BASE_DAY, [old_day], predicted=10.0)
+    _materialize(102, new_day - timedelta(days=1), [new_day], predicted=10.0)
+
+    asyncio.run(tracker.record_actuals([_actual(102, old_day, 5.0)]))
+    asyncio.run(tracker.record_actuals([_actual(102, new_day, 10.0)]))
+    late = asyncio.run(tracker.record_actuals([_actual(102, old_day, 7.0)]))
+
+    assert late['out_of_window'] == 1
+    metrics = tracker.get_metrics(102)
+    assert metrics['lifetime']['observations'] == 2
+    assert metrics['lifetime']['mean_absolute_error'] == 2.5
+    # The 30-day window only holds the newer day now
+    assert metrics['last_30_days']['observations'] == 1
+    assert metrics['last_30_days']['mean_absolute_error'] == 0.0
+
+
+def test_windows_end_at_the_latest_actual(tracker):
+    days = [BASE_DAY + timedelta(days=offset) for offset in (1, 12)]
+    _materialize(103, BASE_DAY, days, predicted=10.0)
+
+    asyncio.run(tracker.record_actuals([_actual(103, day, 6.0) for day in days]))
+
+    metrics = tracker.get_metrics(103)
+    assert metrics['as_of'] == days[-1]
+    assert metrics['last_7_days']['observations'] == 1
+    assert metrics['last_30_days']['observations'] == 2
+    assert metrics['last_30_days']['by_horizon']['1d']['observations'] == 1
+    assert metrics['last_30_days']['by_horizon']['8-30d']['observations'] == 1
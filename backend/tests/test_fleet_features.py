@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from app.services.anomaly_detection import anomaly_service
+from app.services.fleet_anomaly import engineer_feature_matrix
+
+START = date(2026, 3, 2)
+
+
+def _series(seed: int, days: int):
+    rng = np.random.default_rng(seed)
+    quantity = rng.integers(0, 40, size=days).astype(float)
+    revenue = quantity * rng.uniform(4, 6, size=days)
+    return quantity, revenue
+
+
+def _per_series_features(quantity: np.ndarray, revenue: np.ndarray, first_day: date) -> np.ndarray:
+    """Unnormalized features of one series from the per-product path"""
+    df = pd.DataFrame({
+        'date': pd.date_range(first_day, periods=len(quantity), freq='D'),
+        'quantity_sold': quantity,
+        'revenue': revenue
+    })
+    return anomaly_service._engineer_features(df).to_numpy()
+
+
+def _denormalize(features: np.ndarray, quantity: np.ndarray, revenue: np.ndarray) -> np.ndarray:
+    quantity_scale = max(quantity.mean(), 1.0)
+    revenue_scale = revenue.mean() if revenue.mean() > 0 else 1.0
+    price_scale = revenue.sum() / quantity.sum()
+    scales = np.array([
+        quantity_scale, revenue_scale, quantity_scale, quantity_scale, revenue_scale,
+        1.0, quantity_scale, quantity_scale, price_scale
+    ])
+    return features * scales
+
+
+def test_matrix_matches_per_series_features_for_one_series():
+    quantity, revenue = _series(seed=1, days=30)
+
+    features, index = engineer_feature_matrix(
+        quantity[None, :], revenue[None, :], np.ones((1, 30), dtype=bool), START.toordinal()
+    )
+
+    assert index[:, 1].tolist() == list(range(30))
+    np.testing.assert_allclose(
+        _denormalize(features, quantity, revenue),
+        _per_series_features(quantity, revenue, START),
+        rtol=1e-6,
+        atol=1e-6
+    )
+
+
+def test_series_starting_later_in_the_grid_matches_its_own_features():
+    long_quantity, long_revenue = _series(seed=2, days=30)
+    short_quantity, short_revenue = _series(seed=3, days=20)
+
+    quantity = np.zeros((2, 30))
+    revenue = np.zeros((2, 30))
+    valid = np.zeros((2, 30), dtype=bool)
+    quantity[0], revenue[0], valid[0] = long_quantity, long_revenue, True
+    quantity[1, 10:], revenue[1, 10:], valid[1, 10:] = short_quantity, short_revenue, True
+
+    features, index = engineer_feature_matrix(quantity, revenue, valid, START.toordinal())
+
+    rows = index[:, 0] == 1
+    assert index[rows, 1].tolist() == list(range(10, 30))
+    np.testing.assert_allclose(
+        _denormalize(features[rows], short_quantity, short_revenue),
+        _per_series_features(short_quantity, short_revenue, date.fromordinal(START.toordinal() + 10)),
+        rtol=1e-6,
+        atol=1e-6
+    )
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from app.services.forecast_materializer import ForecastMaterializer
+from app.services.forecast_store import load_latest_forecast, save_forecasts
+from app.services.forecasting import forecasting_service
+
+
+def _forecast(product_id: int, first_day: date, days: int, demand: float, **extra) -> dict:
+    return {
+        'product_id': product_id,
+        'model_version': 'statistical_v1',
+        'confidence_score': 0.8,
+        'forecast_points': [
+            {
+                'date': datetime.combine(first_day + timedelta(days=i), datetime.min.time()),
+                'predicted_demand': demand,
+                'confidence_interval_lower': demand - 1,
+                'confidence_interval_upper': demand + 1
+            }
+            for i in range(days)
+        ],
+        **extra
+    }
+
+
+@pytest.fixture
+def fit_result(monkeypatch):
+    """Make on-demand refits return whatever the test puts in ``fit_result['next']``"""
+    holder = {}
+
+    async def generate_forecast(product_id, sales_data, days_ahead=7, engine='prophet', deadline=None):
+        return holder['next'](product_id)
+
+    monkeypatch.setattr(forecasting_service, 'generate_forecast', generate_forecast)
+    return holder
+
+
+def test_fallback_refit_is_served_but_never_stored(database, fit_result):
+    materializer = ForecastMaterializer(interval_seconds=0)
+    tomorrow = date.today() + timedelta(days=1)
+
+    fit_result['next'] = lambda pid: _forecast(pid, tomorrow, 5, 3.0, method='moving_average', fallback='error')
+    served = asyncio.run(materializer.get_forecast(201, engine='statistical'))
+    assert served['fallback'] == 'error'
+    assert load_latest_forecast(201) is None
+
+    fit_result['next'] = lambda pid: _forecast(pid, tomorrow, 5, 7.0)
+    asyncio.run(materializer.get_forecast(201, engine='statistical'))
+    stored = load_latest_forecast(201)
+    assert list(stored['columns']['predicted_demand']) == [7.0] * 5
+
+    # A stale run is refit, but a fallback refit leaves it in place
+    materializer.staleness_seconds = 0
+    fit_result['next'] = lambda pid: _forecast(pid, tomorrow, 5, 3.0, method='moving_average', fallback='deadline')
+    assert asyncio.run(materializer.get_forecast(201, engine='statistical'))['fallback'] == 'deadline'
+    assert list(load_latest_forecast(201)['columns']['predicted_demand']) == [7.0] * 5
+
+
+def test_day_old_run_is_served_from_today(database, fit_result):
+    materializer = ForecastMaterializer(interval_seconds=0)
+    yesterday = date.today() - timedelta(days=1)
+    save_forecasts([_forecast(202, yesterday, 10, 4.0)], datetime.now() - timedelta(hours=20))
+    fit_result['next'] = lambda pid: pytest.fail("a fresh run that covers the request must not be refit")
+
+    served = asyncio.run(materializer.get_forecast(202, days_ahead=5))
+
+    assert pd.Timestamp(served['columns']['date'][0]) == pd.Timestamp(date.today())
+    assert len(served['columns']['date']) == 9
+    assert materializer.stats['stale_refits'] == 0
+
+
+def test_run_that_no_longer_covers_the_request_is_refit(database, fit_result):
+    materializer = ForecastMaterializer(interval_seconds=0)
+    yesterday = date.today() - timedelta(days=1)
+    save_forecasts([_forecast(203, yesterday, 3, 4.0)], datetime.now() - timedelta(hours=20))
+    fit_result['next'] = lambda pid: _forecast(pid, date.today(), 30, 5.0)
+
+    served = asyncio.run(materializer.get_forecast(203, days_ahead=5))
+
+    assert len(served['forecast_points']) == 30
+    assert materializer.stats['stale_refits'] == 1
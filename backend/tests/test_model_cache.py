@@ -0,0 +1,53 @@
+import time
+
+from app.services.model_cache import ModelCache
+
+
+def test_evicts_least_recently_used_beyond_max_entries():
+    cache = ModelCache(max_entries=2, max_bytes=1000, ttl_seconds=60)
+    cache.put("a", 1, size_bytes=10)
+    cache.put("b", 2, size_bytes=10)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+
+    cache.put("c", 3, size_bytes=10)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_stays_within_memory_budget():
+    cache = ModelCache(max_entries=10, max_bytes=100, ttl_seconds=60)
+    cache.put("a", 1, size_bytes=60)
+    cache.put("b", 2, size_bytes=60)
+
+    assert "a" not in cache
+    assert cache.get_stats()["bytes"] == 60
+
+    # A model larger than the whole budget is not cached at all
+    cache.put("huge", 3, size_bytes=101)
+    assert "huge" not in cache
+    assert cache.get("b") == 2
+
+
+def test_replacing_an_entry_updates_its_size():
+    cache = ModelCache(max_entries=10, max_bytes=100, ttl_seconds=60)
+    cache.put("a", 1, size_bytes=40)
+    cache.put("a", 2, size_bytes=30)
+
+    assert cache.get("a") == 2
+    assert cache.get_stats()["bytes"] == 30
+    assert cache.pop("a") == 2
+    assert cache.get_stats()["bytes"] == 0
+
+
+def test_expired_entries_are_misses():
+    cache = ModelCache(max_entries=10, max_bytes=100, ttl_seconds=0.01)
+    cache.put("a", 1, size_bytes=10)
+    time.sleep(0.05)
+
+    assert cache.get("a") is None
+    stats = cache.get_stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
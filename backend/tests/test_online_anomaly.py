@@ -0,0 +1,83 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from app.services.online_anomaly import OnlineAnomalyDetector
+
+
+def _history(product_id: int, first: date, last: date) -> list:
+    """Steady demand around 20 units a day"""
+    days = (last - first).days + 1
+    return [
+        {'product_id': product_id, 'date': first + timedelta(days=i), 'quantity_sold': 18 + 2 * (i % 3)}
+        for i in range(days)
+    ]
+
+
+def _update(product_id: int, day: date, quantity: float) -> dict:
+    return {'product_id': product_id, 'date': day, 'quantity_sold': quantity}
+
+
+@pytest.fixture
+def detector(database):
+    return OnlineAnomalyDetector()
+
+
+def test_spike_is_flagged_once_while_the_day_is_open(detector):
+    today = date.today()
+
+    async def scenario():
+        backfill = await detector.observe(_history(301, today - timedelta(days=40), today - timedelta(days=1)))
+        assert backfill['events'] == 0
+
+        assert (await detector.observe([_update(301, today, 15)]))['events'] == 0
+        assert (await detector.observe([_update(301, today, 200)]))['events'] == 1
+        assert (await detector.observe([_update(301, today, 250)]))['events'] == 0
+        # Closing the day does not report the same spike again
+        assert (await detector.observe([_update(301, today + timedelta(days=1), 20)]))['events'] == 0
+
+    asyncio.run(scenario())
+
+    events = detector.recent_events(product_id=301)
+    assert [(event['type'], event['partial_day'], event['date']) for event in events] == [
+        ('demand_spike', True, today.isoformat())
+    ]
+
+
+def test_low_total_is_flagged_when_the_day_closes(detector):
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+
+    async def scenario():
+        await detector.observe(_history(302, today - timedelta(days=40), today - timedelta(days=2)))
+        assert (await detector.observe([_update(302, yesterday, 0)]))['events'] == 0
+        assert (await detector.observe([_update(302, today, 20)]))['events'] == 1
+
+    asyncio.run(scenario())
+
+    event = detector.recent_events(product_id=302)[-1]
+    assert event['type'] == 'sudden_drop'
+    assert event['partial_day'] is False
+    assert event['date'] == yesterday.isoformat()
+
+
+def test_backfill_and_late_updates_only_touch_the_baseline(detector):
+    today = date.today()
+
+    async def scenario():
+        # Old history with a spike: folded into the baseline, no event
+        history = _history(303, today - timedelta(days=60), today - timedelta(days=20))
+        history[-5]['quantity_sold'] = 500
+        assert (await detector.observe(history))['events'] == 0
+
+        await detector.observe([_update(303, today, 20)])
+        late = await detector.observe([_update(303, today - timedelta(days=3), 900)])
+        assert late['events'] == 0
+
+    asyncio.run(scenario())
+
+    assert detector.get_stats()['late_updates'] == 1
+    baseline = detector.get_baseline(303)
+    assert baseline['warmed_up']
+    assert baseline['open_day'] == today.isoformat()
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import numpy as np
+
+from app.services import restock
+from app.services.restock import URGENCY_LEVELS, RestockEngine, compute_restock
+
+
+def _scalar_restock(current_stock: float, weekly_demand: float, safety_stock_days: int) -> dict:
+    """The per-product rules the vectorized version replaced"""
+    safety_stock = weekly_demand * (safety_stock_days / 7)
+    required_stock = weekly_demand + safety_stock
+    days_of_stock = current_stock / max(1, weekly_demand / 7)
+    if days_of_stock < 2:
+        urgency = 'critical'
+    elif days_of_stock < 5:
+        urgency = 'high'
+    elif days_of_stock < 10:
+        urgency = 'medium'
+    else:
+        urgency = 'low'
+    return {
+        'recommended_quantity': round(max(0, required_stock - current_stock)),
+        'urgency': urgency,
+        'days_of_stock_remaining': round(days_of_stock, 1),
+        'safety_stock_recommendation': round(safety_stock),
+        'total_required': round(required_stock)
+    }
+
+
+def test_vectorized_rules_match_the_per_product_rules():
+    rng = np.random.default_rng(7)
+    stock = rng.integers(0, 300, size=500).astype(float)
+    demand = rng.uniform(0, 200, size=500).round(2)
+    # Exact urgency boundaries: 2, 5 and 10 days of stock at 7 units a day
+    stock[:3], demand[:3] = [14, 35, 70], 49.0
+
+    result = compute_restock(stock, demand, 0, 3)
+
+    for i in range(len(stock)):
+        expected = _scalar_restock(stock[i], demand[i], 3)
+        assert result['recommended_quantity'][i] == expected['recommended_quantity']
+        assert URGENCY_LEVELS[result['urgency'][i]] == expected['urgency']
+        assert result['days_of_stock_remaining'][i] == expected['days_of_stock_remaining']
+        assert result['safety_stock_recommendation'][i] == expected['safety_stock_recommendation']
+        assert result['total_required'][i] == expected['total_required']
+
+
+def test_lead_time_raises_the_order_and_the_urgency():
+    without = compute_restock(70, 49, 0)
+    with_lead_time = compute_restock(70, 49, 9)
+
+    assert URGENCY_LEVELS[int(without['urgency'])] == 'low'
+    assert URGENCY_LEVELS[int(with_lead_time['urgency'])] == 'critical'
+    assert with_lead_time['recommended_quantity'] == without['recommended_quantity'] + 63
+
+
+def test_recommendations_are_ranked_and_skip_products_without_forecasts(monkeypatch):
+    inventory = {
+        'product_id': np.array([1, 2, 3, 4]),
+        'category': np.array(['A', 'A', 'B', 'B'], dtype=object),
+        'current_stock': np.array([100.0, 5.0, 20.0, 50.0]),
+        'lead_time_days': np.array([-1.0, 0.0, 1.0, 0.0])
+    }
+    monkeypatch.setattr(restock, 'load_inventory', lambda category=None: inventory)
+
+    engine = RestockEngine(demand_ttl=3600, default_lead_time_days=2)
+    engine._demand = (np.array([1, 2, 3]), np.array([14.0, 70.0, 70.0]))
+    engine._demand_loaded_at = time.monotonic()
+
+    result = asyncio.run(engine.recommend(limit=None))
+
+    assert result['missing_forecasts'] == 1
+    assert [r['product_id'] for r in result['recommendations']] == [2, 3, 1]
+    assert result['recommendations'][-1]['lead_time_days'] == 2.0
+    assert result['urgency_counts'] == {'critical': 2, 'high': 0, 'medium': 0, 'low': 1}
+
+    critical_only = asyncio.run(engine.recommend(limit=None, min_urgency='critical'))
+    assert [r['product_id'] for r in critical_only['recommendations']] == [2, 3]
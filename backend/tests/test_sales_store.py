@@ -0,0 +1,87 @@
+import asyncio
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.services import sales_store as sales_store_module
+from app.services.forecasting import forecasting_service
+from app.services.sales_store import SalesSeriesStore
+
+
+def _sale(product_id: int, day: date, quantity: float, store_id: str = None) -> dict:
+    return {'product_id': product_id, 'date': day, 'quantity_sold': quantity, 'revenue': quantity * 2, 'store_id': store_id}
+
+
+@pytest.fixture
+def store(database):
+    return SalesSeriesStore()
+
+
+def test_views_are_read_only_and_never_change_after_ingest(store):
+    today = date.today()
+
+    async def scenario():
+        await store.ingest([_sale(401, today - timedelta(days=2), 3)], persist=False)
+        view = await store.get_series(401, days_back=10)
+
+        await store.ingest(
+            [_sale(401, today - timedelta(days=2), 4), _sale(401, today, 1)], persist=False
+        )
+        return view, await store.get_series(401, days_back=10)
+
+    before, after = asyncio.run(scenario())
+
+    assert not before.quantity.flags.writeable
+    assert before.quantity.tolist() == [3.0]
+    assert after.quantity.tolist() == [7.0, 0.0, 1.0]
+    assert after.revenue.tolist() == [14.0, 0.0, 2.0]
+
+
+def test_failed_history_load_is_not_retried_until_the_backoff_expires(store, monkeypatch):
+    calls = []
+
+    def failing_load(product_ids, since):
+        calls.append(product_ids)
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(sales_store_module, '_load_sales_rows', failing_load)
+
+    async def scenario():
+        for _ in range(3):
+            assert await store.get_series(402) is None
+        with pytest.raises(RuntimeError):
+            await store.ingest([_sale(402, date.today(), 1)], persist=False)
+
+    asyncio.run(scenario())
+    assert calls == [[402]]
+    assert store.get_stats()['load_failures'] == 1
+
+    # Once the backoff has passed the load is attempted again
+    store._retry_after[402] = 0.0
+    monkeypatch.setattr(sales_store_module, '_load_sales_rows', lambda product_ids, since: [])
+    asyncio.run(store.ensure_loaded([402]))
+    assert 402 in store._loaded
+
+
+def test_records_and_daily_series_prepare_the_same_frame(store):
+    today = date.today()
+    sales = [
+        _sale(403, today - timedelta(days=6), 5, 'store_1'),
+        _sale(403, today - timedelta(days=6), 2, 'store_2'),
+        _sale(403, today - timedelta(days=3), 4, 'store_1'),
+        _sale(403, today, 1, 'store_2')
+    ]
+    records = [{**sale, 'date': sale['date'].isoformat()} for sale in sales]
+
+    async def scenario():
+        await store.ingest(sales, persist=False)
+        return await store.get_series(403, days_back=10)
+
+    series = asyncio.run(scenario())
+    from_records = forecasting_service._prepare_data(records)
+    from_series = forecasting_service._prepare_data(series)
+
+    assert from_records['y'].tolist() == [7.0, 0.0, 0.0, 4.0, 0.0, 0.0, 1.0]
+    np.testing.assert_array_equal(from_records['ds'].values, from_series['ds'].values)
+    np.testing.assert_array_equal(from_records['y'].values, from_series['y'].values)
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return calls
+
+        waiters = [asyncio.ensure_future(flight.run("key", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*waiters) == [1] * 5
+        assert calls == 1
+        stats = flight.get_stats()
+        assert stats["executions"] == 1
+        assert stats["coalesced"] == 4
+        assert stats["in_flight"] == 0
+
+        # Nothing is cached: the next call after completion runs again
+        assert await flight.run("key", compute) == 2
+
+    asyncio.run(scenario())
+
+
+def test_failure_is_shared_and_not_kept():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            flight.run("key", fail), flight.run("key", fail), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.get_stats()["executions"] == 1
+        assert flight.get_stats()["failures"] == 1
+        assert flight.get_stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "value"
+
+        first = asyncio.ensure_future(flight.run("key", compute))
+        second = asyncio.ensure_future(flight.run("key", compute))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        release.set()
+        assert await second == "value"
+
+    asyncio.run(scenario())
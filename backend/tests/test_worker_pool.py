@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.worker_pool import PoolSaturatedError, WorkerPool
+
+
+def _wait(event: threading.Event) -> str:
+    event.wait(5)
+    return "done"
+
+
+def _fail() -> None:
+    raise ValueError("boom")
+
+
+async def _settle(pool: WorkerPool) -> None:
+    """Give the done-callbacks scheduled on the loop a chance to run"""
+    for _ in range(50):
+        if pool._pending == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    async def scenario():
+        pool = WorkerPool("test", size=0, max_queue=1)
+        release = threading.Event()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(_wait, release, timeout=0.05)
+
+            # The job is still running in its thread, so the pool stays full
+            assert pool.get_stats()["pending"] == 1
+            with pytest.raises(PoolSaturatedError):
+                await pool.run(_wait, release, timeout=0.05)
+
+            release.set()
+            await _settle(pool)
+            assert pool.get_stats()["pending"] == 0
+            assert await pool.run(_wait, release, timeout=1) == "done"
+        finally:
+            release.set()
+            pool.shutdown()
+
+        stats = pool.get_stats()
+        assert stats["timed_out"] == 1
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_job_releases_its_slot():
+    async def scenario():
+        pool = WorkerPool("test", size=0, max_queue=1)
+        try:
+            with pytest.raises(ValueError):
+                await pool.run(_fail)
+            await _settle(pool)
+            assert pool.get_stats()["pending"] == 0
+            assert pool.get_stats()["failed"] == 1
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())